@@ -7,6 +7,8 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db.models import Count, Q
 from core.models import Plan, Service
 from core.serializers import PlanSerializer
+from vms.catalog import ensure_plan_templates
+from vms.tasks import build_vm_template_task
 
 def is_staff(user):
     return user.is_staff
@@ -30,6 +32,12 @@ def admin_plans_page(request):
     return render(request, 'dashboard/admin_plans.html', context)
 
 # Admin Plans API ViewSet
+def _build_plan_templates(plan):
+    """Queue builds of templates pre-sized for the plan's disk"""
+    for template in ensure_plan_templates(plan):
+        build_vm_template_task.delay(template.id)
+
+
 class AdminPlanViewSet(viewsets.ModelViewSet):
     """
     Admin API for managing plans
@@ -55,6 +63,7 @@ class AdminPlanViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             plan = serializer.save()
+            _build_plan_templates(plan)
             
             return Response({
                 'success': True,
@@ -90,6 +99,7 @@ class AdminPlanViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             updated_plan = serializer.save()
+            _build_plan_templates(updated_plan)
             
             return Response({
                 'success': True,
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from vms.benchmark import run_benchmark
+import json
+
+class Command(BaseCommand):
+    help = 'Measure provisioning throughput and latency against a simulated Proxmox (use a development database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vms', type=int, default=20, help='Services to provision')
+        parser.add_argument('--workers', type=int, default=8, help='Simulated Celery worker slots')
+        parser.add_argument('--nodes', default='pve1,pve2', help='Comma-separated simulated node names')
+        parser.add_argument('--arrival-interval', type=float, default=0.0,
+                            help='Seconds between payments (0 = all at once)')
+        parser.add_argument('--linked', action='store_true', help='Enable linked clones')
+        parser.add_argument('--timing', action='append', default=[], metavar='NAME=SECONDS',
+                            help='Override a simulator timing, e.g. full_clone=30')
+        parser.add_argument('--fail', action='append', default=[], metavar='OPERATION=RATE',
+                            help='Inject failures, e.g. start=0.05')
+        parser.add_argument('--seed', type=int, help='Seed for failure injection')
+        parser.add_argument('--timeout', type=int, default=1800, help='Give up after this many seconds')
+        parser.add_argument('--output', default='provisioning-benchmark.json', help='Where to write the JSON results')
+
+    def handle(self, *args, **options):
+        self.stdout.write("="*60)
+        self.stdout.write(self.style.SUCCESS('Provisioning benchmark'))
+        self.stdout.write("="*60)
+        self.stdout.write(f"{options['vms']} VMs, {options['workers']} workers, nodes {options['nodes']}\n")
+
+        results = run_benchmark(
+            vms=options['vms'],
+            workers=options['workers'],
+            nodes=options['nodes'].split(','),
+            timings=self._pairs(options['timing']),
+            failures=self._pairs(options['fail']),
+            seed=options['seed'],
+            arrival_interval=options['arrival_interval'],
+            linked=options['linked'],
+            timeout=options['timeout']
+        )
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+
+        latency = results['payment_to_active_seconds']
+        self.stdout.write(f"Completed:        {results['completed']} ({results['failed']} failed, {results['timed_out']} timed out)")
+        self.stdout.write(f"Throughput:       {results['vms_per_hour']} VMs/hour")
+        if results['completed']:
+            self.stdout.write(f"Payment→active:   p50 {latency['p50']:.1f}s  p95 {latency['p95']:.1f}s  p99 {latency['p99']:.1f}s")
+        self.stdout.write(f"Worker occupancy: {results['worker_occupancy']:.1%}")
+        self.stdout.write(f"API calls/VM:     {results['api_calls_per_vm']}")
+        self.stdout.write(f"Blocked in waits: {results['blocked_seconds']:.1f}s")
+
+        self.stdout.write("\n" + "="*60)
+        self.stdout.write(self.style.SUCCESS(f"✅ Results written to {options['output']}"))
+
+    def _pairs(self, values):
+        pairs = {}
+        for value in values:
+            name, _, number = value.partition('=')
+            try:
+                pairs[name] = float(number)
+            except ValueError:
+                raise CommandError(f"Expected NAME=NUMBER, got '{value}'")
+        return pairs
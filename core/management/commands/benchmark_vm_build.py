@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from vms.simulator import DEFAULT_TIMINGS, SimulatedCluster, SimulatedManager
+import statistics
+import time
+
+class Command(BaseCommand):
+    help = 'Compare VM build time with fixed sleeps vs lock/digest-driven waits against a simulated Proxmox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vms', type=int, default=5, help='VMs to build per mode')
+        parser.add_argument('--concurrency', type=int, default=5, help='Builds running at once')
+        parser.add_argument('--linked', action='store_true', help='Use linked clones')
+        parser.add_argument('--clone-time', type=float, default=DEFAULT_TIMINGS['full_clone'],
+                            help='Simulated full clone duration in seconds')
+
+    def handle(self, *args, **options):
+        timings = {'full_clone': options['clone_time']}
+
+        self.stdout.write("="*60)
+        self.stdout.write(self.style.SUCCESS('VM build benchmark (simulated Proxmox)'))
+        self.stdout.write("="*60)
+        self.stdout.write(f"{options['vms']} VMs per mode, {options['concurrency']} at a time, "
+                          f"{'linked' if options['linked'] else 'full'} clones\n")
+
+        results = {}
+        for mode, build in [('fixed sleeps', self._legacy_build), ('lock/digest', self._build)]:
+            cluster = SimulatedCluster(timings=timings)
+            durations = self._run(cluster, build, options)
+            results[mode] = durations
+            calls = sum(cluster.calls.values()) / options['vms']
+            self.stdout.write(
+                f"{mode:<14} mean {statistics.mean(durations):6.1f}s  "
+                f"p50 {statistics.median(durations):6.1f}s  "
+                f"max {max(durations):6.1f}s  "
+                f"{calls:5.0f} API calls/VM"
+            )
+
+        saved = statistics.mean(results['fixed sleeps']) - statistics.mean(results['lock/digest'])
+        self.stdout.write("\n" + "="*60)
+        self.stdout.write(self.style.SUCCESS(f"✅ {saved:.1f}s saved per VM on average"))
+
+    def _run(self, cluster, build, options):
+        def timed(vmid):
+            manager = SimulatedManager(cluster)
+            started = time.monotonic()
+            build(manager, cluster, vmid, options['linked'])
+            return time.monotonic() - started
+
+        vmids = range(100, 100 + options['vms'])
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            return list(executor.map(timed, vmids))
+
+    def _build(self, manager, cluster, vmid, linked):
+        result = manager.create_vm_from_template(
+            vmid, f'bench-{vmid}', 2, 2048, 20,
+            template_id=cluster.template_id,
+            password='benchmark',
+            linked=linked,
+            wait_ip=False
+        )
+        if result['status'] != 'success':
+            self.stderr.write(f"VM {vmid}: {result['message']}")
+
+    def _legacy_build(self, manager, cluster, vmid, linked):
+        """The build sequence as it was before: fixed sleeps and 2s lock polling"""
+        vm = manager.proxmox.nodes(manager.node).qemu(vmid)
+        manager.wait_for_task(manager.clone_template(cluster.template_id, vmid, f'bench-{vmid}', linked=linked))
+        self._legacy_lock_wait(vm)
+        time.sleep(5)
+        resize_upid = manager.resize_disk(vmid, 20)
+        if resize_upid:
+            manager.wait_for_task(resize_upid)
+        time.sleep(3)
+        self._legacy_lock_wait(vm)
+        manager.configure_vm(vmid, 2, 2048, 'benchmark')
+        time.sleep(3)
+        self._legacy_lock_wait(vm)
+        start_upid = manager.request_start(vmid)
+        if start_upid:
+            manager.wait_for_task(start_upid)
+        time.sleep(5)
+
+    def _legacy_lock_wait(self, vm, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if 'lock' not in vm.config.get():
+                return
+            time.sleep(2)
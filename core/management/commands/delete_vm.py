@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from core.models import Service
 from vms.proxmox import ProxmoxManager
 
 class Command(BaseCommand):
@@ -7,6 +8,7 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('vmid', type=int, help='VM ID to delete')
         parser.add_argument('--force', action='store_true', help='Skip confirmation')
+        parser.add_argument('--node', type=str, help='Node the VM runs on (defaults to the service record)')
 
     def handle(self, *args, **options):
         vmid = options['vmid']
@@ -18,7 +20,11 @@ class Command(BaseCommand):
                 return
         
         self.stdout.write(f"Deleting VM {vmid}...")
-        proxmox = ProxmoxManager()
+        node = options['node']
+        if not node:
+            service = Service.objects.filter(vm_id=vmid).exclude(node='').first()
+            node = service.node if service else None
+        proxmox = ProxmoxManager(node=node)
         
         if proxmox.delete_vm(vmid):
             self.stdout.write(self.style.SUCCESS(f"✅ VM {vmid} deleted successfully"))
@@ -16,13 +16,14 @@ class Command(BaseCommand):
             self.stdout.write("No managed VMs found")
             return
         
-        proxmox = ProxmoxManager()
-        
         self.stdout.write(f"\n{'VMID':<8} {'User':<15} {'Plan':<20} {'Status':<12} {'IP Address':<15}")
         self.stdout.write("-"*80)
         
+        # One cluster-wide snapshot instead of a status call per VM
+        statuses = ProxmoxManager().get_vm_statuses([service.vm_id for service in services])
+        
         for service in services:
-            status = proxmox.get_vm_status(service.vm_id) if service.vm_id else 'unknown'
+            status = statuses.get(service.vm_id, 'unknown')
             self.stdout.write(
                 f"{service.vm_id or 'N/A':<8} "
                 f"{service.user.username:<15} "
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from vms.reconcile import reconcile_fleet
+import json
+
+class Command(BaseCommand):
+    help = 'Compare services in the database with the VMs that exist in Proxmox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Apply the safe fixes (node drift, running suspended VMs, aged orphans)')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            report = reconcile_fleet(fix=options['fix'])
+        except RuntimeError as e:
+            self.stdout.write(self.style.ERROR(f"❌ {str(e)}"))
+            return
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write("="*60)
+        self.stdout.write(self.style.SUCCESS('Fleet Reconciliation'))
+        self.stdout.write("="*60)
+        self.stdout.write(f"  {report['cluster_vms']} VMs in Proxmox, {report['services']} active/suspended services ({report['seconds']}s)")
+
+        self.stdout.write(f"\n👻 Orphans: {len(report['orphans'])}")
+        for item in report['orphans']:
+            self.stdout.write(f"  • VM {item['vm_id']} ({item['name']}) on {item['node']}, {item['status']}")
+
+        self.stdout.write(f"\n🔒 Unmanaged VMs (reported only): {len(report['unmanaged'])}")
+        for item in report['unmanaged']:
+            self.stdout.write(f"  • VM {item['vm_id']} ({item['name']}) on {item['node']}, {item['status']}")
+
+        self.stdout.write(f"\n❓ Missing VMs: {len(report['missing'])}")
+        for item in report['missing']:
+            self.stdout.write(f"  • Service {item['service_id']}: VM {item['vm_id']} not found (recorded on {item['node']})")
+
+        self.stdout.write(f"\n⚡ Power mismatches: {len(report['power_mismatches'])}")
+        for item in report['power_mismatches']:
+            self.stdout.write(f"  • Service {item['service_id']} is {item['service_status']} but VM {item['vm_id']} is {item['vm_status']}")
+
+        self.stdout.write(f"\n📏 Resource drift: {len(report['resource_drift'])}")
+        for item in report['resource_drift']:
+            self.stdout.write(f"  • Service {item['service_id']} (VM {item['vm_id']}): {', '.join(item['drift'])}")
+
+        self.stdout.write(f"\n🖥️  Node drift: {len(report['node_drift'])}")
+        for item in report['node_drift']:
+            self.stdout.write(f"  • Service {item['service_id']} (VM {item['vm_id']}): recorded {item['recorded']}, actually on {item['actual']}")
+
+        if options['fix']:
+            fixed = report['remediated']
+            self.stdout.write(self.style.SUCCESS(
+                f"\n✅ Fixed {fixed['node_drift']} node record(s), stopped {fixed['stopped_suspended']} suspended VM(s), "
+                f"queued {fixed['orphans_queued']} orphan(s) for reclamation"
+            ))
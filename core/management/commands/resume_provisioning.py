@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from vms.models import ProvisioningJob
+from vms.pipeline import resume_job
+from vms.tasks import run_provisioning_step
+
+class Command(BaseCommand):
+    help = 'Resume failed VM provisioning jobs from the step they stopped at'
+
+    def add_arguments(self, parser):
+        parser.add_argument('service_ids', nargs='*', type=int, help='Service IDs (default: all failed jobs)')
+
+    def handle(self, *args, **options):
+        jobs = ProvisioningJob.objects.filter(status='failed')
+        if options['service_ids']:
+            jobs = jobs.filter(service_id__in=options['service_ids'])
+        
+        if not jobs:
+            self.stdout.write("No failed provisioning jobs found")
+            return
+        
+        for job in jobs:
+            self.stdout.write(f"Service {job.service_id}: resuming at '{job.step}' (last error: {job.last_error})")
+            resume_job(job)
+            run_provisioning_step.delay(job.id)
+        
+        self.stdout.write(self.style.SUCCESS(f"✅ Resumed {len(jobs)} job(s)"))
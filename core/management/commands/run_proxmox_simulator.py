@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from vms.simulator import SimulatedCluster, generate_self_signed_cert, serve
+import json
+import subprocess
+
+class Command(BaseCommand):
+    help = 'Serve a simulated Proxmox API over HTTPS for offline provisioning tests and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8006)
+        parser.add_argument('--nodes', default='pve', help='Comma-separated node names')
+        parser.add_argument('--config', help='JSON file with nodes, timings, capacity, failures and seed')
+        parser.add_argument('--timing', action='append', default=[], metavar='NAME=SECONDS',
+                            help='Override a timing, e.g. full_clone=30')
+        parser.add_argument('--fail', action='append', default=[], metavar='OPERATION=RATE',
+                            help='Failure rate for clone, resize, start, agent or request, e.g. start=0.05')
+        parser.add_argument('--seed', type=int, help='Seed for failure injection')
+        parser.add_argument('--cert', help='TLS certificate (a self-signed one is generated if omitted)')
+        parser.add_argument('--key', help='TLS private key')
+
+    def handle(self, *args, **options):
+        config = {'nodes': options['nodes'].split(',')}
+        if options['config']:
+            with open(options['config']) as f:
+                config.update(json.load(f))
+        config.setdefault('timings', {}).update(self._pairs(options['timing']))
+        config.setdefault('failures', {}).update(self._pairs(options['fail']))
+        if options['seed'] is not None:
+            config['seed'] = options['seed']
+
+        cluster = SimulatedCluster.from_config(config)
+        certfile, keyfile = options['cert'], options['key']
+        if not certfile:
+            certfile, keyfile = self._self_signed_cert()
+
+        server = serve(cluster, options['host'], options['port'], certfile, keyfile)
+
+        self.stdout.write("="*60)
+        self.stdout.write(self.style.SUCCESS('Proxmox simulator'))
+        self.stdout.write("="*60)
+        self.stdout.write(f"Listening on https://{options['host']}:{options['port']}/api2/json")
+        self.stdout.write(f"Nodes: {', '.join(cluster.nodes)}  Template: {cluster.template_id} on {cluster.template_node}")
+        self.stdout.write(f"Timings: {cluster.timings}")
+        self.stdout.write(f"Failures: {cluster.failures}")
+        self.stdout.write("\nPoint the app at it with:")
+        self.stdout.write(f"  PROXMOX_HOST={options['host']}:{options['port']}")
+        self.stdout.write("  PROXMOX_USER=root@pam PROXMOX_PASSWORD=any PROXMOX_VERIFY_SSL=False")
+        self.stdout.write(f"  PROXMOX_NODE={cluster.nodes[0]} PROXMOX_TEMPLATE_ID={cluster.template_id}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("\nStopped")
+        finally:
+            server.server_close()
+
+    def _pairs(self, values):
+        pairs = {}
+        for value in values:
+            name, _, number = value.partition('=')
+            try:
+                pairs[name] = float(number)
+            except ValueError:
+                raise CommandError(f"Expected NAME=NUMBER, got '{value}'")
+        return pairs
+
+    def _self_signed_cert(self):
+        try:
+            return generate_self_signed_cert()
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise CommandError(f"Could not generate a certificate, pass --cert and --key: {str(e)}")
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='node',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
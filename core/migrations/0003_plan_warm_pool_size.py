@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_service_node'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='warm_pool_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
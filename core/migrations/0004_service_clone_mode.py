@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_plan_warm_pool_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='clone_mode',
+            field=models.CharField(choices=[('full', 'Full Clone'), ('linked', 'Linked Clone')], default='full', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='promotion_status',
+            field=models.CharField(blank=True, choices=[('', 'Not Needed'), ('pending', 'Pending'), ('promoting', 'Promoting'), ('promoted', 'Promoted'), ('failed', 'Failed')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='promotion_task',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
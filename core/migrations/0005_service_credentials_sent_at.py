@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-17 07:26
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def mark_credentials_sent(apps, schema_editor):
+    # Services provisioned before this field existed already got their email
+    Service = apps.get_model('core', 'Service')
+    Service.objects.filter(status__in=['active', 'suspended']).update(
+        credentials_sent_at=Coalesce(models.F('activated_at'), models.Value(timezone.now()))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_service_clone_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='credentials_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_credentials_sent, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_service_credentials_sent_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='bandwidth_alert_level',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='bandwidth_cycle_start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='bandwidth_in_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='bandwidth_out_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='last_netin',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='last_netout',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
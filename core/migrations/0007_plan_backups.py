@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_service_bandwidth'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='backup_retention',
+            field=models.PositiveIntegerField(default=7),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='backup_schedule',
+            field=models.CharField(choices=[('none', 'No Backups'), ('daily', 'Daily'), ('weekly', 'Weekly')], default='none', max_length=20),
+        ),
+    ]
@@ -35,6 +35,12 @@ class Plan(models.Model):
         ('dedicated', 'Dedicated Server'),
     ]
     
+    BACKUP_SCHEDULES = [
+        ('none', 'No Backups'),
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+    ]
+    
     name = models.CharField(max_length=100)
     plan_type = models.CharField(max_length=20, choices=PLAN_TYPES)
     cpu_cores = models.IntegerField()
@@ -46,6 +52,11 @@ class Plan(models.Model):
     price_annually = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     description = models.TextField(blank=True)
+    # Pre-provisioned VMs kept ready on each node for instant activation
+    warm_pool_size = models.PositiveIntegerField(default=0)
+    # Automatic backups of each service's VM, and how many of them are kept
+    backup_schedule = models.CharField(max_length=20, choices=BACKUP_SCHEDULES, default='none')
+    backup_retention = models.PositiveIntegerField(default=7)
     created_at = models.DateTimeField(auto_now_add=True)
 
     @property
@@ -77,6 +88,26 @@ class Service(models.Model):
         ('annually', 'Annually'),
     ]
     
+    CLONE_MODES = [
+        ('full', 'Full Clone'),
+        ('linked', 'Linked Clone'),
+    ]
+    
+    # Days in each billing cycle
+    CYCLE_DAYS = {
+        'monthly': 30,
+        'quarterly': 90,
+        'annually': 365,
+    }
+    
+    PROMOTION_STATUSES = [
+        ('', 'Not Needed'),
+        ('pending', 'Pending'),
+        ('promoting', 'Promoting'),
+        ('promoted', 'Promoted'),
+        ('failed', 'Failed'),
+    ]
+    
     user = models.ForeignKey('core.User', on_delete=models.CASCADE, related_name='services')
     plan = models.ForeignKey(Plan, on_delete=models.PROTECT)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -85,13 +116,28 @@ class Service(models.Model):
     next_due_date = models.DateTimeField()
     domain = models.CharField(max_length=255, blank=True)
     vm_id = models.IntegerField(null=True, blank=True)
+    node = models.CharField(max_length=100, blank=True)
+    clone_mode = models.CharField(max_length=20, choices=CLONE_MODES, default='full')
+    # Linked clones are moved off the template's base disk in the background
+    promotion_status = models.CharField(max_length=20, choices=PROMOTION_STATUSES, blank=True)
+    promotion_task = models.CharField(max_length=255, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     username = models.CharField(max_length=100, blank=True)
     password = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     activated_at = models.DateTimeField(null=True, blank=True)
+    credentials_sent_at = models.DateTimeField(null=True, blank=True)
     suspended_at = models.DateTimeField(null=True, blank=True)
     terminated_at = models.DateTimeField(null=True, blank=True)
+    # Network transfer in the current billing cycle, accumulated from the VM's counters
+    bandwidth_cycle_start = models.DateTimeField(null=True, blank=True)
+    bandwidth_in_bytes = models.BigIntegerField(default=0)
+    bandwidth_out_bytes = models.BigIntegerField(default=0)
+    # Counter readings the next delta is measured from
+    last_netin = models.BigIntegerField(null=True, blank=True)
+    last_netout = models.BigIntegerField(null=True, blank=True)
+    # Highest usage alert sent this cycle, in percent of the plan's bandwidth
+    bandwidth_alert_level = models.IntegerField(default=0)
     
     class Meta:
         db_table = 'services'
@@ -101,10 +147,17 @@ class Service(models.Model):
         return f"{self.user.username} - {self.plan.name}"
     
     def calculate_next_due_date(self):
-        if self.billing_cycle == 'monthly':
-            return timezone.now() + timedelta(days=30)
-        elif self.billing_cycle == 'quarterly':
-            return timezone.now() + timedelta(days=90)
-        elif self.billing_cycle == 'annually':
-            return timezone.now() + timedelta(days=365)
-        return timezone.now() + timedelta(days=30)
\ No newline at end of file
+        return timezone.now() + timedelta(days=self.CYCLE_DAYS.get(self.billing_cycle, 30))
+    
+    def current_cycle_start(self):
+        """Start of the billing cycle that ends at next_due_date"""
+        return self.next_due_date - timedelta(days=self.CYCLE_DAYS.get(self.billing_cycle, 30))
+    
+    @property
+    def bandwidth_used_bytes(self):
+        """Transfer so far this cycle, both directions"""
+        return self.bandwidth_in_bytes + self.bandwidth_out_bytes
+    
+    @property
+    def bandwidth_quota_bytes(self):
+        return self.plan.bandwidth_gb * 1024 ** 3
\ No newline at end of file
@@ -76,6 +76,8 @@ class ServiceSerializer(serializers.ModelSerializer):
     plan_details = PlanSerializer(source='plan', read_only=True)
     user_email = serializers.EmailField(source='user.email', read_only=True)
     user_name = serializers.SerializerMethodField()
+    bandwidth_used_bytes = serializers.IntegerField(read_only=True)
+    bandwidth_quota_bytes = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Service
@@ -83,11 +85,14 @@ class ServiceSerializer(serializers.ModelSerializer):
             'id', 'user', 'user_email', 'user_name', 'plan', 'plan_details',
             'status', 'billing_cycle', 'price', 'next_due_date', 'domain',
             'vm_id', 'ip_address', 'username', 'password',
-            'created_at', 'activated_at', 'suspended_at', 'terminated_at'
+            'created_at', 'activated_at', 'suspended_at', 'terminated_at',
+            'bandwidth_cycle_start', 'bandwidth_in_bytes', 'bandwidth_out_bytes',
+            'bandwidth_used_bytes', 'bandwidth_quota_bytes'
         ]
         read_only_fields = [
             'vm_id', 'ip_address', 'username', 'password',
-            'created_at', 'activated_at', 'suspended_at', 'terminated_at'
+            'created_at', 'activated_at', 'suspended_at', 'terminated_at',
+            'bandwidth_cycle_start', 'bandwidth_in_bytes', 'bandwidth_out_bytes'
         ]
     
     def get_user_name(self, obj):
@@ -5,8 +5,15 @@ from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from core.models import Service
+from vms.models import ProvisioningJob
 from django.contrib.auth import get_user_model
 from vms.proxmox import ProxmoxManager
+from vms.pipeline import start_job, provisioning_lock, provisioning_started
+from vms.tasks import run_provisioning_step
+from vms.warm_pool import claim_warm_vm, hand_over_warm_vm
+from vms.circuit import ProxmoxUnavailable, proxmox_guard
+from vms.power import bulk_power
+from vms.reclamation import mark_for_reclamation
 from payments.models import Invoice, Transaction
 import uuid
 import logging
@@ -154,81 +161,74 @@ def create_vm_task(service_id):
     logger.info(f"Starting VM creation for service {service_id}")
     
     try:
-        service = Service.objects.get(id=service_id)
-        proxmox = ProxmoxManager()
-        
-        # Test connection
-        connection_test = proxmox.test_connection()
-        if connection_test['status'] != 'success':
-            logger.error(f"Proxmox connection failed: {connection_test['message']}")
-            service.status = 'suspended'
-            service.save()
-            send_vm_deployment_failed_email.delay(service_id, connection_test['message'])
-            return {'status': 'error', 'message': 'Proxmox connection failed'}
-        
-        # Get next VM ID
-        vmid = proxmox.get_next_vmid()
-        vm_name = f"vps-{service.user.username}-{vmid}"
-        
-        # Generate password BEFORE creating VM
-        password = proxmox.generate_password()
-        
-        logger.info(f"Creating VM {vmid} for service {service_id}")
-        logger.info(f"Specs: {service.plan.cpu_cores} cores, {service.plan.ram_mb}MB RAM, {service.plan.disk_gb}GB disk")
-        
-        # Create the VM with password
-        template_id = getattr(settings, 'PROXMOX_TEMPLATE_ID', None)
-        result = proxmox.create_vm(
-            vmid=vmid,
-            name=vm_name,
-            cores=service.plan.cpu_cores,
-            memory=service.plan.ram_mb,
-            disk=service.plan.disk_gb,
-            template_id=template_id,
-            password=password  # Pass the password here
-        )
-        
-        if result['status'] == 'success':
-            # Update service with credentials
-            service.vm_id = vmid
-            service.ip_address = result.get('ip_address')
-            service.username = 'root'
-            service.password = password  # Save the generated password
-            service.status = 'active'
-            service.activated_at = timezone.now()
-            service.save()
+        with provisioning_lock(service_id) as locked:
+            if not locked:
+                # Duplicate call (payment callbacks are retried); the first run owns the build
+                logger.info(f"VM creation for service {service_id} is already running, skipping")
+                return {'status': 'skipped', 'message': 'Provisioning already in progress'}
             
-            logger.info(f"VM {vmid} created successfully for service {service_id}")
-            logger.info(f"IP Address: {service.ip_address}")
+            service = Service.objects.get(id=service_id)
+            reason = provisioning_started(service)
+            if reason:
+                logger.info(f"Skipping VM creation for service {service_id}: {reason}")
+                return {'status': 'skipped', 'message': reason}
             
-            # Send email with credentials
-            send_service_credentials_email.delay(service_id)
+            with proxmox_guard('provision'):
+                # Fast path: hand over a pre-provisioned VM from the plan's warm pool
+                warm_vm = claim_warm_vm(service.plan, node=service.node or None)
+                if warm_vm:
+                    proxmox = ProxmoxManager(node=warm_vm.node)
+                    password = hand_over_warm_vm(warm_vm, service, proxmox)
+                    if password:
+                        service.node = warm_vm.node
+                        service.vm_id = warm_vm.vm_id
+                        service.ip_address = warm_vm.ip_address
+                        service.username = 'root'
+                        service.password = password
+                        service.status = 'active'
+                        service.activated_at = timezone.now()
+                        service.save()
+                    
+                        logger.info(f"Warm VM {warm_vm.vm_id} handed to service {service_id}")
+                        # Without an IP yet, the resolver sends the email once it has one
+                        if service.ip_address:
+                            send_service_credentials_email.delay(service_id)
+                    
+                        return {
+                            'status': 'success',
+                            'vmid': warm_vm.vm_id,
+                            'ip_address': service.ip_address,
+                            'message': 'VM assigned from warm pool'
+                        }
+                    logger.warning(f"Warm VM {warm_vm.vm_id} hand-over failed, cloning a new VM")
             
-            return {
-                'status': 'success',
-                'vmid': vmid,
-                'ip_address': service.ip_address,
-                'message': 'VM created successfully'
-            }
-        else:
-            logger.error(f"VM creation failed for service {service_id}: {result['message']}")
-            service.status = 'suspended'
-            service.save()
-            send_vm_deployment_failed_email.delay(service_id, result['message'])
-            return result
+            # Once the job exists, later calls see it and skip
+            job = start_job(service)
+        
+        # Build a new VM as a resumable chain of short steps
+        run_provisioning_step(job.id)
+        
+        return {
+            'status': 'queued',
+            'job_id': job.id,
+            'message': 'VM provisioning started'
+        }
             
+    except ProxmoxUnavailable as e:
+        # Nothing claimed or started yet; try again once Proxmox has room
+        logger.warning(f"Deferring VM creation for service {service_id}: {str(e)}")
+        create_vm_task.apply_async((service_id,), countdown=e.countdown)
+        return {'status': 'deferred', 'message': str(e)}
     except Service.DoesNotExist:
         logger.error(f"Service {service_id} not found")
         return {'status': 'error', 'message': 'Service not found'}
     except Exception as e:
         logger.error(f"Exception during VM creation for service {service_id}: {str(e)}")
-        try:
-            service = Service.objects.get(id=service_id)
-            service.status = 'suspended'
-            service.save()
-            send_vm_deployment_failed_email.delay(service_id, str(e))
-        except:
-            pass
+        # A job keeps its progress and the service stays pending until it is
+        # resumed; without one nothing resumes the build, so flag it as before
+        if not ProvisioningJob.objects.filter(service_id=service_id).exists():
+            Service.objects.filter(id=service_id, status='pending').update(status='suspended')
+        send_vm_deployment_failed_email.delay(service_id, str(e))
         return {'status': 'error', 'message': str(e)}
 
 # Send VM deployment failure email
@@ -481,6 +481,7 @@ def send_service_credentials_email(service_id):
         )
         email.attach_alternative(html_content, "text/html")
         email.send()
+        Service.objects.filter(id=service_id).update(credentials_sent_at=timezone.now())
         logger.info(f"Credentials email sent for service {service_id}")
         return {'status': 'success'}
     except Exception as e:
@@ -496,6 +497,7 @@ def check_service_renewals():
         status='active',
         next_due_date__lte=tomorrow
     )
+    overdue = []
     
     for service in services:
         # Create invoice
@@ -513,7 +515,11 @@ def check_service_renewals():
         
         # If past due date, suspend service
         if service.next_due_date < timezone.now():
-            suspend_service_task.delay(service.id)
+            overdue.append(service.id)
+    
+    # Stopped in bulk rather than one task per VM
+    for batch in _batches(overdue):
+        bulk_suspend_services.delay(batch)
 
 # send renewal reminder email
 @shared_task
@@ -558,10 +564,12 @@ def suspend_service_task(service_id):
     """Suspend a service"""
     try:
         service = Service.objects.get(id=service_id)
-        proxmox = ProxmoxManager()
         
-        if service.vm_id:
-            proxmox.stop_vm(service.vm_id)
+        with proxmox_guard('power'):
+            proxmox = ProxmoxManager(node=service.node)
+            # Skip the stop call if the snapshot already shows the VM down
+            if service.vm_id and proxmox.get_vm_statuses([service.vm_id])[service.vm_id] != 'stopped':
+                proxmox.stop_vm(service.vm_id)
         
         service.status = 'suspended'
         service.suspended_at = timezone.now()
@@ -571,6 +579,9 @@ def suspend_service_task(service_id):
         send_suspension_email.delay(service_id)
         
         return {'status': 'success'}
+    except ProxmoxUnavailable as e:
+        suspend_service_task.apply_async((service_id,), countdown=e.countdown)
+        return {'status': 'deferred', 'message': str(e)}
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
@@ -606,15 +617,50 @@ def send_suspension_email(service_id):
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
+@shared_task
+def send_bandwidth_alert_email(service_id, level):
+    """Tell the customer how much of the plan's bandwidth they have used this cycle"""
+    try:
+        service = Service.objects.select_related('plan', 'user').get(id=service_id)
+        
+        used_gb = service.bandwidth_used_bytes / 1024 ** 3
+        subject = f'Bandwidth Usage at {level}% - {service.plan.name}'
+        context = {
+            'name': service.user.first_name,
+            'plan_name': service.plan.name,
+            'level': level,
+            'used_gb': f'{used_gb:.1f}',
+            'bandwidth_gb': service.plan.bandwidth_gb,
+            'next_due_date': service.next_due_date.strftime('%B %d, %Y'),
+            'year': timezone.now().year,
+        }
+
+        # Render HTML template
+        html_content = render_to_string('emails/bandwidth_alert.html', context)
+        text_content = f"Hello {service.user.first_name}, Your {service.plan.name} service has used {used_gb:.1f} GB of its {service.plan.bandwidth_gb} GB bandwidth ({level}%) this billing cycle. Usage resets on {context['next_due_date']}."
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=text_content,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[service.user.email]
+        )
+        email.attach_alternative(html_content, "text/html")
+        email.send()
+        
+        return {'status': 'success'}
+    except Exception as e:
+        return {'status': 'error', 'message': str(e)}
+
 @shared_task
 def reactivate_service_task(service_id):
     """Reactivate a suspended service"""
     try:
         service = Service.objects.get(id=service_id)
-        proxmox = ProxmoxManager()
         
-        if service.vm_id:
-            proxmox.start_vm(service.vm_id)
+        with proxmox_guard('power'):
+            proxmox = ProxmoxManager(node=service.node)
+            if service.vm_id and proxmox.get_vm_statuses([service.vm_id])[service.vm_id] != 'running':
+                proxmox.start_vm(service.vm_id)
         
         service.status = 'active'
         service.suspended_at = None
@@ -622,6 +668,9 @@ def reactivate_service_task(service_id):
         service.save()
         
         return {'status': 'success'}
+    except ProxmoxUnavailable as e:
+        reactivate_service_task.apply_async((service_id,), countdown=e.countdown)
+        return {'status': 'deferred', 'message': str(e)}
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
@@ -630,16 +679,25 @@ def terminate_service_task(service_id):
     """Terminate a service"""
     try:
         service = Service.objects.get(id=service_id)
-        proxmox = ProxmoxManager()
         
         if service.vm_id:
-            proxmox.delete_vm(service.vm_id)
+            with proxmox_guard('terminate'):
+                # Only stop the VM now; its disks are purged by the off-peak reclamation sweep
+                outcome = bulk_power('stop', {service.vm_id: service.node})[service.vm_id]
+                if outcome['status'] == 'error':
+                    return {'status': 'error', 'message': outcome['message']}
+                # A VM already gone from the cluster leaves no disks to purge
+                if not outcome.get('missing'):
+                    mark_for_reclamation(service, node=outcome['node'])
         
         service.status = 'terminated'
         service.terminated_at = timezone.now()
         service.save()
         
         return {'status': 'success'}
+    except ProxmoxUnavailable as e:
+        terminate_service_task.apply_async((service_id,), countdown=e.countdown)
+        return {'status': 'deferred', 'message': str(e)}
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
@@ -652,5 +710,76 @@ def check_suspended_services():
         suspended_at__lte=week_ago
     )
     
+    for batch in _batches(list(services.values_list('id', flat=True))):
+        bulk_terminate_services.delay(batch)
+
+
+def _batches(ids):
+    size = getattr(settings, 'PROXMOX_POWER_BATCH', 200)
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def _bulk_power_services(services, action):
+    """Run one power action over the services' VMs; returns {service_id: outcome}"""
+    with_vm = [service for service in services if service.vm_id]
+    results = bulk_power(action, {service.vm_id: service.node for service in with_vm})
+    outcomes = {service.id: {'status': 'success', 'message': 'No VM'} for service in services if not service.vm_id}
+    for service in with_vm:
+        outcomes[service.id] = results[service.vm_id]
+    return outcomes
+
+
+@shared_task
+def bulk_suspend_services(service_ids):
+    """Stop the VMs of many services at once and mark the stopped ones suspended"""
+    services = list(Service.objects.filter(id__in=service_ids, status='active'))
+    try:
+        with proxmox_guard('power'):
+            outcomes = _bulk_power_services(services, 'stop')
+    except ProxmoxUnavailable as e:
+        bulk_suspend_services.apply_async((service_ids,), countdown=e.countdown)
+        return {'status': 'deferred', 'message': str(e)}
+    
+    suspended = 0
     for service in services:
-        terminate_service_task.delay(service.id)
\ No newline at end of file
+        if outcomes[service.id]['status'] == 'error':
+            continue
+        service.status = 'suspended'
+        service.suspended_at = timezone.now()
+        service.save(update_fields=['status', 'suspended_at'])
+        send_suspension_email.delay(service.id)
+        suspended += 1
+    
+    failed = {service_id: outcome['message'] for service_id, outcome in outcomes.items() if outcome['status'] == 'error'}
+    return {'status': 'success', 'suspended': suspended, 'failed': failed}
+
+
+@shared_task
+def bulk_terminate_services(service_ids):
+    """
+    Stop the VMs of many services at once, queue their disks for reclamation
+    and mark them terminated
+    """
+    services = list(Service.objects.filter(id__in=service_ids, status='suspended'))
+    try:
+        with proxmox_guard('terminate'):
+            outcomes = _bulk_power_services(services, 'stop')
+            for service in services:
+                outcome = outcomes[service.id]
+                if service.vm_id and outcome['status'] != 'error' and not outcome.get('missing'):
+                    mark_for_reclamation(service, node=outcome['node'])
+    except ProxmoxUnavailable as e:
+        bulk_terminate_services.apply_async((service_ids,), countdown=e.countdown)
+        return {'status': 'deferred', 'message': str(e)}
+    
+    terminated = 0
+    for service in services:
+        if outcomes[service.id]['status'] == 'error':
+            continue
+        service.status = 'terminated'
+        service.terminated_at = timezone.now()
+        service.save(update_fields=['status', 'terminated_at'])
+        terminated += 1
+    
+    failed = {service_id: outcome['message'] for service_id, outcome in outcomes.items() if outcome['status'] == 'error'}
+    return {'status': 'success', 'terminated': terminated, 'failed': failed}
\ No newline at end of file
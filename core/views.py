@@ -12,6 +12,8 @@ from payments.mpesa import MPesaClient
 from payments.paypal import PayPalClient
 from payments.views import pay_invoice_with_balance
 from core.tasks import create_vm_task, reactivate_service_task, send_welcome_email
+from vms.timeseries import PERIODS, get_service_series
+from vms.backups import get_service_backups
 import uuid
 from datetime import timedelta
 
@@ -347,6 +349,43 @@ class ServiceViewSet(viewsets.ModelViewSet):
                 'ssh_command': f'ssh {service.username}@{service.ip_address}' if service.ip_address else None
             }
         })
+    
+    @action(detail=True, methods=['get'])
+    def metrics(self, request, pk=None):
+        """
+        CPU, memory, disk and network history of the service's VM
+        
+        GET /api/services/{id}/metrics/?period=24h
+        """
+        service = self.get_object()
+        period = request.query_params.get('period', '24h')
+        if period not in PERIODS:
+            return Response({
+                'error': f"Invalid period. Choose: {', '.join(PERIODS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        resolution, points = get_service_series(service, timezone.now() - PERIODS[period])
+        return Response({
+            'success': True,
+            'period': period,
+            'resolution': resolution,
+            'points': points
+        })
+    
+    @action(detail=True, methods=['get'])
+    def backups(self, request, pk=None):
+        """
+        Scheduled backups of the service's VM, newest first
+        
+        GET /api/services/{id}/backups/
+        """
+        service = self.get_object()
+        return Response({
+            'success': True,
+            'schedule': service.plan.backup_schedule,
+            'retention': service.plan.backup_retention,
+            'backups': get_service_backups(service)
+        })
 
 class TransactionViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
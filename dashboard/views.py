@@ -2,9 +2,13 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Sum
+from datetime import datetime, timezone as dt_timezone
 from core.models import Service, Plan, User
 from payments.models import Invoice, Transaction
 from payments.views import invoice_payment_page
+from vms.proxmox import ProxmoxManager
+from vms.health import get_health, is_fresh
+from vms.circuit import proxmox_breaker
 
 def home(request):
     """Home page with plans"""
@@ -72,9 +76,25 @@ def admin_dashboard(request):
     pending_invoices = Invoice.objects.filter(status='unpaid').count()
     active_users = User.objects.filter(is_active=True).count()
     
-    recent_services = Service.objects.select_related('user', 'plan').order_by('-created_at')[:10]
+    recent_services = list(Service.objects.select_related('user', 'plan').order_by('-created_at')[:10])
+    
+    # Live VM state from the shared cluster snapshot (no per-VM API calls)
+    vm_statuses = ProxmoxManager().get_vm_statuses(
+        [service.vm_id for service in recent_services if service.vm_id]
+    )
+    for service in recent_services:
+        service.vm_state = vm_statuses.get(service.vm_id)
     recent_transactions = Transaction.objects.select_related('user').order_by('-created_at')[:10]
     
+    # Last background health check; never calls Proxmox from the request
+    cluster_health = get_health()
+    if cluster_health:
+        cluster_health = dict(
+            cluster_health,
+            stale=not is_fresh(cluster_health),
+            checked_at=datetime.fromtimestamp(cluster_health['checked_at'], tz=dt_timezone.utc)
+        )
+    
     context = {
         'total_services': total_services,
         'active_services': active_services,
@@ -83,6 +103,8 @@ def admin_dashboard(request):
         'active_users': active_users,
         'recent_services': recent_services,
         'recent_transactions': recent_transactions,
+        'cluster_health': cluster_health,
+        'breaker_state': proxmox_breaker.state(),
     }
     return render(request, 'dashboard/admin_dashboard.html', context)
 
@@ -18,6 +18,54 @@ app.conf.beat_schedule = {
         'task': 'core.tasks.check_suspended_services',
         'schedule': crontab(hour='*/6'),
     },
+    'refill-warm-pools': {
+        'task': 'vms.tasks.refill_warm_pools',
+        'schedule': crontab(minute='*/5'),
+    },
+    'promote-linked-clones': {
+        'task': 'vms.tasks.promote_linked_clones',
+        'schedule': crontab(minute='*/10'),
+    },
+    'resolve-pending-ips': {
+        'task': 'vms.tasks.resolve_pending_ips_task',
+        'schedule': 30.0,
+    },
+    'reconcile-vmid-allocator': {
+        'task': 'vms.tasks.reconcile_vmid_allocator',
+        'schedule': crontab(minute=15),
+    },
+    'refresh-cluster-health': {
+        'task': 'vms.tasks.refresh_cluster_health',
+        'schedule': 30.0,
+    },
+    'reclaim-disks': {
+        'task': 'vms.tasks.reclaim_disks_task',
+        'schedule': crontab(minute='*/5'),
+    },
+    'run-backups': {
+        'task': 'vms.tasks.run_backups_task',
+        'schedule': crontab(minute='*/5'),
+    },
+    'rebalance-nodes': {
+        'task': 'vms.tasks.rebalance_nodes_task',
+        'schedule': crontab(minute='*/5'),
+    },
+    'collect-metrics': {
+        'task': 'vms.tasks.collect_metrics_task',
+        'schedule': 60.0,
+    },
+    'rollup-metrics': {
+        'task': 'vms.tasks.rollup_metrics_task',
+        'schedule': crontab(minute='*/5'),
+    },
+    'account-bandwidth': {
+        'task': 'vms.tasks.account_bandwidth_task',
+        'schedule': crontab(minute='*/5'),
+    },
+    'reconcile-fleet': {
+        'task': 'vms.tasks.reconcile_fleet_task',
+        'schedule': crontab(minute=45),
+    },
 }
 
 @app.task(bind=True)
@@ -128,6 +128,14 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Cache (shared across web and Celery processes)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CELERY_BROKER_URL,
+    }
+}
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
@@ -158,6 +166,92 @@ PROXMOX_VERIFY_SSL = config('PROXMOX_VERIFY_SSL', default=False, cast=bool)
 PROXMOX_TEMPLATE_ID = config('PROXMOX_TEMPLATE_ID', default='', cast=int) if config('PROXMOX_TEMPLATE_ID', default='') else None
 PROXMOX_TIMEOUT = 240 # API timeout in seconds
 PROXMOX_CLONE_WAIT = 240  # Wait time after cloning in seconds
+PROXMOX_TICKET_MAX_AGE = 90 * 60  # Log in again before the 2h ticket expiry
+
+# Multi-node placement
+PROXMOX_TEMPLATE_NODE = config('PROXMOX_TEMPLATE_NODE', default=PROXMOX_NODE)  # Node holding the template
+PROXMOX_STORAGE = config('PROXMOX_STORAGE', default='') or None  # Restrict placement to this storage
+PROXMOX_NODE_WEIGHTS = {}  # e.g. {'pve2': 0.5}; 0 removes a node from rotation
+PROXMOX_CPU_OVERCOMMIT = 4.0
+PROXMOX_RAM_OVERCOMMIT = 1.0
+PROXMOX_SNAPSHOT_TTL = 15  # Seconds a cached /cluster/resources snapshot stays fresh
+PROXMOX_HEALTH_TTL = 60  # Seconds provisioning trusts the background health check
+
+# Linked clones (thin storage only), promoted to full clones off-peak
+PROXMOX_LINKED_CLONES = config('PROXMOX_LINKED_CLONES', default=False, cast=bool)
+PROXMOX_PROMOTION_STORAGE = config('PROXMOX_PROMOTION_STORAGE', default='') or None  # Must differ from the template storage
+PROXMOX_PROMOTION_BWLIMIT = 51200  # KiB/s per promotion
+PROXMOX_PROMOTION_BATCH = 2  # Concurrent promotions
+PROXMOX_OFFPEAK_HOURS = (1, 6)  # Local hours [start, end) for background disk work
+
+# Background IP discovery
+PROXMOX_IP_RESOLVER_CONCURRENCY = 16  # Parallel guest-agent queries per sweep
+PROXMOX_IP_TIMEOUT = 15 * 60  # Send credentials without an IP after this long
+
+# Bulk power operations (mass suspensions and terminations)
+PROXMOX_POWER_CONCURRENCY = 16  # Threads per bulk task
+PROXMOX_POWER_PER_NODE = 4  # Start/stop/delete tasks in flight per node
+PROXMOX_POWER_TIMEOUT = 120  # Seconds to wait for one VM's task
+PROXMOX_POWER_BATCH = 200  # Services per bulk Celery task
+
+# Disk reclamation for terminated services
+PROXMOX_RECLAIM_HOURS = None  # Local hours [start, end) for purges; defaults to PROXMOX_OFFPEAK_HOURS
+PROXMOX_RECLAIM_PER_STORAGE = 1  # Purges running at once per storage
+PROXMOX_RECLAIM_BUDGET_GB = 200  # Disk GB a sweep may start purging per storage
+
+# Scheduled backups (per-plan schedule and retention are set on each Plan)
+PROXMOX_BACKUP_STORAGE = config('PROXMOX_BACKUP_STORAGE', default='local')  # Storage the dumps are written to
+PROXMOX_BACKUP_HOURS = None  # Local hours [start, end) for starting dumps; defaults to PROXMOX_OFFPEAK_HOURS
+PROXMOX_BACKUP_PER_STORAGE = 2  # Dumps running at once per backup storage
+PROXMOX_BACKUP_PER_NODE = 1  # Dumps running at once per node
+PROXMOX_BACKUP_BWLIMIT = 50 * 1024  # KiB/s per dump
+
+# Load-aware rebalancing with live migrations
+PROXMOX_REBALANCE_ENABLED = config('PROXMOX_REBALANCE_ENABLED', default=False, cast=bool)  # Opt-in; needs shared storage or PROXMOX_MIGRATION_LOCAL_DISKS
+PROXMOX_REBALANCE_THRESHOLDS = {'cpu': 0.85, 'mem': 0.90, 'iowait': 0.10}  # A node past any of these is hot
+PROXMOX_REBALANCE_CONCURRENCY = 2  # Migrations running at once in the cluster
+PROXMOX_REBALANCE_COOLDOWN_HOURS = 24  # Before the same VM may be moved again
+PROXMOX_MIGRATION_BANDWIDTH = 100  # MiB/s the cost model assumes for the migration network
+PROXMOX_MIGRATION_MAX_SECONDS = 300  # Longest estimated migration the rebalancer starts
+PROXMOX_MIGRATION_LOCAL_DISKS = False  # True without shared storage; disks are copied too
+
+# Fleet reconciliation between services and the VMs in Proxmox
+PROXMOX_RECONCILE_AUTOFIX = config('PROXMOX_RECONCILE_AUTOFIX', default=False, cast=bool)
+PROXMOX_RECONCILE_ORPHAN_GRACE = 60 * 60  # Seconds an orphan must be seen before it is stopped
+PROXMOX_RECONCILE_IGNORE = []  # VMIDs not managed by this app (infrastructure VMs, other templates)
+
+# Proxmox API metrics, scraped from /metrics/proxmox/ with this bearer token
+PROXMOX_METRICS_ENABLED = config('PROXMOX_METRICS_ENABLED', default=True, cast=bool)
+PROXMOX_METRICS_TOKEN = config('PROXMOX_METRICS_TOKEN', default='')
+
+# VM and node usage history: days kept for each resolution, keyed by bucket length in seconds
+PROXMOX_METRICS_RETENTION = {60: 2, 300: 14, 3600: 90, 86400: 730}
+
+# Bandwidth usage emails, in percent of the plan's bandwidth per billing cycle
+BANDWIDTH_ALERT_LEVELS = [80, 100]
+
+# VMID allocation
+PROXMOX_VMID_RANGE = (config('PROXMOX_VMID_START', default=1000, cast=int), config('PROXMOX_VMID_END', default=999999, cast=int))
+PROXMOX_VMID_BLOCK_SIZE = 10  # IDs each process reserves per database round-trip
+
+# Shared circuit breaker and per-operation concurrency limits for Proxmox calls
+PROXMOX_BREAKER_THRESHOLD = 5  # Consecutive connection failures/timeouts before failing fast
+PROXMOX_BREAKER_RESET_TIMEOUT = 30  # Seconds before a probe request is let through
+PROXMOX_BULKHEADS = {
+    'provision': 8,
+    'power': 4,
+    'terminate': 2,
+    'maintenance': 4,
+}
+
+# Per-service lock that makes duplicate create_vm_task calls exit straight away
+PROXMOX_PROVISION_LOCK_TIMEOUT = 300  # Seconds held at most in case the worker dies; released early when the run finishes
+
+# Base templates per OS image; sized copies for each plan's disk are built from these
+PROXMOX_OS_TEMPLATES = {}  # Extra OS images: {'debian-12': base template VMID}; 'default' is PROXMOX_TEMPLATE_ID
+
+# VM configs cached by VMID; writes carry the config digest, so a stale entry costs a retry
+PROXMOX_CONFIG_CACHE_TTL = 30  # Seconds an unlocked VM config is served from the shared cache
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
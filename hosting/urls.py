@@ -20,6 +20,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
 from core import views as core_views
+from vms import views as vms_views
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
@@ -76,6 +77,10 @@ urlpatterns = [
     path('api/webhooks/mpesa/', core_views.mpesa_callback, name='mpesa_callback'),
     path('api/webhooks/paypal/', core_views.paypal_webhook, name='paypal_webhook'),
     
+    # Proxmox API metrics (Prometheus scrape target)
+    path('metrics/proxmox/', vms_views.proxmox_metrics, name='proxmox_metrics'),
+    path('metrics/nodes/<str:node>/', vms_views.node_metrics, name='node_metrics'),
+    
     # API Documentation
     path('api/docs/', schema_view.with_ui('swagger', cache_timeout=0), name='api_docs'),
     path('api/redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='api_redoc'),
@@ -1,3 +1,44 @@
 from django.contrib import admin
+from vms.models import Backup, DiskReclamation, ProvisioningJob, VMIDRange, VMMigration, VMTemplate, WarmVM
 
-# Register your models here.
+
+@admin.register(WarmVM)
+class WarmVMAdmin(admin.ModelAdmin):
+    list_display = ['vm_id', 'plan', 'node', 'status', 'ip_address', 'ready_at', 'claimed_at']
+    list_filter = ['status', 'node', 'plan']
+
+
+@admin.register(ProvisioningJob)
+class ProvisioningJobAdmin(admin.ModelAdmin):
+    list_display = ['service', 'step', 'status', 'node', 'vm_id', 'attempts', 'updated_at']
+    list_filter = ['status', 'step', 'node']
+    exclude = ['password']
+
+
+@admin.register(VMIDRange)
+class VMIDRangeAdmin(admin.ModelAdmin):
+    list_display = ['name', 'start', 'end', 'next_vmid', 'updated_at']
+
+
+@admin.register(DiskReclamation)
+class DiskReclamationAdmin(admin.ModelAdmin):
+    list_display = ['vm_id', 'service', 'node', 'storage', 'disk_gb', 'status', 'attempts', 'created_at', 'reclaimed_at']
+    list_filter = ['status', 'node', 'storage']
+
+
+@admin.register(Backup)
+class BackupAdmin(admin.ModelAdmin):
+    list_display = ['vm_id', 'service', 'node', 'storage', 'status', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'node', 'storage']
+
+
+@admin.register(VMMigration)
+class VMMigrationAdmin(admin.ModelAdmin):
+    list_display = ['vm_id', 'service', 'source', 'target', 'status', 'reason', 'estimated_seconds', 'created_at', 'finished_at']
+    list_filter = ['status', 'source', 'target']
+
+
+@admin.register(VMTemplate)
+class VMTemplateAdmin(admin.ModelAdmin):
+    list_display = ['os_image', 'disk_gb', 'vm_id', 'node', 'storage', 'shared', 'status', 'ready_at']
+    list_filter = ['status', 'os_image', 'node']
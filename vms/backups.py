@@ -0,0 +1,200 @@
+"""
+Scheduled VM backups.
+
+schedule_backups() queues a Backup for every active service whose plan's
+schedule has come round. run_backups() follows running vzdump tasks to
+their result and, inside the backup window (off-peak by default), starts
+queued ones while keeping within a few limits:
+
+- a few dumps per storage, so the backup target isn't saturated
+- a few dumps per node, so the node's guests keep their disk I/O
+- no new dumps on a node that is building VMs for new customers
+
+Each dump runs in snapshot mode with ionice and a bandwidth limit, and
+Proxmox prunes the VM's older backups down to the plan's retention.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from core.models import Service
+from vms.models import Backup, ProvisioningJob
+from vms.proxmox import ProxmoxManager
+from vms.task_watcher import task_watcher
+from vms.inventory import get_fleet_snapshot
+from vms.windows import OFFPEAK_HOURS, in_hour_window
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Days between backups for each plan schedule
+SCHEDULE_DAYS = {
+    'daily': 1,
+    'weekly': 7,
+}
+
+# Dumps running at once on one backup storage, and on one node
+BACKUP_PER_STORAGE = 2
+BACKUP_PER_NODE = 1
+# Read/write limit of one dump in KiB/s
+BACKUP_BWLIMIT = 50 * 1024
+# Failed dumps are retried this many times before they are left failed
+BACKUP_MAX_ATTEMPTS = 3
+
+
+def in_backup_window(now=None):
+    start, end = getattr(settings, 'PROXMOX_BACKUP_HOURS', None) or getattr(settings, 'PROXMOX_OFFPEAK_HOURS', OFFPEAK_HOURS)
+    return in_hour_window(start, end, now)
+
+
+def schedule_backups(now=None):
+    """Queue a backup for each service that is due one; returns the number queued"""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    storage = getattr(settings, 'PROXMOX_BACKUP_STORAGE', 'local')
+
+    services = Service.objects.filter(
+        status='active',
+        vm_id__isnull=False,
+        plan__backup_schedule__in=list(SCHEDULE_DAYS)
+    ).values('id', 'vm_id', 'node', 'plan__backup_schedule')
+
+    pending = set(Backup.objects.filter(status__in=['queued', 'running']).values_list('service_id', flat=True))
+    # A backup that used up its attempts still counts for its period; the
+    # next one waits for the next period instead of being queued every sweep
+    last_backup = dict(
+        Backup.objects.values('service_id').annotate(last=Max('created_at')).values_list('service_id', 'last')
+    )
+
+    backups = []
+    for service in services:
+        if service['id'] in pending:
+            continue
+        last = last_backup.get(service['id'])
+        # Compared by date, so a dump queued a few minutes later each day doesn't slip a day
+        if last and (today - timezone.localdate(last)).days < SCHEDULE_DAYS[service['plan__backup_schedule']]:
+            continue
+        backups.append(Backup(service_id=service['id'], vm_id=service['vm_id'], node=service['node'], storage=storage))
+
+    Backup.objects.bulk_create(backups)
+    if backups:
+        logger.info(f"Queued {len(backups)} backup(s)")
+    return len(backups)
+
+
+def _backup_failed(backup, error):
+    backup.last_error = str(error)
+    backup.upid = ''
+    max_attempts = getattr(settings, 'PROXMOX_BACKUP_MAX_ATTEMPTS', BACKUP_MAX_ATTEMPTS)
+    backup.status = 'failed' if backup.attempts >= max_attempts else 'queued'
+    if backup.status == 'failed':
+        backup.finished_at = timezone.now()
+    logger.error(f"Backup of VM {backup.vm_id} failed (attempt {backup.attempts}): {error}")
+
+
+def _prune_records(service_id, keep):
+    """Drop records of completed backups that Proxmox has pruned from storage"""
+    if keep <= 0:
+        # No retention is passed to vzdump then, so Proxmox prunes nothing either
+        return
+    kept = Backup.objects.filter(service_id=service_id, status='completed').order_by('-finished_at').values_list('id', flat=True)[:keep]
+    Backup.objects.filter(service_id=service_id, status='completed').exclude(id__in=list(kept)).delete()
+
+
+def _finish_backups():
+    """Record the outcome of dumps started by earlier sweeps"""
+    completed = 0
+    for backup in Backup.objects.filter(status='running').select_related('service__plan'):
+        status = task_watcher.poll(backup.upid)
+        if status is None:
+            continue
+
+        if status.get('exitstatus') == 'OK':
+            backup.status = 'completed'
+            backup.upid = ''
+            backup.finished_at = timezone.now()
+            backup.save()
+            _prune_records(backup.service_id, backup.service.plan.backup_retention)
+            completed += 1
+            logger.info(f"Backed up VM {backup.vm_id} to {backup.storage}")
+        else:
+            _backup_failed(backup, status.get('exitstatus'))
+            backup.save()
+    return completed
+
+
+def _start_backup(backup, node):
+    """Start one dump; returns True if it is running"""
+    backup.attempts += 1
+    backup.node = node
+    try:
+        backup.upid = ProxmoxManager(node=node).backup_vm(
+            backup.vm_id,
+            backup.storage,
+            keep=backup.service.plan.backup_retention,
+            bwlimit=getattr(settings, 'PROXMOX_BACKUP_BWLIMIT', BACKUP_BWLIMIT)
+        )
+        backup.status = 'running'
+        backup.started_at = timezone.now()
+        backup.save()
+        return True
+    except Exception as e:
+        _backup_failed(backup, e)
+        backup.save()
+        return False
+
+
+def run_backups(now=None):
+    """
+    One backup sweep. Finishes running dumps, then, inside the window,
+    starts queued ones up to the per-storage and per-node limits.
+    Returns (completed, started).
+    """
+    completed = _finish_backups()
+    if not in_backup_window(now):
+        return completed, 0
+
+    per_storage = getattr(settings, 'PROXMOX_BACKUP_PER_STORAGE', BACKUP_PER_STORAGE)
+    per_node = getattr(settings, 'PROXMOX_BACKUP_PER_NODE', BACKUP_PER_NODE)
+
+    # Nodes building VMs for new customers take no new dumps
+    provisioning = set(ProvisioningJob.objects.filter(status__in=['running', 'waiting']).values_list('node', flat=True))
+
+    storage_in_flight = defaultdict(int)
+    node_in_flight = defaultdict(int)
+    for storage, node in Backup.objects.filter(status='running').values_list('storage', 'node'):
+        storage_in_flight[storage] += 1
+        node_in_flight[node] += 1
+
+    queued = list(Backup.objects.filter(status='queued').select_related('service__plan'))
+    if not queued:
+        return completed, 0
+
+    fleet = get_fleet_snapshot()
+    started = 0
+    for backup in queued:
+        resource = fleet.get(backup.vm_id)
+        if fleet and not resource:
+            backup.attempts = getattr(settings, 'PROXMOX_BACKUP_MAX_ATTEMPTS', BACKUP_MAX_ATTEMPTS)
+            _backup_failed(backup, 'VM not found in the cluster')
+            backup.save()
+            continue
+
+        # The VM may have migrated since the backup was queued
+        node = (resource or {}).get('node') or backup.node
+        if node in provisioning:
+            continue
+        if storage_in_flight[backup.storage] >= per_storage or node_in_flight[node] >= per_node:
+            continue
+        if _start_backup(backup, node):
+            storage_in_flight[backup.storage] += 1
+            node_in_flight[node] += 1
+            started += 1
+
+    return completed, started
+
+
+def get_service_backups(service):
+    return list(service.backups.order_by('-created_at').values(
+        'id', 'status', 'storage', 'created_at', 'started_at', 'finished_at'
+    ))
@@ -0,0 +1,76 @@
+from django.conf import settings
+from core.models import Service
+from vms.inventory import get_cluster_resources
+from vms.timeseries import counter_delta
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Usage alerts, in percent of the plan's bandwidth; each is sent once per cycle
+ALERT_LEVELS = [80, 100]
+
+ACCOUNTING_FIELDS = [
+    'bandwidth_cycle_start', 'bandwidth_in_bytes', 'bandwidth_out_bytes',
+    'last_netin', 'last_netout', 'bandwidth_alert_level',
+]
+
+
+def _account(service, netin, netout):
+    """Add the traffic since the last reading to the service's cycle totals"""
+    cycle_start = service.current_cycle_start()
+    if service.bandwidth_cycle_start != cycle_start:
+        # A renewal moved the cycle on
+        service.bandwidth_cycle_start = cycle_start
+        service.bandwidth_in_bytes = 0
+        service.bandwidth_out_bytes = 0
+        service.bandwidth_alert_level = 0
+
+    service.bandwidth_in_bytes += counter_delta(service.last_netin, netin)
+    service.bandwidth_out_bytes += counter_delta(service.last_netout, netout)
+    service.last_netin = netin
+    service.last_netout = netout
+
+
+def _alert_level(service):
+    """Highest alert level the service has newly crossed, or 0"""
+    quota = service.bandwidth_quota_bytes
+    if not quota:
+        return 0
+    used = service.bandwidth_used_bytes * 100 / quota
+    levels = getattr(settings, 'BANDWIDTH_ALERT_LEVELS', ALERT_LEVELS)
+    crossed = [level for level in levels if used >= level and level > service.bandwidth_alert_level]
+    return max(crossed, default=0)
+
+
+def account_bandwidth():
+    """
+    Read every VM's cumulative netin/netout counters from the cluster snapshot
+    and add the deltas to its service's totals for the current billing cycle.
+    Returns (services updated, [(service_id, alert level)] newly crossed).
+    """
+    counters = {
+        item['vmid']: (item['netin'], item['netout'])
+        for item in get_cluster_resources()
+        if item.get('type') == 'qemu' and 'netin' in item and 'netout' in item
+    }
+    if not counters:
+        return 0, []
+
+    services = list(Service.objects.filter(
+        status__in=['active', 'suspended'],
+        vm_id__in=list(counters)
+    ).select_related('plan'))
+
+    alerts = []
+    for service in services:
+        _account(service, *counters[service.vm_id])
+        level = _alert_level(service)
+        if level:
+            service.bandwidth_alert_level = level
+            alerts.append((service.id, level))
+
+    Service.objects.bulk_update(services, ACCOUNTING_FIELDS, batch_size=500)
+
+    for service_id, level in alerts:
+        logger.warning(f"Service {service_id} has used {level}% of its bandwidth this cycle")
+    return len(services), alerts
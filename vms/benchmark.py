@@ -0,0 +1,262 @@
+"""
+Provisioning benchmark harness.
+
+Runs the real create_vm_task for many services at once against the Proxmox
+simulator served over HTTPS. Celery dispatch (delay/apply_async) is routed
+to an in-process worker pool that honours countdowns, so worker occupancy
+can be measured exactly. Needs the database, like the app itself; the rows
+it creates are removed afterwards.
+"""
+from celery.app.task import Task
+from collections import Counter
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
+from core.models import Plan, Service
+from vms.metrics import api_metrics
+from vms.models import ProvisioningJob
+from vms.simulator import SimulatedCluster, generate_self_signed_cert, serve
+import heapq
+import itertools
+import secrets
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = [50, 95, 99]
+
+
+class WorkerPool:
+    """Stand-in for a Celery worker: N threads taking tasks from a countdown-aware queue"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.busy_seconds = 0.0
+        self.scheduled_wait_seconds = 0.0
+        self.tasks_run = Counter()
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads = []
+
+    def apply_async(self, task, args=None, kwargs=None, countdown=None):
+        countdown = countdown or 0
+        with self._cond:
+            self.scheduled_wait_seconds += countdown
+            heapq.heappush(self._queue, (time.monotonic() + countdown, next(self._seq), task, args or (), kwargs or {}))
+            self._cond.notify()
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'benchmark-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _next(self):
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                if self._queue and self._queue[0][0] <= now:
+                    return heapq.heappop(self._queue)[2:]
+                self._cond.wait(self._queue[0][0] - now if self._queue else None)
+            return None
+
+    def _run(self):
+        try:
+            while True:
+                item = self._next()
+                if item is None:
+                    return
+                task, args, kwargs = item
+                started = time.monotonic()
+                try:
+                    task.run(*args, **kwargs)
+                except Exception as e:
+                    logger.error(f"Benchmark task {task.name} failed: {str(e)}")
+                finally:
+                    with self._cond:
+                        self.busy_seconds += time.monotonic() - started
+                        self.tasks_run[task.name] += 1
+        finally:
+            connection.close()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _metric_totals(snapshot):
+    totals = Counter()
+    for method, endpoint, node, histogram in snapshot['requests']:
+        totals[f'{method} {endpoint}'] += histogram['count']
+    waits = Counter()
+    for kind, histogram in snapshot['waits']:
+        waits[kind] += histogram['sum']
+    return totals, waits
+
+
+def _create_fixtures(count, plan_spec):
+    User = get_user_model()
+    tag = secrets.token_hex(4)
+    user = User.objects.create_user(username=f'benchmark-{tag}', email=f'benchmark-{tag}@example.com')
+    plan = Plan.objects.create(
+        name=f'Benchmark {tag}',
+        plan_type='vps',
+        cpu_cores=plan_spec['cores'],
+        ram_mb=plan_spec['memory'],
+        disk_gb=plan_spec['disk'],
+        bandwidth_gb=1000,
+        price_monthly=Decimal('0'),
+        is_active=False
+    )
+    services = [
+        Service.objects.create(
+            user=user,
+            plan=plan,
+            price=Decimal('0'),
+            next_due_date=timezone.now() + timedelta(days=30)
+        )
+        for _ in range(count)
+    ]
+    return user, plan, services
+
+
+def _delete_fixtures(user, plan, services):
+    ProvisioningJob.objects.filter(service__in=services).delete()
+    Service.objects.filter(id__in=[service.id for service in services]).delete()
+    plan.delete()
+    user.delete()
+
+
+def run_benchmark(vms=20, workers=8, nodes=('pve1', 'pve2'), timings=None, failures=None, seed=None,
+                  arrival_interval=0.0, linked=False, timeout=1800, plan_spec=None):
+    """
+    Provision `vms` services through create_vm_task and return the results
+    as a plain dict, ready to be written as JSON.
+    """
+    from core.tasks import create_vm_task
+
+    plan_spec = plan_spec or {'cores': 2, 'memory': 2048, 'disk': 40}
+    cluster = SimulatedCluster(nodes=nodes, timings=timings, failures=failures, seed=seed)
+    certfile, keyfile = generate_self_signed_cert()
+    server = serve(cluster, '127.0.0.1', 0, certfile, keyfile)
+    threading.Thread(target=server.serve_forever, name='proxmox-simulator', daemon=True).start()
+
+    pool = WorkerPool(workers)
+
+    def apply_async(task, args=None, kwargs=None, **options):
+        pool.apply_async(task, args, kwargs, countdown=options.get('countdown'))
+
+    overrides = override_settings(
+        PROXMOX_HOST=f'127.0.0.1:{server.server_address[1]}',
+        PROXMOX_USER='root@pam',
+        PROXMOX_PASSWORD='benchmark',
+        PROXMOX_VERIFY_SSL=False,
+        PROXMOX_NODE=cluster.nodes[0],
+        PROXMOX_TEMPLATE_NODE=cluster.template_node,
+        PROXMOX_TEMPLATE_ID=cluster.template_id,
+        PROXMOX_NODE_WEIGHTS={},
+        PROXMOX_LINKED_CLONES=linked,
+        # Keep the simulated cluster's snapshot and emails away from the real ones
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}},
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    )
+
+    with overrides, mock.patch.object(Task, 'apply_async', apply_async):
+        # Snapshots and VM configs left by an earlier run describe another cluster
+        cache.clear()
+        user, plan, services = _create_fixtures(vms, plan_spec)
+        ids = [service.id for service in services]
+        before_calls, before_waits = _metric_totals(api_metrics.snapshot())
+        dispatched = {}
+
+        try:
+            pool.start()
+            started = time.monotonic()
+            for service_id in ids:
+                dispatched[service_id] = timezone.now()
+                create_vm_task.delay(service_id)
+                if arrival_interval:
+                    time.sleep(arrival_interval)
+
+            # Payment-to-active is read from activated_at, so checking once a
+            # second doesn't affect the numbers
+            while time.monotonic() - started < timeout:
+                close_old_connections()
+                active = Service.objects.filter(id__in=ids, status='active').count()
+                failed = ProvisioningJob.objects.filter(service_id__in=ids, status='failed').count()
+                if active + failed >= len(ids):
+                    break
+                time.sleep(1)
+            wall_seconds = time.monotonic() - started
+        finally:
+            pool.stop()
+            server.shutdown()
+            server.server_close()
+
+        after_calls, after_waits = _metric_totals(api_metrics.snapshot())
+        services = list(Service.objects.filter(id__in=ids))
+        failed_jobs = list(ProvisioningJob.objects.filter(service_id__in=ids, status='failed').values('step', 'last_error'))
+        _delete_fixtures(user, plan, services)
+
+    latencies = [
+        (service.activated_at - dispatched[service.id]).total_seconds()
+        for service in services if service.status == 'active' and service.activated_at
+    ]
+    calls = after_calls - before_calls
+    waits = after_waits - before_waits
+
+    return {
+        'config': {
+            'vms': vms,
+            'workers': workers,
+            'nodes': list(nodes),
+            'linked_clones': linked,
+            'arrival_interval': arrival_interval,
+            'plan': plan_spec,
+            'timings': cluster.timings,
+            'failures': cluster.failures,
+            'seed': seed,
+        },
+        'completed': len(latencies),
+        'failed': len(failed_jobs),
+        'timed_out': vms - len(latencies) - len(failed_jobs),
+        'failures': failed_jobs,
+        'wall_seconds': round(wall_seconds, 3),
+        'vms_per_hour': round(len(latencies) / wall_seconds * 3600, 1) if wall_seconds else None,
+        'payment_to_active_seconds': {
+            **{f'p{pct}': percentile(latencies, pct) for pct in PERCENTILES},
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'max': max(latencies) if latencies else None,
+        },
+        'worker_occupancy': round(pool.busy_seconds / (workers * wall_seconds), 4) if wall_seconds else None,
+        'worker_busy_seconds': round(pool.busy_seconds, 3),
+        'tasks_run': dict(pool.tasks_run),
+        'api_calls_per_vm': round(sum(calls.values()) / vms, 2),
+        'api_calls': dict(calls),
+        # Workers blocked inside Proxmox waits (task polling, lock polling)
+        'blocked_seconds': round(sum(waits.values()), 3),
+        'blocked_seconds_by_kind': {kind: round(seconds, 3) for kind, seconds in waits.items()},
+        # Time jobs sat in the queue with a countdown instead of holding a worker
+        'scheduled_wait_seconds': round(pool.scheduled_wait_seconds, 3),
+    }
@@ -0,0 +1,201 @@
+"""
+Catalog of templates pre-sized for plan disks.
+
+Cloning the base template and growing the clone's disk afterwards costs
+every new VM an extra storage operation and lock cycle. The catalog keeps
+a template per OS image and disk size whose disk already has that size.
+Provisioning clones the one that fits the plan, so the resize step has
+nothing left to do.
+
+Sized templates are built from the image's base template when a plan is
+created or its disk changes. Until one is ready, or where it can't be
+cloned (a template on local storage only serves its own node), the base
+template is used as before.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from vms.models import VMTemplate
+from vms.proxmox import ProxmoxManager, parse_disk_size
+from vms.inventory import get_cluster_resources
+from vms.circuit import ProxmoxUnavailable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# OS image served by PROXMOX_TEMPLATE_ID
+DEFAULT_OS_IMAGE = 'default'
+
+# Seconds a template build may take before another worker may pick it up
+BUILD_LOCK_TIMEOUT = 900
+
+
+def get_base_templates():
+    """{os image: base template VMID}, from PROXMOX_OS_TEMPLATES plus PROXMOX_TEMPLATE_ID"""
+    templates = dict(getattr(settings, 'PROXMOX_OS_TEMPLATES', {}))
+    base = getattr(settings, 'PROXMOX_TEMPLATE_ID', None)
+    if base:
+        templates.setdefault(DEFAULT_OS_IMAGE, base)
+    return templates
+
+
+def _default_template_node():
+    return getattr(settings, 'PROXMOX_TEMPLATE_NODE', None) or settings.PROXMOX_NODE
+
+
+def get_sized_template(plan, node=None, os_image=DEFAULT_OS_IMAGE):
+    """
+    Ready template for the plan that can be cloned onto `node`: the plan's
+    disk size if there is one, otherwise the largest one below it.
+    """
+    templates = VMTemplate.objects.filter(
+        os_image=os_image,
+        status='ready',
+        vm_id__isnull=False,
+        disk_gb__lte=plan.disk_gb
+    )
+    if node:
+        templates = templates.filter(Q(shared=True) | Q(node=node))
+    return templates.order_by('-disk_gb').first()
+
+
+def choose_template(plan, node=None, os_image=DEFAULT_OS_IMAGE):
+    """(template VMID, node holding it) to clone a VM of the plan from"""
+    template = get_sized_template(plan, node, os_image)
+    if template:
+        return template.vm_id, template.node
+    return get_base_templates().get(os_image), _default_template_node()
+
+
+def get_clone_nodes(plan, os_image=DEFAULT_OS_IMAGE, proxmox=None):
+    """
+    Nodes a VM of the plan can be cloned onto, or None if any node can.
+    Proxmox only clones a template onto another node from shared storage;
+    a template on local storage serves its own node alone.
+    """
+    nodes = set()
+    templates = VMTemplate.objects.filter(
+        os_image=os_image,
+        status='ready',
+        vm_id__isnull=False,
+        disk_gb__lte=plan.disk_gb
+    )
+    for shared, node in templates.values_list('shared', 'node'):
+        if shared:
+            return None
+        nodes.add(node)
+
+    base_id = get_base_templates().get(os_image)
+    if base_id:
+        node = _default_template_node()
+        proxmox = proxmox or ProxmoxManager(node=node)
+        storage = proxmox.get_disk_storage(base_id, node=node)
+        if storage and _is_shared(storage, node):
+            return None
+        nodes.add(node)
+    return nodes or None
+
+
+def get_template_node(template_id):
+    """Node holding a template, whether it is a sized or a base one"""
+    node = VMTemplate.objects.filter(vm_id=template_id).values_list('node', flat=True).first()
+    return node or _default_template_node()
+
+
+def ensure_plan_templates(plan):
+    """
+    Add catalog entries for the plan's disk size for every OS image.
+    Returns the entries that still need building (new or previously failed).
+    """
+    node = _default_template_node()
+    pending = []
+    for os_image, base_id in get_base_templates().items():
+        template, created = VMTemplate.objects.get_or_create(
+            os_image=os_image,
+            disk_gb=plan.disk_gb,
+            node=node,
+            defaults={'source_template_id': base_id}
+        )
+        if template.status == 'failed':
+            template.status = 'building'
+            template.last_error = ''
+            template.save(update_fields=['status', 'last_error'])
+        if template.status == 'building':
+            pending.append(template)
+    return pending
+
+
+def _is_shared(storage, node):
+    for item in get_cluster_resources():
+        if item.get('type') == 'storage' and item.get('storage') == storage and item.get('node') == node:
+            return bool(item.get('shared'))
+    return False
+
+
+def _wait(proxmox, upid, timeout, action):
+    if upid and not proxmox.wait_for_task(upid, timeout=timeout):
+        raise Exception(f"{action} task failed or timed out")
+
+
+def build_template(template):
+    """
+    Clone the base template, grow its disk and convert the clone into a
+    template. A build that stopped halfway resumes with the clone it made.
+    Returns True once the template is ready.
+    """
+    lock_key = f'catalog:build:{template.id}'
+    if not cache.add(lock_key, 1, timeout=BUILD_LOCK_TIMEOUT):
+        return False
+
+    proxmox = ProxmoxManager(node=template.node)
+    try:
+        base_config = proxmox.get_vm_config(template.source_template_id)
+        if base_config is None:
+            raise Exception(f"Base template {template.source_template_id} not found on {template.node}")
+
+        if parse_disk_size(base_config) >= template.disk_gb:
+            # The base disk is already big enough; it serves this size as is
+            template.vm_id = template.source_template_id
+        else:
+            if template.vm_id is None:
+                template.vm_id = proxmox.get_next_vmid()
+                template.save(update_fields=['vm_id'])
+
+            config = proxmox.get_vm_config(template.vm_id)
+            if config is None:
+                name = f"tpl-{template.os_image}-{template.disk_gb}g"
+                _wait(proxmox, proxmox.clone_template(template.source_template_id, template.vm_id, name), 600, 'Clone')
+
+            def resize(config):
+                if parse_disk_size(config) >= template.disk_gb:
+                    return None
+                return proxmox.resize_disk(template.vm_id, template.disk_gb, digest=config.get('digest'))
+
+            _wait(proxmox, proxmox.apply_config_change(template.vm_id, resize), 300, 'Resize')
+
+            if not proxmox.get_vm_config(template.vm_id).get('template'):
+                _wait(proxmox, proxmox.apply_config_change(
+                    template.vm_id, lambda config: proxmox.convert_to_template(template.vm_id)
+                ), 120, 'Template conversion')
+
+        template.storage = proxmox.get_disk_storage(template.vm_id) or ''
+        template.shared = _is_shared(template.storage, template.node)
+        template.status = 'ready'
+        template.last_error = ''
+        template.ready_at = timezone.now()
+        template.save()
+        logger.info(f"Template {template.vm_id} ready for {template.os_image} {template.disk_gb}GB on {template.node}")
+        return True
+    except ProxmoxUnavailable:
+        # Not the build's fault; the task re-queues it
+        raise
+    except Exception as e:
+        # The clone is kept; building again carries on from it
+        template.status = 'failed'
+        template.last_error = str(e)
+        template.save(update_fields=['status', 'last_error'])
+        logger.error(f"Building the {template.os_image} {template.disk_gb}GB template failed: {str(e)}")
+        return False
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,224 @@
+"""
+Circuit breaker and bulkheads for Proxmox calls.
+
+The breaker is shared by every web and worker process through the cache
+(Redis). After PROXMOX_BREAKER_THRESHOLD consecutive connection failures or
+timeouts it opens, and requests fail immediately with CircuitOpenError
+instead of each waiting out PROXMOX_TIMEOUT. Once PROXMOX_BREAKER_RESET_TIMEOUT
+has passed, a single probe request is let through (half-open); if it
+succeeds the breaker closes, otherwise it opens again.
+
+Bulkheads cap how many tasks of one kind (provisioning, power actions,
+terminations, maintenance) talk to Proxmox at once, so a slow cluster can't
+tie up every worker slot.
+"""
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+import requests
+import secrets
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+# Responses that mean the API itself is unreachable, not that a call was refused.
+# 595/596 are pveproxy's "can't reach the node" codes.
+UNAVAILABLE_STATUS_CODES = [502, 503, 504, 595, 596]
+
+# Concurrent Proxmox tasks allowed per operation, across all workers
+BULKHEADS = {
+    'provision': 8,
+    'power': 4,
+    'terminate': 2,
+    'maintenance': 4,
+}
+# A slot held by a crashed worker is freed after this many seconds
+BULKHEAD_LEASE = 15 * 60
+# Countdown before a task that found its bulkhead full tries again
+BULKHEAD_RETRY = 10
+
+
+class ProxmoxUnavailable(Exception):
+    """Proxmox can't be used right now; try again after `countdown` seconds"""
+
+    def __init__(self, message, countdown):
+        super().__init__(message)
+        self.countdown = countdown
+
+
+class CircuitOpenError(ProxmoxUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name='proxmox'):
+        self.name = name
+        self._failures_key = f'circuit:{name}:failures'
+        self._opened_key = f'circuit:{name}:opened_at'
+        self._probe_key = f'circuit:{name}:probe'
+
+    @property
+    def threshold(self):
+        return getattr(settings, 'PROXMOX_BREAKER_THRESHOLD', FAILURE_THRESHOLD)
+
+    @property
+    def reset_timeout(self):
+        return getattr(settings, 'PROXMOX_BREAKER_RESET_TIMEOUT', RESET_TIMEOUT)
+
+    def _read(self):
+        try:
+            values = cache.get_many([self._failures_key, self._opened_key])
+        except Exception as e:
+            # Without the cache the breaker stays out of the way
+            logger.debug(f"Circuit breaker state unavailable: {str(e)}")
+            return 0, None
+        return values.get(self._failures_key) or 0, values.get(self._opened_key)
+
+    def _state(self, opened_at):
+        if opened_at is None:
+            return CLOSED
+        if time.time() - opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    def state(self):
+        return self._state(self._read()[1])
+
+    def retry_after(self):
+        opened_at = self._read()[1]
+        if opened_at is None:
+            return 0
+        return max(int(self.reset_timeout - (time.time() - opened_at)), 1)
+
+    def before_request(self):
+        """
+        Called before every request. Returns (failures, is_probe) to pass to
+        after_request(), or raises CircuitOpenError.
+        """
+        failures, opened_at = self._read()
+        state = self._state(opened_at)
+        if state == CLOSED:
+            return failures, False
+        if state == HALF_OPEN and cache.add(self._probe_key, 1, timeout=self.reset_timeout):
+            logger.info(f"Circuit '{self.name}' half-open, sending a probe request")
+            return failures, True
+        raise CircuitOpenError(f"Proxmox circuit '{self.name}' is open", self.retry_after())
+
+    def after_request(self, ticket, ok):
+        failures, is_probe = ticket
+        if ok:
+            if failures or is_probe:
+                cache.delete_many([self._failures_key, self._opened_key, self._probe_key])
+                logger.info(f"Circuit '{self.name}' closed")
+            return
+        self.record_failure(is_probe)
+
+    def record_failure(self, is_probe=False):
+        if is_probe:
+            cache.set(self._opened_key, time.time(), timeout=None)
+            cache.delete(self._probe_key)
+            logger.warning(f"Circuit '{self.name}' probe failed, staying open")
+            return
+        cache.add(self._failures_key, 0, timeout=None)
+        failures = cache.incr(self._failures_key)
+        if failures >= self.threshold and cache.add(self._opened_key, time.time(), timeout=None):
+            logger.error(f"Circuit '{self.name}' opened after {failures} consecutive failures")
+
+    def reset(self):
+        cache.delete_many([self._failures_key, self._opened_key, self._probe_key])
+
+
+class GuardedSession:
+    """Wraps the requests.Session inside a ProxmoxAPI with the circuit breaker"""
+
+    def __init__(self, session, breaker):
+        self._session = session
+        self._breaker = breaker
+
+    def request(self, method, url, *args, **kwargs):
+        ticket = self._breaker.before_request()
+        try:
+            response = self._session.request(method, url, *args, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            self._breaker.after_request(ticket, ok=False)
+            raise
+        self._breaker.after_request(ticket, ok=response.status_code not in UNAVAILABLE_STATUS_CODES)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+def guard(api, breaker=None):
+    """Route a ProxmoxAPI's requests through the circuit breaker"""
+    store = getattr(api, '_store', None)
+    if store and 'session' in store and not isinstance(store['session'], GuardedSession):
+        store['session'] = GuardedSession(store['session'], breaker or proxmox_breaker)
+    return api
+
+
+class Bulkhead:
+    """
+    Cluster-wide concurrency limit: `limit` numbered slots in the cache, each
+    claimed with an atomic add and released by its owner.
+    """
+
+    def __init__(self, name, limit, lease=BULKHEAD_LEASE):
+        self.name = name
+        self.limit = limit
+        self.lease = lease
+
+    def _key(self, slot):
+        return f'bulkhead:{self.name}:{slot}'
+
+    def acquire(self):
+        """Return a slot handle, or None if every slot is taken"""
+        token = secrets.token_hex(8)
+        for slot in range(self.limit):
+            if cache.add(self._key(slot), token, timeout=self.lease):
+                return slot, token
+        return None
+
+    def release(self, handle):
+        slot, token = handle
+        if cache.get(self._key(slot)) == token:
+            cache.delete(self._key(slot))
+
+    def in_use(self):
+        return sum(1 for value in cache.get_many([self._key(slot) for slot in range(self.limit)]).values() if value)
+
+
+def get_bulkhead(operation):
+    limits = dict(BULKHEADS, **getattr(settings, 'PROXMOX_BULKHEADS', {}))
+    return Bulkhead(operation, limits[operation])
+
+
+@contextmanager
+def proxmox_guard(operation):
+    """
+    Hold a bulkhead slot for `operation` while talking to Proxmox.
+    Raises ProxmoxUnavailable instead of blocking when the circuit is open
+    or the bulkhead is full; callers re-queue themselves with its countdown.
+    """
+    if proxmox_breaker.state() == OPEN:
+        raise CircuitOpenError(f"Proxmox circuit '{proxmox_breaker.name}' is open", proxmox_breaker.retry_after())
+
+    bulkhead = get_bulkhead(operation)
+    handle = bulkhead.acquire()
+    if handle is None:
+        raise ProxmoxUnavailable(f"Bulkhead '{operation}' is full ({bulkhead.limit} running)", BULKHEAD_RETRY)
+    try:
+        yield
+    finally:
+        bulkhead.release(handle)
+
+
+proxmox_breaker = CircuitBreaker()
@@ -0,0 +1,47 @@
+"""
+Shared cache of VM configs, keyed by VMID.
+
+Provisioning steps, lock waits and status pages read the same VM's config
+many times a second. An unlocked config is kept in the shared cache for a
+short TTL, together with its digest, so repeated reads need no API call.
+
+Writes carry the cached digest. If the config changed behind the cache's
+back, Proxmox rejects the write as a digest mismatch; the entry is dropped
+and the change is retried against a fresh read. A stale entry therefore
+costs one extra round-trip, never a lost update. Every ProxmoxManager
+operation that changes or locks a config drops its entry.
+
+Locked configs and missing VMs are never cached, so waiting for a lock
+always polls Proxmox.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+CONFIG_CACHE_PREFIX = 'proxmox:vm-config:'
+
+# Seconds a config is served from the cache
+CONFIG_TTL = 30
+
+
+def _key(vmid):
+    return f'{CONFIG_CACHE_PREFIX}{vmid}'
+
+
+def get_cached_config(vmid, node):
+    """The cached config of a VM on `node`, or None"""
+    entry = cache.get(_key(vmid))
+    if entry and entry['node'] == node:
+        return dict(entry['config'])
+    return None
+
+
+def store_config(vmid, node, config):
+    if config is None or 'lock' in config:
+        invalidate_config(vmid)
+        return
+    ttl = getattr(settings, 'PROXMOX_CONFIG_CACHE_TTL', CONFIG_TTL)
+    cache.set(_key(vmid), {'node': node, 'config': config}, timeout=ttl)
+
+
+def invalidate_config(*vmids):
+    cache.delete_many([_key(vmid) for vmid in vmids])
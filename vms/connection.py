@@ -0,0 +1,117 @@
+from proxmoxer import ProxmoxAPI
+from django.conf import settings
+from vms.circuit import OPEN, guard, proxmox_breaker
+from vms.metrics import instrument
+import requests
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Proxmox tickets are valid for 2 hours. proxmoxer renews them on use after an
+# hour, but a connection that sat idle longer than that would fail on its next
+# call, so we log in again well before the hard expiry.
+TICKET_MAX_AGE = 90 * 60
+
+# After a failed login, don't retry for this many seconds. A burst of tasks
+# hitting an unreachable host would otherwise each pay the full timeout.
+LOGIN_RETRY_DELAY = 10
+
+
+class _Connection:
+    def __init__(self, api):
+        self.api = api
+        self.authenticated_at = time.monotonic()
+
+    @property
+    def expired(self):
+        max_age = getattr(settings, 'PROXMOX_TICKET_MAX_AGE', TICKET_MAX_AGE)
+        return (time.monotonic() - self.authenticated_at) >= max_age
+
+
+class ProxmoxConnectionPool:
+    """
+    Process-wide registry of authenticated Proxmox API connections.
+
+    One ProxmoxAPI (and its keep-alive HTTP session) is kept per host/user and
+    shared by every ProxmoxManager in the process. Logging in happens on first
+    use, not when a manager is created.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._failed_logins = {}
+        self._pid = os.getpid()
+
+    def get(self, host, user, password, verify_ssl=False, timeout=60):
+        """Return a logged-in ProxmoxAPI, or None if login failed"""
+        self._check_pid()
+        key = (host, user, verify_ssl)
+
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection and not connection.expired:
+                return connection.api
+
+            retry_at = self._failed_logins.get(key)
+            if retry_at and time.monotonic() < retry_at:
+                return None
+            if proxmox_breaker.state() == OPEN:
+                return None
+
+            try:
+                api = instrument(guard(ProxmoxAPI(
+                    host,
+                    user=user,
+                    password=password,
+                    verify_ssl=verify_ssl,
+                    timeout=timeout
+                )))
+            except Exception as e:
+                logger.error(f"Failed to connect to Proxmox: {str(e)}")
+                if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+                    proxmox_breaker.record_failure()
+                self._connections.pop(key, None)
+                self._failed_logins[key] = time.monotonic() + LOGIN_RETRY_DELAY
+                return None
+
+            if connection:
+                logger.info(f"Renewed Proxmox ticket for {user}@{host}")
+            else:
+                logger.info(f"Connected to Proxmox at {host}")
+            self._connections[key] = _Connection(api)
+            self._failed_logins.pop(key, None)
+            return api
+
+    def invalidate(self, host=None, user=None):
+        """Drop cached connections so the next call logs in again"""
+        with self._lock:
+            for key in list(self._connections):
+                if (host is None or key[0] == host) and (user is None or key[1] == user):
+                    del self._connections[key]
+
+    def reset(self):
+        """
+        Forget every connection without closing it.
+
+        Used in forked children: the sockets belong to the parent process, so
+        they are dropped rather than closed.
+        """
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._failed_logins = {}
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # Fallback for fork paths that skip the at-fork hook
+        if self._pid != os.getpid():
+            self.reset()
+
+
+connection_pool = ProxmoxConnectionPool()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=connection_pool.reset)
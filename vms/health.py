@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.cache import cache
+from vms.circuit import OPEN, CircuitOpenError, proxmox_breaker
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CACHE_KEY = 'proxmox:health'
+REFRESH_LOCK_KEY = 'proxmox:health:refresh'
+
+# Seconds a health check is trusted before provisioning probes again.
+# The beat task refreshes it more often than this, so tasks normally never probe.
+HEALTH_TTL = 60
+# Seconds a probe may hold the refresh lock; also how long others wait for it
+PROBE_LOCK_TIMEOUT = 10
+
+
+def get_health():
+    """
+    Last recorded health check, or None if there hasn't been one.
+    Reads only the cache, so it is free to call from views and tasks.
+    """
+    return cache.get(HEALTH_CACHE_KEY)
+
+
+def is_fresh(health, max_age=None):
+    if max_age is None:
+        max_age = getattr(settings, 'PROXMOX_HEALTH_TTL', HEALTH_TTL)
+    return health is not None and (time.time() - health['checked_at']) < max_age
+
+
+def probe(proxmox=None):
+    """
+    Check the cluster (/version and /nodes) and record the result.
+    A failed check keeps the last known version and node list.
+    Raises CircuitOpenError without touching the cache while the breaker is open.
+    """
+    if proxmox_breaker.state() == OPEN:
+        raise CircuitOpenError(f"Proxmox circuit '{proxmox_breaker.name}' is open", proxmox_breaker.retry_after())
+
+    if proxmox is None:
+        from vms.proxmox import ProxmoxManager
+        proxmox = ProxmoxManager()
+
+    previous = get_health() or {}
+    health = {
+        'checked_at': time.time(),
+        'healthy': False,
+        'error': '',
+        'version': previous.get('version'),
+        'nodes': previous.get('nodes', []),
+        'last_healthy_at': previous.get('last_healthy_at'),
+    }
+
+    try:
+        if not proxmox.proxmox:
+            raise Exception('Proxmox not configured or login failed')
+        version = proxmox.proxmox.version.get()
+        nodes = proxmox.proxmox.nodes.get()
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        health['error'] = str(e)
+        logger.warning(f"Proxmox health check failed: {str(e)}")
+    else:
+        online = [node for node in nodes if node.get('status', 'online') == 'online']
+        health.update(
+            healthy=bool(online),
+            error='' if online else 'No online nodes',
+            version=version.get('version'),
+            nodes=[{'node': node['node'], 'status': node.get('status', 'unknown')} for node in nodes],
+            last_healthy_at=health['checked_at'] if online else health['last_healthy_at']
+        )
+
+    # Kept after it goes stale so the dashboard can show the last known state
+    cache.set(HEALTH_CACHE_KEY, health, timeout=None)
+    return health
+
+
+def ensure_healthy(proxmox=None, max_age=None):
+    """
+    Return the cached health if it is fresh and healthy, otherwise probe.
+    Only one process probes at a time. The rest use the cached copy meanwhile
+    if it is healthy; an unhealthy one may be out of date, so they raise
+    CircuitOpenError and come back once the probe is done.
+    """
+    health = get_health()
+    if health and health['healthy'] and is_fresh(health, max_age):
+        return health
+
+    locked = cache.add(REFRESH_LOCK_KEY, 1, timeout=PROBE_LOCK_TIMEOUT)
+    if not locked and health:
+        if health['healthy']:
+            return health
+        raise CircuitOpenError('Proxmox health check in progress', PROBE_LOCK_TIMEOUT)
+    try:
+        return probe(proxmox)
+    finally:
+        if locked:
+            cache.delete(REFRESH_LOCK_KEY)
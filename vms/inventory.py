@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.core.cache import cache
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_CACHE_KEY = 'proxmox:cluster-resources'
+REFRESH_LOCK_KEY = 'proxmox:cluster-resources:refresh'
+
+# Seconds a snapshot is considered fresh
+SNAPSHOT_TTL = 15
+# A stale snapshot may be served for this many more seconds while another
+# process refreshes it
+STALE_GRACE = 30
+
+
+def _fetch_resources(proxmox):
+    if not proxmox.proxmox:
+        return None
+    try:
+        return proxmox.proxmox.cluster.resources.get()
+    except Exception as e:
+        logger.error(f"Failed to get cluster resources: {str(e)}")
+        return None
+
+
+def get_cluster_resources(proxmox=None, max_age=None):
+    """
+    Return the /cluster/resources list (nodes, VMs and storage) from the
+    shared cache, refreshing it with a single API call when it is stale.
+
+    The cache is shared across processes, so web workers, Celery workers and
+    management commands all reuse the same snapshot. With max_age=0 a stale
+    copy is never returned: the caller gets a fresh fetch or, if it fails, [].
+    """
+    if max_age is None:
+        max_age = getattr(settings, 'PROXMOX_SNAPSHOT_TTL', SNAPSHOT_TTL)
+
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+    now = time.time()
+    if snapshot and (now - snapshot['fetched_at']) < max_age:
+        return snapshot['resources']
+
+    # Only one process refreshes; the rest keep using the stale copy, unless
+    # the caller acts on what it gets and fetches for itself
+    locked = cache.add(REFRESH_LOCK_KEY, 1, timeout=10)
+    if snapshot and not locked and max_age > 0:
+        return snapshot['resources']
+
+    if proxmox is None:
+        from vms.proxmox import ProxmoxManager
+        proxmox = ProxmoxManager()
+
+    try:
+        resources = _fetch_resources(proxmox)
+        if resources is None:
+            return snapshot['resources'] if snapshot and max_age > 0 else []
+
+        cache.set(
+            SNAPSHOT_CACHE_KEY,
+            {'fetched_at': time.time(), 'resources': resources},
+            timeout=max_age + STALE_GRACE
+        )
+        return resources
+    finally:
+        if locked:
+            cache.delete(REFRESH_LOCK_KEY)
+
+
+def get_fleet_snapshot(proxmox=None, max_age=None):
+    """Return {vmid: resource} for every VM in the cluster"""
+    return {
+        item['vmid']: item
+        for item in get_cluster_resources(proxmox, max_age)
+        if item.get('type') == 'qemu' and 'vmid' in item
+    }
+
+
+def get_vm_statuses(vmids, proxmox=None, max_age=None):
+    """
+    Return {vmid: status} for the requested VMs from one cluster snapshot.
+    VMs that don't exist in the cluster are reported as 'missing', and every
+    VM as 'unknown' when no snapshot could be fetched.
+    """
+    resources = get_cluster_resources(proxmox, max_age)
+    # A cluster always lists its nodes; nothing at all means the fetch failed
+    absent = 'missing' if resources else 'unknown'
+    fleet = {
+        item['vmid']: item
+        for item in resources
+        if item.get('type') == 'qemu' and 'vmid' in item
+    }
+    return {
+        vmid: fleet[vmid].get('status', 'unknown') if vmid in fleet else absent
+        for vmid in vmids
+    }
+
+
+def invalidate_fleet_snapshot():
+    """Drop the cached snapshot, e.g. after a VM is created or deleted"""
+    cache.delete(SNAPSHOT_CACHE_KEY)
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from core.models import Service
+from vms.proxmox import ProxmoxManager
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Parallel guest-agent queries per sweep
+RESOLVER_CONCURRENCY = 16
+
+# Send the credentials email without an IP once a VM has been waiting this long
+IP_TIMEOUT = 15 * 60
+
+
+def get_services_awaiting_ip():
+    return Service.objects.filter(
+        status='active',
+        vm_id__isnull=False,
+        ip_address__isnull=True
+    ).select_related('user', 'plan')
+
+
+def _lookup(service):
+    try:
+        return service, ProxmoxManager(node=service.node).get_vm_ip(service.vm_id)
+    except Exception as e:
+        logger.debug(f"IP lookup failed for VM {service.vm_id}: {str(e)}")
+        return service, None
+
+
+def resolve_pending_ips():
+    """
+    Query the guest agent of every service still waiting for an address in
+    one concurrent sweep, store what comes back and send the credentials email.
+    Returns (resolved, timed_out) counts.
+    """
+    services = list(get_services_awaiting_ip())
+    if not services:
+        return 0, 0
+
+    concurrency = getattr(settings, 'PROXMOX_IP_RESOLVER_CONCURRENCY', RESOLVER_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(services))) as executor:
+        results = list(executor.map(_lookup, services))
+
+    from core.tasks import send_service_credentials_email
+
+    resolved = 0
+    timed_out = 0
+    deadline = timezone.now() - timedelta(seconds=getattr(settings, 'PROXMOX_IP_TIMEOUT', IP_TIMEOUT))
+
+    for service, ip in results:
+        if ip:
+            service.ip_address = ip
+            service.save(update_fields=['ip_address'])
+            logger.info(f"VM {service.vm_id} got IP: {ip}")
+            resolved += 1
+            if service.credentials_sent_at is None:
+                send_service_credentials_email.delay(service.id)
+        elif service.credentials_sent_at is None and service.activated_at and service.activated_at < deadline:
+            # Don't keep the customer waiting forever; the address follows on the dashboard
+            logger.warning(f"VM {service.vm_id} has no IP after activation, sending credentials anyway")
+            timed_out += 1
+            send_service_credentials_email.delay(service.id)
+
+    return resolved, timed_out
@@ -0,0 +1,286 @@
+"""
+Proxmox API instrumentation.
+
+Every request made through a pooled connection is timed and counted by
+endpoint, HTTP verb and node. Waits (task completion, VM locks) and retries
+are recorded alongside, so it's visible where provisioning time goes.
+
+Each process keeps its own registry and periodically publishes a snapshot to
+the cache; the scrape endpoint merges them.
+"""
+from django.conf import settings
+from django.core.cache import cache
+import os
+import re
+import socket
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+# How often a process pushes its snapshot to the cache, and how long a
+# snapshot outlives a process that stopped publishing
+PUBLISH_INTERVAL = 15
+SNAPSHOT_TTL = 120
+
+PROCESS_INDEX_KEY = 'proxmox:metrics:processes'
+
+_NODE_RE = re.compile(r'^/nodes/[^/]+')
+_VMID_RE = re.compile(r'/(qemu|lxc)/\d+')
+_UPID_RE = re.compile(r'/tasks/UPID:[^/]+')
+
+
+def normalize_endpoint(path):
+    """
+    Turn a request path into a low-cardinality label and pull out the node:
+    '/api2/json/nodes/pve1/qemu/101/config' -> ('/nodes/{node}/qemu/{vmid}/config', 'pve1')
+    """
+    path = path.split('?')[0]
+    if path.startswith('/api2/json'):
+        path = path[len('/api2/json'):]
+    path = path.rstrip('/') or '/'
+
+    node = ''
+    match = _NODE_RE.match(path)
+    if match:
+        node = match.group(0).split('/')[2]
+        path = '/nodes/{node}' + path[match.end():]
+    path = _VMID_RE.sub(lambda m: f'/{m.group(1)}/{{vmid}}', path)
+    path = _UPID_RE.sub('/tasks/{upid}', path)
+    return path, node
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'count': self.count, 'sum': self.sum}
+
+
+class ApiMetrics:
+    """Thread-safe in-process registry of Proxmox API metrics"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        # (method, endpoint, node) -> _Histogram
+        self._requests = {}
+        # (method, endpoint, node, error class) -> count
+        self._errors = {}
+        # (operation, reason) -> count
+        self._retries = {}
+        # kind -> _Histogram
+        self._waits = {}
+        self._last_publish = 0
+        self._pid = os.getpid()
+
+    def observe_request(self, method, path, seconds, error=None):
+        """Record one API call. error is a short class like 'http_500' or 'ConnectTimeout'"""
+        endpoint, node = normalize_endpoint(path)
+        key = (method.upper(), endpoint, node)
+        with self._lock:
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = _Histogram()
+            histogram.observe(seconds)
+            if error:
+                error_key = key + (error,)
+                self._errors[error_key] = self._errors.get(error_key, 0) + 1
+        self._maybe_publish()
+
+    def observe_wait(self, kind, seconds):
+        """Record time spent waiting on Proxmox, e.g. kind='task_qmclone' or 'lock'"""
+        with self._lock:
+            histogram = self._waits.get(kind)
+            if histogram is None:
+                histogram = self._waits[kind] = _Histogram()
+            histogram.observe(seconds)
+
+    def record_retry(self, operation, reason):
+        with self._lock:
+            key = (operation, reason)
+            self._retries[key] = self._retries.get(key, 0) + 1
+
+    def snapshot(self):
+        """Plain-data copy of the registry"""
+        with self._lock:
+            return {
+                'requests': [list(key) + [histogram.to_dict()] for key, histogram in self._requests.items()],
+                'errors': [list(key) + [count] for key, count in self._errors.items()],
+                'retries': [list(key) + [count] for key, count in self._retries.items()],
+                'waits': [[kind, histogram.to_dict()] for kind, histogram in self._waits.items()],
+            }
+
+    def _process_key(self):
+        return f"proxmox:metrics:{socket.gethostname()}:{self._pid}"
+
+    def _maybe_publish(self):
+        now = time.monotonic()
+        if now - self._last_publish < PUBLISH_INTERVAL:
+            return
+        self._last_publish = now
+        self.publish()
+
+    def publish(self):
+        """Push this process's snapshot to the cache for the scrape endpoint"""
+        if self._pid != os.getpid():
+            self.reset()
+        key = self._process_key()
+        try:
+            cache.set(key, self.snapshot(), timeout=SNAPSHOT_TTL)
+            index = cache.get(PROCESS_INDEX_KEY) or []
+            if key not in index:
+                cache.set(PROCESS_INDEX_KEY, index + [key], timeout=None)
+        except Exception as e:
+            logger.debug(f"Could not publish Proxmox metrics: {str(e)}")
+
+
+def collect_snapshots():
+    """Snapshots of every live process, with this process's taken fresh"""
+    api_metrics.publish()
+    index = cache.get(PROCESS_INDEX_KEY) or []
+    snapshots = cache.get_many(index)
+    live = [key for key in index if key in snapshots]
+    if len(live) != len(index):
+        # Processes that stopped publishing drop out of the index
+        cache.set(PROCESS_INDEX_KEY, live, timeout=None)
+    return list(snapshots.values())
+
+
+def merge_snapshots(snapshots):
+    """Sum per-process snapshots into one"""
+    requests, errors, retries, waits = {}, {}, {}, {}
+
+    def add_histogram(target, key, histogram):
+        merged = target.setdefault(key, {'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'sum': 0.0})
+        merged['buckets'] = [a + b for a, b in zip(merged['buckets'], histogram['buckets'])]
+        merged['count'] += histogram['count']
+        merged['sum'] += histogram['sum']
+
+    for snapshot in snapshots:
+        for *key, histogram in snapshot.get('requests', []):
+            add_histogram(requests, tuple(key), histogram)
+        for *key, count in snapshot.get('errors', []):
+            errors[tuple(key)] = errors.get(tuple(key), 0) + count
+        for *key, count in snapshot.get('retries', []):
+            retries[tuple(key)] = retries.get(tuple(key), 0) + count
+        for kind, histogram in snapshot.get('waits', []):
+            add_histogram(waits, kind, histogram)
+
+    return {'requests': requests, 'errors': errors, 'retries': retries, 'waits': waits}
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{_labels(**labels, le=bound)}}} {cumulative}')
+    lines.append(f'{name}_bucket{{{_labels(**labels, le="+Inf")}}} {histogram["count"]}')
+    lines.append(f'{name}_sum{{{_labels(**labels)}}} {histogram["sum"]:.6f}')
+    lines.append(f'{name}_count{{{_labels(**labels)}}} {histogram["count"]}')
+    return lines
+
+
+def render_prometheus(merged):
+    """Prometheus text exposition of merged metrics"""
+    lines = [
+        '# HELP proxmox_api_request_seconds Proxmox API request latency',
+        '# TYPE proxmox_api_request_seconds histogram',
+    ]
+    for (method, endpoint, node), histogram in sorted(merged['requests'].items()):
+        lines += _histogram_lines('proxmox_api_request_seconds', {'method': method, 'endpoint': endpoint, 'node': node}, histogram)
+
+    lines += [
+        '# HELP proxmox_api_errors_total Failed Proxmox API requests by error class',
+        '# TYPE proxmox_api_errors_total counter',
+    ]
+    for (method, endpoint, node, error), count in sorted(merged['errors'].items()):
+        lines.append(f'proxmox_api_errors_total{{{_labels(method=method, endpoint=endpoint, node=node, error=error)}}} {count}')
+
+    lines += [
+        '# HELP proxmox_retries_total Operations retried after a conflict or failure',
+        '# TYPE proxmox_retries_total counter',
+    ]
+    for (operation, reason), count in sorted(merged['retries'].items()):
+        lines.append(f'proxmox_retries_total{{{_labels(operation=operation, reason=reason)}}} {count}')
+
+    lines += [
+        '# HELP proxmox_wait_seconds Time spent waiting on Proxmox tasks and locks',
+        '# TYPE proxmox_wait_seconds histogram',
+    ]
+    for kind, histogram in sorted(merged['waits'].items()):
+        lines += _histogram_lines('proxmox_wait_seconds', {'kind': kind}, histogram)
+
+    return '\n'.join(lines) + '\n'
+
+
+class InstrumentedSession:
+    """
+    Wraps the requests.Session inside a ProxmoxAPI so every call is measured.
+    All other attributes are passed through to the real session.
+    """
+
+    def __init__(self, session, registry):
+        self._session = session
+        self._registry = registry
+
+    def request(self, method, url, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self._session.request(method, url, *args, **kwargs)
+        except Exception as e:
+            self._registry.observe_request(method, _url_path(url), time.perf_counter() - started, type(e).__name__)
+            raise
+        error = f'http_{response.status_code}' if response.status_code >= 400 else None
+        self._registry.observe_request(method, _url_path(url), time.perf_counter() - started, error)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+def _url_path(url):
+    # 'https://host:8006/api2/json/nodes/pve' -> '/api2/json/nodes/pve'
+    if '://' in url:
+        url = url.split('://', 1)[1]
+        url = url[url.find('/'):] if '/' in url else '/'
+    return url
+
+
+def instrument(api, registry=None):
+    """Route a ProxmoxAPI's requests through the metrics registry"""
+    if not getattr(settings, 'PROXMOX_METRICS_ENABLED', True):
+        return api
+    store = getattr(api, '_store', None)
+    if store and 'session' in store and not isinstance(store['session'], InstrumentedSession):
+        store['session'] = InstrumentedSession(store['session'], registry or api_metrics)
+    return api
+
+
+api_metrics = ApiMetrics()
+
+if hasattr(os, 'register_at_fork'):
+    # A child starts counting from zero under its own process key
+    os.register_at_fork(after_in_child=api_metrics.reset)
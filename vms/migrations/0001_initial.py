@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 07:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0003_plan_warm_pool_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WarmVM',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node', models.CharField(max_length=100)),
+                ('vm_id', models.IntegerField(blank=True, null=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('provisioning', 'Provisioning'), ('ready', 'Ready'), ('claimed', 'Claimed'), ('failed', 'Failed')], default='provisioning', max_length=20)),
+                ('error_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='warm_vms', to='core.plan')),
+                ('service', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='warm_vm', to='core.service')),
+            ],
+            options={
+                'db_table': 'warm_vms',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['plan', 'status', 'node'], name='warm_vms_plan_id_d0aa90_idx')],
+            },
+        ),
+    ]
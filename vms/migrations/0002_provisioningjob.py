@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-17 07:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_service_clone_mode'),
+        ('vms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProvisioningJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('waiting', 'Waiting'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('step', models.CharField(default='prepare', max_length=30)),
+                ('node', models.CharField(blank=True, max_length=100)),
+                ('vm_id', models.IntegerField(blank=True, null=True)),
+                ('template_id', models.IntegerField(blank=True, null=True)),
+                ('linked', models.BooleanField(default=False)),
+                ('password', models.CharField(blank=True, max_length=255)),
+                ('upid', models.CharField(blank=True, max_length=255)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('step_started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('service', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='provisioning_job', to='core.service')),
+            ],
+            options={
+                'db_table': 'provisioning_jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
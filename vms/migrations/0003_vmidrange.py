@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-17 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms', '0002_provisioningjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VMIDRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('start', models.IntegerField()),
+                ('end', models.IntegerField()),
+                ('next_vmid', models.IntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'vmid_ranges',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 07:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_service_credentials_sent_at'),
+        ('vms', '0003_vmidrange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiskReclamation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vm_id', models.IntegerField()),
+                ('node', models.CharField(max_length=100)),
+                ('storage', models.CharField(blank=True, max_length=100)),
+                ('disk_gb', models.FloatField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('purging', 'Purging'), ('reclaimed', 'Reclaimed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('upid', models.CharField(blank=True, max_length=255)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('reclaimed_at', models.DateTimeField(blank=True, null=True)),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='disk_reclamations', to='core.service')),
+            ],
+            options={
+                'db_table': 'disk_reclamations',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'storage'], name='disk_reclam_status_c818b2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms', '0004_diskreclamation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource_type', models.CharField(choices=[('vm', 'VM'), ('node', 'Node')], max_length=4)),
+                ('resource_id', models.CharField(max_length=100)),
+                ('resolution', models.IntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.IntegerField(default=1)),
+                ('cpu', models.FloatField(default=0)),
+                ('cpu_max', models.FloatField(default=0)),
+                ('mem', models.BigIntegerField(default=0)),
+                ('mem_max', models.BigIntegerField(default=0)),
+                ('maxmem', models.BigIntegerField(default=0)),
+                ('disk', models.BigIntegerField(default=0)),
+                ('maxdisk', models.BigIntegerField(default=0)),
+                ('netin', models.BigIntegerField(default=0)),
+                ('netout', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'resource_metrics',
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='resource_me_resolut_b5d867_idx')],
+                'unique_together': {('resource_type', 'resource_id', 'resolution', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 08:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_plan_backups'),
+        ('vms', '0005_resourcemetric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Backup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vm_id', models.IntegerField()),
+                ('node', models.CharField(max_length=100)),
+                ('storage', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('upid', models.CharField(blank=True, max_length=255)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backups', to='core.service')),
+            ],
+            options={
+                'db_table': 'backups',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'storage'], name='backups_status_da5217_idx'), models.Index(fields=['service', 'status'], name='backups_service_4e4f98_idx')],
+            },
+        ),
+    ]
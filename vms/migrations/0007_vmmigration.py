@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 08:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_plan_backups'),
+        ('vms', '0006_backup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VMMigration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vm_id', models.IntegerField()),
+                ('source', models.CharField(max_length=100)),
+                ('target', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('reason', models.CharField(blank=True, max_length=255)),
+                ('estimated_seconds', models.FloatField(default=0)),
+                ('upid', models.CharField(blank=True, max_length=255)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='migrations', to='core.service')),
+            ],
+            options={
+                'db_table': 'vm_migrations',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status'], name='vm_migratio_status_0b2a1e_idx'), models.Index(fields=['vm_id', 'created_at'], name='vm_migratio_vm_id_1e6230_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-17 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms', '0007_vmmigration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VMTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('os_image', models.CharField(max_length=100)),
+                ('disk_gb', models.IntegerField()),
+                ('source_template_id', models.IntegerField()),
+                ('vm_id', models.IntegerField(blank=True, null=True)),
+                ('node', models.CharField(max_length=100)),
+                ('storage', models.CharField(blank=True, max_length=100)),
+                ('shared', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('building', 'Building'), ('ready', 'Ready'), ('failed', 'Failed')], default='building', max_length=20)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'vm_templates',
+                'ordering': ['os_image', 'disk_gb'],
+                'indexes': [models.Index(fields=['os_image', 'status', 'disk_gb'], name='vm_template_os_imag_cf2c8e_idx')],
+                'unique_together': {('os_image', 'disk_gb', 'node')},
+            },
+        ),
+    ]
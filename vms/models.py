@@ -1,3 +1,280 @@
 from django.db import models
 
-# Create your models here.
+
+class WarmVM(models.Model):
+    """A pre-cloned, sized and booted VM waiting to be handed to a new service"""
+    STATUS_CHOICES = [
+        ('provisioning', 'Provisioning'),
+        ('ready', 'Ready'),
+        ('claimed', 'Claimed'),
+        ('failed', 'Failed'),
+    ]
+
+    plan = models.ForeignKey('core.Plan', on_delete=models.CASCADE, related_name='warm_vms')
+    node = models.CharField(max_length=100)
+    vm_id = models.IntegerField(null=True, blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='provisioning')
+    service = models.OneToOneField('core.Service', on_delete=models.SET_NULL, null=True, blank=True, related_name='warm_vm')
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'warm_vms'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['plan', 'status', 'node']),
+        ]
+
+    def __str__(self):
+        return f"{self.plan.name} - {self.node} - {self.vm_id or 'pending'} ({self.status})"
+
+
+class ProvisioningJob(models.Model):
+    """
+    Persisted progress of a VM build for one service.
+
+    Each step runs as a short Celery task; the job records where it got to so
+    a crash or failure resumes from the same step instead of starting over.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('waiting', 'Waiting'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    service = models.OneToOneField('core.Service', on_delete=models.CASCADE, related_name='provisioning_job')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    step = models.CharField(max_length=30, default='prepare')
+    node = models.CharField(max_length=100, blank=True)
+    vm_id = models.IntegerField(null=True, blank=True)
+    template_id = models.IntegerField(null=True, blank=True)
+    linked = models.BooleanField(default=False)
+    password = models.CharField(max_length=255, blank=True)
+    # Proxmox task (UPID) the current step is waiting on
+    upid = models.CharField(max_length=255, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    step_started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'provisioning_jobs'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Service {self.service_id} - {self.step} ({self.status})"
+
+
+class VMIDRange(models.Model):
+    """
+    Cluster-wide VMID counter. Processes reserve blocks of IDs from it under a
+    row lock, so concurrent provisions never receive the same VMID.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    start = models.IntegerField()
+    end = models.IntegerField()
+    next_vmid = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'vmid_ranges'
+
+    def __str__(self):
+        return f"{self.name}: {self.start}-{self.end} (next {self.next_vmid})"
+
+
+class DiskReclamation(models.Model):
+    """
+    A terminated service's VM waiting to have its disks destroyed.
+
+    Terminations only stop the VM; the purge runs later in throttled
+    off-peak sweeps so it doesn't compete with clones for storage I/O.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('purging', 'Purging'),
+        ('reclaimed', 'Reclaimed'),
+        ('failed', 'Failed'),
+    ]
+
+    service = models.ForeignKey('core.Service', on_delete=models.SET_NULL, null=True, blank=True, related_name='disk_reclamations')
+    vm_id = models.IntegerField()
+    node = models.CharField(max_length=100)
+    storage = models.CharField(max_length=100, blank=True)
+    # Capacity the purge gives back
+    disk_gb = models.FloatField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Proxmox destroy task (UPID) while purging
+    upid = models.CharField(max_length=255, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    reclaimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'disk_reclamations'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'storage']),
+        ]
+
+    def __str__(self):
+        return f"VM {self.vm_id} on {self.node}/{self.storage or '?'} ({self.status})"
+
+
+class ResourceMetric(models.Model):
+    """
+    One time-series point for a VM or node.
+
+    Raw samples and their 5-minute, hourly and daily rollups share this table,
+    told apart by `resolution` (the bucket length in seconds).
+    """
+    RESOURCE_TYPES = [
+        ('vm', 'VM'),
+        ('node', 'Node'),
+    ]
+
+    resource_type = models.CharField(max_length=4, choices=RESOURCE_TYPES)
+    # VMID for VMs, node name for nodes
+    resource_id = models.CharField(max_length=100)
+    resolution = models.IntegerField()
+    bucket = models.DateTimeField()
+    samples = models.IntegerField(default=1)
+    # CPU as a fraction of the allocated cores
+    cpu = models.FloatField(default=0)
+    cpu_max = models.FloatField(default=0)
+    mem = models.BigIntegerField(default=0)
+    mem_max = models.BigIntegerField(default=0)
+    maxmem = models.BigIntegerField(default=0)
+    disk = models.BigIntegerField(default=0)
+    maxdisk = models.BigIntegerField(default=0)
+    # Bytes transferred during the bucket
+    netin = models.BigIntegerField(default=0)
+    netout = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'resource_metrics'
+        unique_together = [('resource_type', 'resource_id', 'resolution', 'bucket')]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.resource_type} {self.resource_id} @ {self.bucket} ({self.resolution}s)"
+
+
+class Backup(models.Model):
+    """
+    One vzdump of a service's VM. The scheduler queues it from the plan's
+    schedule; the sweep starts it once its node and storage have a free slot
+    inside the backup window.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    service = models.ForeignKey('core.Service', on_delete=models.CASCADE, related_name='backups')
+    vm_id = models.IntegerField()
+    node = models.CharField(max_length=100)
+    storage = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    # Proxmox vzdump task (UPID) while running
+    upid = models.CharField(max_length=255, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'backups'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'storage']),
+            models.Index(fields=['service', 'status']),
+        ]
+
+    def __str__(self):
+        return f"VM {self.vm_id} to {self.storage} ({self.status})"
+
+
+class VMMigration(models.Model):
+    """A live migration started by the rebalancer to take load off a hot node"""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    service = models.ForeignKey('core.Service', on_delete=models.SET_NULL, null=True, blank=True, related_name='migrations')
+    vm_id = models.IntegerField()
+    source = models.CharField(max_length=100)
+    target = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    # What made the source node hot, e.g. "cpu 0.93"
+    reason = models.CharField(max_length=255, blank=True)
+    # Seconds the cost model expected the migration to take
+    estimated_seconds = models.FloatField(default=0)
+    # Proxmox migrate task (UPID) while running
+    upid = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'vm_migrations'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status']),
+            models.Index(fields=['vm_id', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"VM {self.vm_id} {self.source} -> {self.target} ({self.status})"
+
+
+class VMTemplate(models.Model):
+    """
+    A template already sized for a disk size, cloned from an OS image's
+    base template, so VMs of plans with that disk need no resize.
+    """
+    STATUS_CHOICES = [
+        ('building', 'Building'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    os_image = models.CharField(max_length=100)
+    disk_gb = models.IntegerField()
+    # Base template the sized one was cloned from
+    source_template_id = models.IntegerField()
+    vm_id = models.IntegerField(null=True, blank=True)
+    node = models.CharField(max_length=100)
+    storage = models.CharField(max_length=100, blank=True)
+    # On shared storage the template can be cloned to any node, otherwise only on its own
+    shared = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='building')
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'vm_templates'
+        ordering = ['os_image', 'disk_gb']
+        unique_together = [['os_image', 'disk_gb', 'node']]
+        indexes = [
+            models.Index(fields=['os_image', 'status', 'disk_gb']),
+        ]
+
+    def __str__(self):
+        return f"{self.os_image} {self.disk_gb}GB on {self.node} - {self.vm_id or 'pending'} ({self.status})"
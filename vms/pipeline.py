@@ -0,0 +1,377 @@
+"""
+Step-based VM provisioning.
+
+A build is a sequence of short steps persisted on a ProvisioningJob:
+
+    prepare -> clone -> resize -> configure -> start -> finalize
+
+Each step either finishes (the job moves to the next step), asks to be run
+again after a delay (a Proxmox task or lock is still in progress), or raises.
+Nothing sleeps: waiting is done by re-scheduling the step with a countdown,
+so a worker is only busy for the few API calls a step makes. Config writes
+carry the digest of the config they were based on; a lock conflict or digest
+mismatch just means "check again later", not a failed attempt.
+
+Failed steps are retried with backoff. When retries run out the job is marked
+failed but keeps its VM and progress; resume_job() picks up at the same step.
+"""
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from vms.models import ProvisioningJob
+from vms.placement import place_service
+from proxmoxer.core import ResourceException
+from vms.proxmox import ProxmoxManager, is_lock_conflict, parse_disk_size
+from vms.vmids import vmid_allocator
+from vms.inventory import invalidate_fleet_snapshot
+from vms.config_cache import invalidate_config
+from vms.metrics import api_metrics
+from vms.circuit import CircuitOpenError
+from vms import catalog as template_catalog, health as cluster_health
+import secrets
+import logging
+
+logger = logging.getLogger(__name__)
+
+STEPS = ['prepare', 'clone', 'resize', 'configure', 'start', 'finalize']
+
+# Longest a step may keep waiting before it counts as a failed attempt
+STEP_TIMEOUTS = {
+    'clone': 600,
+    'resize': 300,
+    'configure': 120,
+    'start': 180,
+}
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 30
+MIN_POLL = 2
+MAX_POLL = 15
+
+
+class StepError(Exception):
+    pass
+
+
+def _poll_interval(job):
+    """Wait longer between checks the longer a step has been running"""
+    elapsed = (timezone.now() - job.step_started_at).total_seconds() if job.step_started_at else 0
+    return int(min(max(elapsed / 4, MIN_POLL), MAX_POLL))
+
+
+def _vm_name(job):
+    return f"vps-{job.service.user.username}-{job.vm_id}"
+
+
+def _wait_for_upid(job, proxmox):
+    """
+    Check the step's Proxmox task without blocking.
+    Returns None once it finished OK, a countdown while it's running.
+    """
+    status = proxmox.watcher.poll(job.upid)
+    if status is None:
+        return _poll_interval(job)
+    if status.get('exitstatus') != 'OK':
+        upid, job.upid = job.upid, ''
+        raise StepError(f"Task {upid} failed: {status.get('exitstatus')}")
+    job.upid = ''
+    return None
+
+
+def _conflict_wait(job):
+    """Countdown after Proxmox refused a change because the VM was busy"""
+    # The cached config (and its digest) is what was refused; the next run reads it fresh
+    invalidate_config(job.vm_id)
+    api_metrics.record_retry(f'step_{job.step}', 'lock_conflict')
+    return _poll_interval(job)
+
+
+def _locked(config):
+    return config is not None and 'lock' in config
+
+
+def step_prepare(job, proxmox):
+    """Check the cluster, pick a node, reserve a VMID and credentials"""
+    # Served from the shared health check; only probes if it is stale or failing
+    health = cluster_health.ensure_healthy(proxmox)
+    if not health['healthy']:
+        raise StepError(f"Proxmox connection failed: {health['error']}")
+
+    service = job.service
+    job.node = place_service(service)
+    proxmox.node = job.node
+
+    if job.vm_id is None:
+        job.vm_id = proxmox.get_next_vmid()
+    if not job.password:
+        job.password = proxmox.generate_password()
+
+    # A template already sized for the plan, when the catalog has one for this node
+    job.template_id, proxmox.template_node = template_catalog.choose_template(service.plan, node=job.node)
+    if not job.template_id:
+        raise StepError('PROXMOX_TEMPLATE_ID is not configured')
+    job.linked = getattr(settings, 'PROXMOX_LINKED_CLONES', False) and proxmox.supports_linked_clone(job.template_id)
+
+    logger.info(f"Provisioning VM {job.vm_id} for service {service.id} on {job.node}")
+    return None
+
+
+def step_clone(job, proxmox):
+    if job.upid:
+        return _wait_for_upid(job, proxmox)
+
+    # On a resume the clone may already have happened
+    config = proxmox.get_vm_config(job.vm_id)
+    if config is not None:
+        # Only our own clone carries this name; any other VM with the ID isn't ours to take over
+        if config.get('name') != _vm_name(job):
+            raise StepError(f"VMID {job.vm_id} is already taken by VM '{config.get('name')}'")
+        return _poll_interval(job) if _locked(config) else None
+
+    proxmox.template_node = template_catalog.get_template_node(job.template_id)
+    job.upid = proxmox.clone_template(job.template_id, job.vm_id, _vm_name(job), linked=job.linked)
+    return MIN_POLL
+
+
+def step_resize(job, proxmox):
+    if job.upid:
+        return _wait_for_upid(job, proxmox)
+
+    config = proxmox.get_vm_config(job.vm_id)
+    if config is None:
+        raise StepError(f"VM {job.vm_id} does not exist")
+    if _locked(config):
+        return _poll_interval(job)
+
+    if parse_disk_size(config) >= job.service.plan.disk_gb:
+        return None
+
+    try:
+        upid = proxmox.resize_disk(job.vm_id, job.service.plan.disk_gb, digest=config.get('digest'))
+    except ResourceException as e:
+        if is_lock_conflict(e):
+            return _conflict_wait(job)
+        raise
+    if upid:
+        job.upid = upid
+        return MIN_POLL
+    return None
+
+
+def step_configure(job, proxmox):
+    config = proxmox.get_vm_config(job.vm_id)
+    if config is None:
+        raise StepError(f"VM {job.vm_id} does not exist")
+    if _locked(config):
+        return _poll_interval(job)
+
+    plan = job.service.plan
+    try:
+        proxmox.configure_vm(job.vm_id, plan.cpu_cores, plan.ram_mb, job.password, digest=config.get('digest'))
+    except ResourceException as e:
+        if is_lock_conflict(e):
+            return _conflict_wait(job)
+        raise
+    return None
+
+
+def step_start(job, proxmox):
+    if job.upid:
+        return _wait_for_upid(job, proxmox)
+
+    if _locked(proxmox.get_vm_config(job.vm_id)):
+        return _poll_interval(job)
+    if proxmox.get_vm_status(job.vm_id) == 'running':
+        return None
+
+    try:
+        upid = proxmox.request_start(job.vm_id)
+    except ResourceException as e:
+        if is_lock_conflict(e):
+            return _conflict_wait(job)
+        raise
+    if upid:
+        job.upid = upid
+        return MIN_POLL
+    return None
+
+
+def step_finalize(job, proxmox):
+    """
+    Activate the service as soon as the VM is running.
+    The IP is usually not known yet; the periodic resolver fills it in and
+    sends the credentials email when the guest agent reports one.
+    """
+    from core.tasks import send_service_credentials_email
+
+    service = job.service
+    service.vm_id = job.vm_id
+    service.node = job.node
+    service.ip_address = proxmox.get_vm_ip(job.vm_id)
+    service.username = 'root'
+    service.password = job.password
+    service.status = 'active'
+    service.activated_at = timezone.now()
+    if job.linked:
+        service.clone_mode = 'linked'
+        service.promotion_status = 'pending'
+    service.save()
+
+    invalidate_fleet_snapshot()
+    logger.info(f"VM {job.vm_id} created successfully for service {service.id}")
+    if service.ip_address:
+        # Queued once advance() commits, so the worker sees the active service
+        transaction.on_commit(lambda: send_service_credentials_email.delay(service.id))
+    return None
+
+
+STEP_HANDLERS = {
+    'prepare': step_prepare,
+    'clone': step_clone,
+    'resize': step_resize,
+    'configure': step_configure,
+    'start': step_start,
+    'finalize': step_finalize,
+}
+
+
+@contextmanager
+def provisioning_lock(service_id):
+    """
+    Per-service lock shared by every worker (an atomic add in the cache).
+    Yields True if this caller holds it, False if another run already does.
+    """
+    key = f'provision:lock:{service_id}'
+    token = secrets.token_hex(8)
+    acquired = cache.add(key, token, timeout=settings.PROXMOX_PROVISION_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+def provisioning_started(service):
+    """
+    Why a new build must not start for this service, or None if it may.
+    The service's VM and its ProvisioningJob are the idempotency record: once
+    either exists, later runs have nothing to do. A failed job may be resumed.
+    """
+    if service.vm_id:
+        return f"service already has VM {service.vm_id}"
+    if service.status not in ('pending', 'active'):
+        return f"service is {service.status}"
+    job = ProvisioningJob.objects.filter(service=service).values('id', 'status').first()
+    if job and job['status'] != 'failed':
+        return f"provisioning job {job['id']} is {job['status']}"
+    return None
+
+
+def start_job(service):
+    """Create the job for a service, or resume the existing one"""
+    job, created = ProvisioningJob.objects.get_or_create(service=service)
+    if not created and job.status == 'failed':
+        resume_job(job)
+    return job
+
+
+def resume_job(job):
+    """Restart a failed job from the step it stopped at"""
+    job.status = 'running'
+    job.attempts = 0
+    job.last_error = ''
+    job.step_started_at = timezone.now()
+    job.save(update_fields=['status', 'attempts', 'last_error', 'step_started_at', 'updated_at'])
+    logger.info(f"Resuming provisioning of service {job.service_id} at step {job.step}")
+    return job
+
+
+def advance(job_id):
+    """
+    Run the job's current step once.
+
+    Returns 0 to run the next step straight away, a countdown in seconds to
+    run again later, or None when the job is finished, failed or already being
+    advanced by another worker.
+    """
+    if ProvisioningJob.objects.filter(id=job_id, step='prepare', vm_id__isnull=True).exists():
+        # Reserved outside the transaction below, whose rollback would
+        # otherwise undo the reservation of IDs this process goes on serving
+        vmid_allocator.reserve()
+
+    with transaction.atomic():
+        job = ProvisioningJob.objects.select_for_update(skip_locked=True).select_related(
+            'service__plan', 'service__user'
+        ).filter(id=job_id).first()
+        if job is None or job.status in ('completed', 'failed'):
+            return None
+
+        if job.step_started_at is None:
+            job.step_started_at = timezone.now()
+
+        proxmox = ProxmoxManager(node=job.node or None)
+        handler = STEP_HANDLERS[job.step]
+
+        try:
+            # Savepoint, so a database error inside the step still lets the
+            # failure be recorded on the job
+            with transaction.atomic():
+                countdown = handler(job, proxmox)
+            if countdown is not None:
+                elapsed = (timezone.now() - job.step_started_at).total_seconds()
+                if elapsed > STEP_TIMEOUTS.get(job.step, 300):
+                    raise StepError(f"Step {job.step} timed out after {int(elapsed)} seconds")
+        except CircuitOpenError as e:
+            # Not the step's fault; wait for the cluster without using up an attempt
+            logger.warning(f"Proxmox unavailable, step {job.step} of service {job.service_id} waits {e.countdown}s")
+            job.status = 'waiting'
+            job.step_started_at = timezone.now()
+            job.save()
+            return e.countdown
+        except Exception as e:
+            return _record_failure(job, e)
+
+        if countdown is not None:
+            job.status = 'waiting'
+            job.save()
+            return countdown
+
+        index = STEPS.index(job.step)
+        if index + 1 == len(STEPS):
+            job.status = 'completed'
+            job.finished_at = timezone.now()
+            job.save()
+            return None
+
+        job.step = STEPS[index + 1]
+        job.status = 'running'
+        job.attempts = 0
+        job.upid = ''
+        job.step_started_at = timezone.now()
+        job.save()
+        return 0
+
+
+def _record_failure(job, error):
+    job.attempts += 1
+    job.last_error = str(error)
+    logger.error(f"Provisioning step {job.step} failed for service {job.service_id} "
+                 f"(attempt {job.attempts}/{MAX_ATTEMPTS}): {error}")
+
+    if job.attempts < MAX_ATTEMPTS:
+        # Retry the same step; the timeout window starts again
+        api_metrics.record_retry(f'step_{job.step}', 'step_failed')
+        job.status = 'waiting'
+        job.step_started_at = timezone.now()
+        job.save()
+        return RETRY_BACKOFF * job.attempts
+
+    # Out of retries: keep the VM and progress so the job can be resumed
+    from core.tasks import send_vm_deployment_failed_email
+
+    job.status = 'failed'
+    job.save()
+    transaction.on_commit(lambda: send_vm_deployment_failed_email.delay(job.service_id, job.last_error))
+    return None
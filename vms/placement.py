@@ -0,0 +1,189 @@
+from django.conf import settings
+from django.db.models import Sum
+from vms.inventory import get_cluster_resources
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Storage types that can hold VM disks cloned from a template
+DISK_STORAGE_TYPES = ['dir', 'lvm', 'lvmthin', 'zfs', 'zfspool', 'rbd', 'nfs', 'cifs']
+
+
+class PlacementScheduler:
+    """
+    Picks the Proxmox node a new service should be created on.
+
+    Reads live usage from /cluster/resources and filters out nodes that can't
+    fit the plan. The remaining nodes are ranked by free CPU, RAM and storage
+    left after placement, multiplied by the per-node weight in
+    PROXMOX_NODE_WEIGHTS (a weight of 0 takes a node out of rotation).
+    While the plan's template is on local storage, only the node holding it
+    is a candidate, since Proxmox won't clone it anywhere else.
+    """
+
+    def __init__(self, proxmox=None):
+        if proxmox is None:
+            from vms.proxmox import ProxmoxManager
+            proxmox = ProxmoxManager()
+        self.manager = proxmox
+        self.weights = getattr(settings, 'PROXMOX_NODE_WEIGHTS', {})
+        self.cpu_overcommit = getattr(settings, 'PROXMOX_CPU_OVERCOMMIT', 4.0)
+        self.ram_overcommit = getattr(settings, 'PROXMOX_RAM_OVERCOMMIT', 1.0)
+        self.storage = getattr(settings, 'PROXMOX_STORAGE', None)
+
+    def get_cluster_resources(self):
+        """Nodes, VMs and storage from the shared cluster snapshot"""
+        if not self.manager.proxmox:
+            return []
+        return get_cluster_resources(proxmox=self.manager)
+
+    def get_node_capacity(self, resources=None):
+        """
+        Summarise allocatable capacity per online node.
+        Allocation counts the configured size of every VM on the node, not its
+        current usage, so idle VMs still reserve their share. VMs of terminated
+        services waiting for disk reclamation are stopped for good and don't;
+        their disks are reported as reclaimable until the purge frees them.
+        """
+        from vms.reclamation import get_reclaiming_vms
+
+        if resources is None:
+            resources = self.get_cluster_resources()
+        reclaiming = get_reclaiming_vms()
+
+        nodes = {}
+        for item in resources:
+            if item.get('type') == 'node' and item.get('status') == 'online':
+                nodes[item['node']] = {
+                    'node': item['node'],
+                    'maxcpu': item.get('maxcpu', 0),
+                    'maxmem': item.get('maxmem', 0),
+                    'cpu_usage': item.get('cpu', 0),
+                    'allocated_cpu': 0,
+                    'allocated_mem': 0,
+                    'storage': {},
+                    'reclaimable_disk': {},
+                }
+
+        for item in resources:
+            node = nodes.get(item.get('node'))
+            if node is None:
+                continue
+            if item.get('type') == 'qemu' and not item.get('template'):
+                reclamation = reclaiming.get(item.get('vmid'))
+                if reclamation:
+                    storage = reclamation.storage
+                    node['reclaimable_disk'][storage] = node['reclaimable_disk'].get(storage, 0) + reclamation.disk_gb * 1024 ** 3
+                    continue
+                node['allocated_cpu'] += item.get('maxcpu', 0)
+                node['allocated_mem'] += item.get('maxmem', 0)
+            elif item.get('type') == 'storage' and item.get('status') == 'available':
+                if 'images' not in item.get('content', 'images'):
+                    continue
+                if item.get('plugintype') and item['plugintype'] not in DISK_STORAGE_TYPES:
+                    continue
+                node['storage'][item['storage']] = item.get('maxdisk', 0) - item.get('disk', 0)
+
+        self._add_pending_placements(nodes)
+        return nodes
+
+    def _add_pending_placements(self, nodes):
+        """Count services already placed on a node whose VM doesn't exist yet"""
+        from core.models import Service
+
+        pending = Service.objects.filter(
+            status='pending',
+            vm_id__isnull=True,
+            node__in=list(nodes)
+        ).values('node').annotate(
+            cores=Sum('plan__cpu_cores'),
+            ram_mb=Sum('plan__ram_mb'),
+        )
+        for row in pending:
+            node = nodes[row['node']]
+            node['allocated_cpu'] += row['cores'] or 0
+            node['allocated_mem'] += (row['ram_mb'] or 0) * 1024 * 1024
+
+    def score_node(self, node, plan):
+        """Return a placement score for the node, or None if the plan doesn't fit"""
+        weight = self.weights.get(node['node'], 1.0)
+        if weight <= 0:
+            return None
+
+        cpu_capacity = node['maxcpu'] * self.cpu_overcommit
+        mem_capacity = node['maxmem'] * self.ram_overcommit
+        plan_mem = plan.ram_mb * 1024 * 1024
+        plan_disk = plan.disk_gb * 1024 ** 3
+
+        free_cpu = cpu_capacity - node['allocated_cpu'] - plan.cpu_cores
+        free_mem = mem_capacity - node['allocated_mem'] - plan_mem
+        if free_cpu < 0 or free_mem < 0:
+            return None
+
+        if self.storage:
+            if self.storage not in node['storage']:
+                return None
+            storage = self.storage
+        else:
+            storage = max(node['storage'], key=node['storage'].get, default=None)
+        max_disk = node['storage'].get(storage, 0)
+        free_disk = max_disk - plan_disk
+        if free_disk < 0:
+            return None
+        # Disks queued for reclamation are freed soon: they add headroom, but
+        # the clone itself still has to fit in what is free now
+        reclaimable = node['reclaimable_disk'].get(storage, 0)
+
+        # Fractions of capacity left after placement, each in [0, 1]
+        cpu_left = free_cpu / cpu_capacity if cpu_capacity else 0
+        mem_left = free_mem / mem_capacity if mem_capacity else 0
+        disk_left = (free_disk + reclaimable) / (max_disk + reclaimable) if max_disk else 0
+        # Live CPU load matters too: an overcommitted but idle node is a better
+        # target than a busy one with the same allocation
+        load_left = 1 - min(node['cpu_usage'], 1)
+
+        return weight * (cpu_left + mem_left + disk_left + load_left) / 4
+
+    def get_candidate_nodes(self, plan, resources=None):
+        """Capacity of the nodes the plan's template can be cloned onto"""
+        from vms.catalog import get_clone_nodes
+
+        nodes = self.get_node_capacity(resources)
+        clone_nodes = get_clone_nodes(plan, proxmox=self.manager) if nodes else None
+        if clone_nodes is None:
+            return nodes
+        return {name: node for name, node in nodes.items() if name in clone_nodes}
+
+    def choose_node(self, plan):
+        """Return the best node for the plan, or None if nothing fits"""
+        nodes = self.get_candidate_nodes(plan)
+        if not nodes:
+            return None
+
+        scored = []
+        for node in nodes.values():
+            score = self.score_node(node, plan)
+            if score is not None:
+                scored.append((score, node['node']))
+
+        if not scored:
+            logger.warning(f"No node has capacity for plan {plan.name}")
+            return None
+
+        score, node = max(scored)
+        logger.info(f"Placing plan {plan.name} on node {node} (score {score:.3f})")
+        return node
+
+
+def place_service(service):
+    """
+    Assign a node to the service if it doesn't have one yet.
+    Falls back to PROXMOX_NODE when the cluster can't be queried.
+    """
+    if service.node:
+        return service.node
+
+    node = PlacementScheduler().choose_node(service.plan)
+    service.node = node or settings.PROXMOX_NODE
+    service.save(update_fields=['node'])
+    return service.node
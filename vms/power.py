@@ -0,0 +1,135 @@
+"""
+Bulk power operations.
+
+Runs start, stop, shutdown or delete for a batch of VMs through one thread
+pool. Each node has its own cap on tasks in flight, so a midnight batch of
+suspensions spreads across the cluster instead of piling onto one node.
+Every action is followed to its real task result through the shared task
+watcher, and the caller gets an outcome per VM.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from vms.proxmox import ProxmoxManager
+from vms.inventory import get_fleet_snapshot, invalidate_fleet_snapshot
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Threads shared by the whole batch
+POWER_CONCURRENCY = 16
+# Tasks in flight on one node at a time
+POWER_PER_NODE = 4
+# Seconds to wait for one VM's task before reporting it as timed out
+POWER_TIMEOUT = 120
+
+# Snapshot states that mean the action has nothing to do
+_ALREADY_DONE = {
+    'start': 'running',
+    'stop': 'stopped',
+    'shutdown': 'stopped',
+    'delete': 'missing',
+}
+
+
+def _result(status, message, **extra):
+    return dict(status=status, message=message, **extra)
+
+
+class BulkPowerOperation:
+    def __init__(self, action, concurrency=None, per_node=None, timeout=None):
+        if action not in _ALREADY_DONE:
+            raise ValueError(f"Unknown power action '{action}'")
+        self.action = action
+        self.concurrency = concurrency or getattr(settings, 'PROXMOX_POWER_CONCURRENCY', POWER_CONCURRENCY)
+        self.per_node = per_node or getattr(settings, 'PROXMOX_POWER_PER_NODE', POWER_PER_NODE)
+        self.timeout = timeout or getattr(settings, 'PROXMOX_POWER_TIMEOUT', POWER_TIMEOUT)
+        self._node_slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, node):
+        with self._lock:
+            if node not in self._node_slots:
+                self._node_slots[node] = threading.BoundedSemaphore(self.per_node)
+            return self._node_slots[node]
+
+    def _run_task(self, proxmox, vmid, action):
+        """Post one action and wait for its task; returns an error message or None"""
+        upid = proxmox.power_action(vmid, action)
+        status = proxmox.watcher.wait(upid, timeout=self.timeout)
+        if status is None:
+            return f"{action} task timed out after {self.timeout} seconds"
+        if status.get('exitstatus') != 'OK':
+            return f"{action} task failed: {status.get('exitstatus')}"
+        return None
+
+    def _apply(self, vmid, node, current):
+        if current == 'unknown':
+            # No snapshot to go by; ask the VM's node rather than act blindly
+            current = ProxmoxManager(node=node).get_vm_status(vmid)
+            if current not in ('running', 'stopped'):
+                return _result('error', 'VM state unknown', node=node)
+        if current == _ALREADY_DONE[self.action]:
+            return _result('skipped', f"VM already {current}", node=node)
+        if current == 'missing':
+            # A VM that no longer exists is as stopped as it gets
+            if self.action in ('stop', 'shutdown'):
+                return _result('skipped', 'VM not found in the cluster', node=node, missing=True)
+            return _result('error', 'VM not found in the cluster', node=node)
+
+        started = time.monotonic()
+        proxmox = ProxmoxManager(node=node)
+        with self._slot(node):
+            try:
+                # Proxmox refuses to delete a running VM
+                if self.action == 'delete' and current != 'stopped':
+                    error = self._run_task(proxmox, vmid, 'stop')
+                    if error:
+                        return _result('error', error, node=node)
+                error = self._run_task(proxmox, vmid, self.action)
+            except Exception as e:
+                error = str(e)
+
+        if error:
+            logger.error(f"Bulk {self.action} of VM {vmid} on {node} failed: {error}")
+            return _result('error', error, node=node)
+        return _result('success', f"VM {self.action} completed", node=node,
+                       seconds=round(time.monotonic() - started, 3))
+
+    def run(self, vms):
+        """
+        Apply the action to `vms`, a {vmid: node} mapping. The node recorded in
+        the cluster snapshot wins over the given one, so migrated VMs are
+        handled on the right node. Returns {vmid: outcome}.
+        """
+        if not vms:
+            return {}
+
+        fleet = get_fleet_snapshot(max_age=0)
+        targets = []
+        for vmid, node in vms.items():
+            resource = fleet.get(vmid)
+            if resource:
+                current = resource.get('status', 'unknown')
+            else:
+                # An empty snapshot means the fetch failed, not that every VM is gone
+                current = 'missing' if fleet else 'unknown'
+            targets.append((vmid, (resource or {}).get('node') or node, current))
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(targets))) as executor:
+            outcomes = list(executor.map(lambda target: self._apply(*target), targets))
+
+        invalidate_fleet_snapshot()
+        results = {target[0]: outcome for target, outcome in zip(targets, outcomes)}
+
+        counts = {}
+        for outcome in results.values():
+            counts[outcome['status']] = counts.get(outcome['status'], 0) + 1
+        logger.info(f"Bulk {self.action} of {len(results)} VMs: {counts}")
+        return results
+
+
+def bulk_power(action, vms, **options):
+    """Shortcut for BulkPowerOperation(action, **options).run(vms)"""
+    return BulkPowerOperation(action, **options).run(vms)
@@ -1,5 +1,11 @@
-from proxmoxer import ProxmoxAPI
 from django.conf import settings
+from proxmoxer.core import ResourceException
+from vms.connection import connection_pool
+from vms.task_watcher import task_watcher, parse_upid
+from vms.metrics import api_metrics
+from vms.inventory import get_cluster_resources, get_fleet_snapshot, get_vm_statuses, invalidate_fleet_snapshot
+from vms.vmids import vmid_allocator
+from vms.config_cache import get_cached_config, invalidate_config, store_config
 import random
 import string
 import time
@@ -7,32 +13,68 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Storage that can back a linked clone with a copy-on-write snapshot
+LINKED_CLONE_STORAGE_TYPES = ['lvmthin', 'zfspool', 'rbd']
+
+# Errors that mean "busy, try again": a held VM lock, or a config digest that
+# changed between reading the config and writing it back
+LOCK_CONFLICT_MARKERS = ['is locked', "can't lock file", 'file changed by other user']
+
+# Config polling while waiting for a lock: starts fast and backs off
+LOCK_POLL_MIN = 0.1
+LOCK_POLL_MAX = 2
+
+POWER_ACTIONS = ['start', 'stop', 'shutdown']
+
+
+def is_lock_conflict(error):
+    """True if a Proxmox error was caused by a VM lock or a stale config digest"""
+    return isinstance(error, ResourceException) and any(marker in str(error) for marker in LOCK_CONFLICT_MARKERS)
+
+
+def parse_disk_size(config, disk='scsi0'):
+    """Disk size in GB from a VM config entry like 'local-lvm:vm-103-disk-0,size=32G'"""
+    disk_info = config.get(disk, '')
+    if 'size=' in disk_info:
+        size_str = disk_info.split('size=')[1].split(',')[0].split(')')[0]
+        if 'G' in size_str:
+            return int(size_str.replace('G', ''))
+        elif 'M' in size_str:
+            return int(size_str.replace('M', '')) / 1024
+    return 0
+
+
 class ProxmoxManager:
-    def __init__(self):
+    def __init__(self, node=None):
         self.host = settings.PROXMOX_HOST
         self.user = settings.PROXMOX_USER
         self.password = settings.PROXMOX_PASSWORD
-        self.node = settings.PROXMOX_NODE
+        # Node this manager operates on; services pass the node they were placed on
+        self.node = node or settings.PROXMOX_NODE
+        self.template_node = getattr(settings, 'PROXMOX_TEMPLATE_NODE', None) or settings.PROXMOX_NODE
         self.verify_ssl = getattr(settings, 'PROXMOX_VERIFY_SSL', False)
-        timeout = getattr(settings, 'PROXMOX_TIMEOUT', 60)
+        self.timeout = getattr(settings, 'PROXMOX_TIMEOUT', 60)
+        self.watcher = task_watcher
         
-        # Initialize Proxmox connection
-        if self.host and self.user and self.password:
-            try:
-                self.proxmox = ProxmoxAPI(
-                    self.host,
-                    user=self.user,
-                    password=self.password,
-                    verify_ssl=self.verify_ssl,
-                    timeout=timeout
-                )
-                logger.info(f"Connected to Proxmox at {self.host}")
-            except Exception as e:
-                logger.error(f"Failed to connect to Proxmox: {str(e)}")
-                self.proxmox = None
-        else:
+        if not (self.host and self.user and self.password):
             logger.warning("Proxmox credentials not configured")
-            self.proxmox = None
+    
+    @property
+    def proxmox(self):
+        """
+        Shared Proxmox connection for this process.
+        Login happens on first use and is reused by every manager.
+        """
+        if not (self.host and self.user and self.password):
+            return None
+        
+        return connection_pool.get(
+            self.host,
+            self.user,
+            self.password,
+            verify_ssl=self.verify_ssl,
+            timeout=self.timeout
+        )
     
     def test_connection(self):
         """Test Proxmox connection"""
@@ -57,16 +99,8 @@ class ProxmoxManager:
         return ''.join(random.choice(chars) for _ in range(length))
     
     def get_next_vmid(self):
-        """Get next available VM ID"""
-        if not self.proxmox:
-            return random.randint(1000, 9999)
-        
-        try:
-            return self.proxmox.cluster.nextid.get()
-        except Exception as e:
-            logger.error(f"Failed to get next VMID: {str(e)}")
-            # Fallback to random ID
-            return random.randint(1000, 9999)
+        """Get next available VM ID from the database-backed allocator"""
+        return vmid_allocator.allocate(proxmox=self)
     
     def get_storage_list(self):
         """Get available storage on node"""
@@ -83,124 +117,255 @@ class ProxmoxManager:
     def wait_for_task(self, upid, timeout=300):
         """
         Wait for a Proxmox task to complete
+        Completion is tracked by the shared task watcher, which resolves all
+        in-flight tasks from one cluster-wide request.
         """
         logger.info(f"Waiting for task {upid} to complete...")
-        start_time = time.time()
+        started = time.monotonic()
+        status = self.watcher.wait(upid, timeout=timeout)
+        info = parse_upid(upid) or {'type': 'unknown'}
+        api_metrics.observe_wait(f"task_{info['type']}", time.monotonic() - started)
         
-        while (time.time() - start_time) < timeout:
-            try:
-                status = self.proxmox.nodes(self.node).tasks(upid).status.get()
-                task_status = status.get('status')
-                
-                if task_status == 'stopped':
-                    exitstatus = status.get('exitstatus')
-                    if exitstatus == 'OK':
-                        logger.info(f"Task {upid} completed successfully")
-                        return True
-                    else:
-                        logger.error(f"Task {upid} failed: {exitstatus}")
-                        return False
-            except Exception as e:
-                logger.debug(f"Error checking task status: {str(e)}")
-            
-            time.sleep(2)
+        if status is None:
+            logger.warning(f"Task {upid} timed out after {timeout} seconds")
+            return False
         
-        logger.warning(f"Task {upid} timed out after {timeout} seconds")
+        exitstatus = status.get('exitstatus')
+        if exitstatus == 'OK':
+            logger.info(f"Task {upid} completed successfully")
+            return True
+        
+        logger.error(f"Task {upid} failed: {exitstatus}")
         return False
 
-    def wait_for_lock_release(self, vmid, timeout=60):
+    def watch_task(self, upid, callback=None):
         """
-        Wait for VM lock to be released
+        Track a task without blocking
+        Returns a Future resolving to the task status; callback(upid, status)
+        is called when it finishes.
         """
-        logger.info(f"Waiting for VM {vmid} lock to be released...")
-        start_time = time.time()
+        return self.watcher.watch(upid, callback=callback)
+
+    def wait_for_config(self, vmid, timeout=60):
+        """
+        Wait until the VM config is unlocked and return it (with its digest)
+        Polls fast at first so a lock released right after its task ends is
+        seen almost immediately. Returns None on timeout.
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        interval = LOCK_POLL_MIN
+        # Only the first read may come from the cache; polling for a lock always asks Proxmox
+        cached = True
         
-        while (time.time() - start_time) < timeout:
+        while True:
             try:
-                config = self.proxmox.nodes(self.node).qemu(vmid).config.get()
-                # If we can read config without error and there's no lock, we're good
-                if 'lock' not in config:
-                    logger.info(f"VM {vmid} lock released")
-                    return True
+                config = self.get_vm_config(vmid, cached=cached)
+                cached = False
+                if config is not None and 'lock' not in config:
+                    api_metrics.observe_wait('lock', time.monotonic() - started)
+                    return config
             except Exception as e:
-                logger.debug(f"Waiting for lock release: {str(e)}")
+                logger.debug(f"Waiting for VM {vmid} config: {str(e)}")
             
-            time.sleep(2)
+            if time.monotonic() + interval > deadline:
+                logger.warning(f"VM {vmid} still locked after {timeout} seconds")
+                api_metrics.observe_wait('lock', time.monotonic() - started)
+                return None
+            time.sleep(interval)
+            interval = min(interval * 2, LOCK_POLL_MAX)
+    
+    def apply_config_change(self, vmid, change, timeout=60):
+        """
+        Run change(config) against the current unlocked config
+        change should pass config['digest'] to Proxmox so the write only applies
+        to the config it was based on. Lock conflicts and digest mismatches
+        re-read the config and try again; any other error is raised.
+        """
+        deadline = time.monotonic() + timeout
         
-        logger.warning(f"VM {vmid} lock not released after {timeout} seconds")
-        return False
+        while True:
+            config = self.wait_for_config(vmid, timeout=max(deadline - time.monotonic(), 0))
+            if config is None:
+                raise TimeoutError(f"VM {vmid} still locked after {timeout} seconds")
+            try:
+                return change(config)
+            except ResourceException as e:
+                if not is_lock_conflict(e) or time.monotonic() >= deadline:
+                    raise
+                # The config (or its lock) changed since it was read; read it fresh
+                invalidate_config(vmid)
+                api_metrics.record_retry('config_change', 'lock_conflict')
+                logger.debug(f"VM {vmid} busy, retrying: {str(e)}")
     
     def get_vm_disk_size(self, vmid, disk='scsi0'):
         """Get current disk size in GB"""
         try:
-            config = self.proxmox.nodes(self.node).qemu(vmid).config.get()
-            disk_info = config.get(disk, '')
-            # Parse size from string like 'local-lvm:vm-103-disk-0,size=32G'
-            if 'size=' in disk_info:
-                size_str = disk_info.split('size=')[1].split(',')[0].split(')')[0]
-                if 'G' in size_str:
-                    return int(size_str.replace('G', ''))
-                elif 'M' in size_str:
-                    return int(size_str.replace('M', '')) / 1024
-            return 0
+            return parse_disk_size(self.get_vm_config(vmid) or {}, disk)
         except Exception as e:
             logger.error(f"Failed to get disk size: {str(e)}")
             return 0
         
-    def wait_for_task(self, upid, timeout=300):
+    def get_disk_storage(self, vmid, disk='scsi0', node=None):
+        """Get the storage ID a VM disk lives on, e.g. 'local-lvm'"""
+        try:
+            config = self.get_vm_config(vmid, node=node) or {}
+            disk_info = config.get(disk, '')
+            # 'local-lvm:base-9000-disk-0,size=10G'
+            if ':' in disk_info:
+                return disk_info.split(':')[0]
+        except Exception as e:
+            logger.error(f"Failed to get disk storage: {str(e)}")
+        return None
+    
+    def supports_linked_clone(self, template_id):
         """
-        Wait for a Proxmox task to complete
+        Check whether a linked clone of the template is possible
+        Needs thin-capable storage (lvmthin/zfs) and, across nodes, shared storage
         """
-        logger.info(f"Waiting for task {upid} to complete...")
-        start_time = time.time()
+        if not self.proxmox or not template_id:
+            return False
         
-        while (time.time() - start_time) < timeout:
-            try:
-                status = self.proxmox.nodes(self.node).tasks(upid).status.get()
-                task_status = status.get('status')
-                
-                if task_status == 'stopped':
-                    exitstatus = status.get('exitstatus')
-                    if exitstatus == 'OK':
-                        logger.info(f"Task {upid} completed successfully")
-                        return True
-                    else:
-                        logger.error(f"Task {upid} failed: {exitstatus}")
-                        return False
-            except Exception as e:
-                logger.debug(f"Error checking task status: {str(e)}")
-            
-            time.sleep(2)
+        storage = self.get_disk_storage(template_id, node=self.template_node)
+        if not storage:
+            return False
         
-        logger.warning(f"Task {upid} timed out after {timeout} seconds")
+        for item in get_cluster_resources(proxmox=self):
+            if item.get('type') == 'storage' and item.get('storage') == storage and item.get('node') == self.template_node:
+                if item.get('plugintype') not in LINKED_CLONE_STORAGE_TYPES:
+                    return False
+                return self.node == self.template_node or bool(item.get('shared'))
         return False
-
-    def wait_for_lock_release(self, vmid, timeout=60):
+    
+    def promote_linked_clone(self, vmid, storage, disk='scsi0'):
         """
-        Wait for VM lock to be released
+        Turn a linked clone into an independent VM by moving its disk off the base image
+        Returns the move task UPID, or None if it could not be started
         """
-        logger.info(f"Waiting for VM {vmid} lock to be released...")
-        start_time = time.time()
+        if not self.proxmox:
+            return None
         
-        while (time.time() - start_time) < timeout:
-            try:
-                config = self.proxmox.nodes(self.node).qemu(vmid).config.get()
-                # If we can read config without error and there's no lock, we're good
-                if 'lock' not in config:
-                    logger.info(f"VM {vmid} lock released")
-                    return True
-            except Exception as e:
-                logger.debug(f"Waiting for lock release: {str(e)}")
-            
-            time.sleep(2)
+        params = {
+            'disk': disk,
+            'storage': storage,
+            'delete': 1  # Drop the linked source volume once copied
+        }
+        # Throttle the copy so it doesn't compete with tenants for storage I/O
+        bwlimit = getattr(settings, 'PROXMOX_PROMOTION_BWLIMIT', None)
+        if bwlimit:
+            params['bwlimit'] = bwlimit
         
-        logger.warning(f"VM {vmid} lock not released after {timeout} seconds")
-        return False
-
-    def create_vm_from_template(self, vmid, name, cores, memory, disk, template_id=None, password=None):
+        try:
+            upid = self.proxmox.nodes(self.node).qemu(vmid).move_disk.post(**params)
+            invalidate_config(vmid)
+            logger.info(f"Promotion of VM {vmid} to {storage} started: {upid}")
+            return upid
+        except Exception as e:
+            logger.error(f"Failed to start promotion of VM {vmid}: {str(e)}")
+            return None
+    
+    # Building blocks for step-wise provisioning. Unlike the methods above they
+    # don't wait or swallow errors: each starts one operation and returns the
+    # task UPID (or None when Proxmox finished synchronously).
+    
+    def clone_template(self, template_id, vmid, name, linked=False):
+        """Start cloning a template (on self.template_node) into a new VM on this node"""
+        clone_params = {
+            'newid': vmid,
+            'name': name,
+            'full': 0 if linked else 1  # Linked clones skip the disk copy
+        }
+        # Templates live on one node; clone across when placed elsewhere
+        if self.node != self.template_node:
+            clone_params['target'] = self.node
+        
+        upid = self.proxmox.nodes(self.template_node).qemu(template_id).clone.post(**clone_params)
+        # Cloning leaves the template's config as it is; the new VMID may hold a stale entry
+        invalidate_config(vmid)
+        logger.info(f"Clone task started: {upid}")
+        return upid
+    
+    def convert_to_template(self, vmid):
+        """Turn a stopped VM into a template; returns the task UPID, if the API gives one"""
+        logger.info(f"Converting VM {vmid} on {self.node} to a template")
+        upid = self.proxmox.nodes(self.node).qemu(vmid).template.post()
+        invalidate_config(vmid)
+        return self._as_upid(upid)
+    
+    def get_vm_config(self, vmid, cached=True, node=None):
+        """
+        Get the VM config, or None if the VM doesn't exist
+        Served from the shared config cache unless cached=False; the digest
+        in it is what writes should send back.
+        """
+        node = node or self.node
+        if cached:
+            config = get_cached_config(vmid, node)
+            if config is not None:
+                return config
+        try:
+            config = self.proxmox.nodes(node).qemu(vmid).config.get()
+        except ResourceException as e:
+            if e.status_code == 500 and 'does not exist' in str(e):
+                invalidate_config(vmid)
+                return None
+            raise
+        store_config(vmid, node, config)
+        return config
+    
+    def resize_disk(self, vmid, size_gb, disk='scsi0', digest=None):
+        """Grow a disk to size_gb; with a digest, only if the config is unchanged"""
+        logger.info(f"Resizing VM {vmid} {disk} to {size_gb}GB")
+        params = {
+            'disk': disk,
+            'size': f'{size_gb}G'
+        }
+        if digest:
+            params['digest'] = digest
+        upid = self.proxmox.nodes(self.node).qemu(vmid).resize.put(**params)
+        invalidate_config(vmid)
+        return self._as_upid(upid)
+    
+    def configure_vm(self, vmid, cores, memory, password=None, digest=None):
+        """Set CPU, memory and (with a password) cloud-init credentials"""
+        logger.info(f"Updating CPU ({cores} cores) and memory ({memory}MB)")
+        config_updates = {
+            'cores': cores,
+            'memory': memory
+        }
+        if digest:
+            config_updates['digest'] = digest
+        
+        # Add cloud-init configuration if password provided
+        if password:
+            logger.info("Configuring cloud-init with new password")
+            # Set cloud-init user and password
+            config_updates['ciuser'] = 'root'
+            config_updates['cipassword'] = password
+            # Enable DHCP for networking
+            config_updates['ipconfig0'] = 'ip=dhcp'
+        
+        upid = self.proxmox.nodes(self.node).qemu(vmid).config.put(**config_updates)
+        invalidate_config(vmid)
+        return self._as_upid(upid)
+    
+    def request_start(self, vmid):
+        """Start the VM"""
+        logger.info(f"Starting VM {vmid}")
+        return self._as_upid(self.proxmox.nodes(self.node).qemu(vmid).status.start.post())
+    
+    def _as_upid(self, response):
+        if isinstance(response, str) and response.startswith('UPID:'):
+            return response
+        return None
+    
+    def create_vm_from_template(self, vmid, name, cores, memory, disk, template_id=None, password=None, linked=False, wait_ip=True):
         """
         Create VM by cloning a template
         This is faster than creating from scratch
+        With linked=True the clone shares the template's base disk and is
+        usable almost immediately; promote it to a full clone later.
+        With wait_ip=False the IP is left for the background resolver.
         """
         if not self.proxmox:
             return {
@@ -214,15 +379,7 @@ class ProxmoxManager:
                 logger.info(f"Cloning template {template_id} to VM {vmid}")
                 
                 # Clone the template - this returns a task ID (UPID)
-                clone_response = self.proxmox.nodes(self.node).qemu(template_id).clone.post(
-                    newid=vmid,
-                    name=name,
-                    full=1  # Full clone
-                )
-                
-                # Extract UPID from response
-                upid = clone_response
-                logger.info(f"Clone task started: {upid}")
+                upid = self.clone_template(template_id, vmid, name, linked=linked)
                 
                 # Wait for clone task to complete
                 if not self.wait_for_task(upid, timeout=300):
@@ -231,49 +388,28 @@ class ProxmoxManager:
                         'message': 'Clone operation timed out or failed'
                     }
                 
-                # Wait for lock to be released
-                if not self.wait_for_lock_release(vmid, timeout=60):
-                    logger.warning(f"VM {vmid} lock still present, attempting to continue...")
+                # Each change below is made as soon as the config is unlocked,
+                # against its current digest, and retried only on lock conflicts
+                def resize(config):
+                    if parse_disk_size(config) >= disk:
+                        return None
+                    return self.resize_disk(vmid, disk, digest=config.get('digest'))
                 
-                # Additional wait to ensure everything is settled
-                time.sleep(5)
-                
-                # Resize disk if needed
                 logger.info(f"Resizing disk to {disk}GB")
                 try:
-                    resize_response = self.proxmox.nodes(self.node).qemu(vmid).resize.put(
-                        disk='scsi0',
-                        size=f'{disk}G'
-                    )
+                    resize_upid = self.apply_config_change(vmid, resize)
                     # Wait for resize to complete
-                    if isinstance(resize_response, str) and resize_response.startswith('UPID:'):
-                        self.wait_for_task(resize_response, timeout=120)
-                    time.sleep(3)
+                    if resize_upid:
+                        self.wait_for_task(resize_upid, timeout=120)
                 except Exception as e:
                     logger.warning(f"Disk resize may have failed: {str(e)}")
                 
-                # Wait for lock again before config update
-                self.wait_for_lock_release(vmid, timeout=60)
-                
                 # Update CPU and memory
-                logger.info(f"Updating CPU ({cores} cores) and memory ({memory}MB)")
                 try:
-                    config_updates = {
-                        'cores': cores,
-                        'memory': memory
-                    }
-                    
-                    # Add cloud-init configuration if password provided
-                    if password:
-                        logger.info(f"Configuring cloud-init with new password")
-                        # Set cloud-init user and password
-                        config_updates['ciuser'] = 'root'
-                        config_updates['cipassword'] = password
-                        # Enable DHCP for networking
-                        config_updates['ipconfig0'] = 'ip=dhcp'
-                    
-                    self.proxmox.nodes(self.node).qemu(vmid).config.put(**config_updates)
-                    time.sleep(3)
+                    self.apply_config_change(
+                        vmid,
+                        lambda config: self.configure_vm(vmid, cores, memory, password, digest=config.get('digest'))
+                    )
                 except Exception as e:
                     logger.warning(f"Config update may have failed: {str(e)}")
                 
@@ -282,27 +418,24 @@ class ProxmoxManager:
                 logger.info(f"Creating new VM {vmid} from scratch")
                 return self.create_vm_from_scratch(vmid, name, cores, memory, disk)
             
-            # Wait for lock release before starting
-            self.wait_for_lock_release(vmid, timeout=60)
-            
-            # Start the VM
-            logger.info(f"Starting VM {vmid}")
-            start_response = self.proxmox.nodes(self.node).qemu(vmid).status.start.post()
+            # Start the VM once nothing holds its lock
+            start_upid = self.apply_config_change(vmid, lambda config: self.request_start(vmid))
             
             # Wait for start task if UPID returned
-            if isinstance(start_response, str) and start_response.startswith('UPID:'):
-                self.wait_for_task(start_response, timeout=120)
-            
-            time.sleep(5)
+            if start_upid:
+                self.wait_for_task(start_upid, timeout=120)
             
             # Wait for IP address
-            ip_address = self.wait_for_ip(vmid, timeout=120)
+            ip_address = self.wait_for_ip(vmid, timeout=120) if wait_ip else None
+            
+            invalidate_fleet_snapshot()
             
             return {
                 'status': 'success',
                 'vmid': vmid,
                 'name': name,
                 'ip_address': ip_address,
+                'clone_mode': 'linked' if linked else 'full',
                 'message': 'VM created and started successfully'
             }
             
@@ -357,6 +490,7 @@ class ProxmoxManager:
                 # Enable QEMU agent
                 agent='enabled=1'
             )
+            invalidate_config(vmid)
             
             logger.info(f"VM {vmid} created successfully")
             
@@ -399,7 +533,7 @@ class ProxmoxManager:
         
     #     return result
 
-    def create_vm(self, vmid, name, cores, memory, disk, template_id=None, password=None):
+    def create_vm(self, vmid, name, cores, memory, disk, template_id=None, password=None, linked=False, wait_ip=True):
         """
         Main method to create VM
         Tries template first, falls back to scratch
@@ -409,7 +543,7 @@ class ProxmoxManager:
         
         # Try template first if available
         if template_id:
-            result = self.create_vm_from_template(vmid, name, cores, memory, disk, template_id, password)
+            result = self.create_vm_from_template(vmid, name, cores, memory, disk, template_id, password, linked=linked, wait_ip=wait_ip)
         else:
             result = self.create_vm_from_scratch(vmid, name, cores, memory, disk)
         
@@ -451,15 +585,39 @@ class ProxmoxManager:
         except Exception as e:
             logger.debug(f"Could not get IP via agent: {str(e)}")
         
-        # Fallback: Try to get IP from ARP/DHCP
+        # The config carries no address; without the agent there is nothing to read
+        return None
+    
+    def rotate_credentials(self, vmid, password, username='root', name=None):
+        """
+        Set a new password on a running VM
+        Uses the guest agent for the live system and updates cloud-init so the
+        password survives a rebuild.
+        """
+        if not self.proxmox:
+            return False
+        
         try:
-            config = self.proxmox.nodes(self.node).qemu(vmid).config.get()
-            # This is a simplified approach - in production you might query your DHCP server
-            return None
+            self.proxmox.nodes(self.node).qemu(vmid).agent('set-user-password').post(
+                username=username,
+                password=password
+            )
+            
+            config_updates = {'ciuser': username, 'cipassword': password}
+            if name:
+                config_updates['name'] = name
+            
+            def update(config):
+                self.proxmox.nodes(self.node).qemu(vmid).config.put(digest=config.get('digest'), **config_updates)
+                invalidate_config(vmid)
+            
+            self.apply_config_change(vmid, update)
+            
+            logger.info(f"Rotated credentials for VM {vmid}")
+            return True
         except Exception as e:
-            logger.debug(f"Could not get IP via config: {str(e)}")
-        
-        return None
+            logger.error(f"Failed to rotate credentials for VM {vmid}: {str(e)}")
+            return False
     
     def get_vm_status(self, vmid):
         """Get VM status"""
@@ -505,25 +663,131 @@ class ProxmoxManager:
             return False
         
         try:
-            # Stop VM first
-            self.stop_vm(vmid)
-            time.sleep(2)
+            # Stop VM first and wait for it to be down, instead of guessing how long that takes
+            if self.get_vm_statuses([vmid])[vmid] != 'stopped':
+                try:
+                    if not self.wait_for_task(self.power_action(vmid, 'stop'), timeout=60):
+                        logger.warning(f"VM {vmid} did not stop cleanly, deleting anyway")
+                except Exception as e:
+                    logger.warning(f"Failed to stop VM {vmid} before deleting: {str(e)}")
             
             # Delete VM
-            self.proxmox.nodes(self.node).qemu(vmid).delete()
+            self.power_action(vmid, 'delete')
             logger.info(f"VM {vmid} deleted")
+            invalidate_fleet_snapshot()
             return True
         except Exception as e:
             logger.error(f"Failed to delete VM {vmid}: {str(e)}")
             return False
     
+    def destroy_vm(self, vmid):
+        """Destroy a stopped VM and purge its disks; returns the task UPID"""
+        upid = self.proxmox.nodes(self.node).qemu(vmid).delete(purge=1)
+        invalidate_config(vmid)
+        logger.info(f"Destroying VM {vmid} on {self.node}")
+        return upid
+    
+    def backup_vm(self, vmid, storage, keep=None, bwlimit=None):
+        """
+        Start a vzdump of a VM and return the task UPID.
+        Snapshot mode keeps the VM running; ionice and bwlimit (KiB/s) keep
+        the dump from starving the node's other guests of disk I/O. With
+        `keep`, Proxmox prunes older backups of the VM on that storage.
+        """
+        params = {
+            'vmid': vmid,
+            'storage': storage,
+            'mode': 'snapshot',
+            'compress': 'zstd',
+            'ionice': 7,
+        }
+        if bwlimit:
+            params['bwlimit'] = bwlimit
+        if keep:
+            params['prune-backups'] = f'keep-last={keep}'
+        upid = self.proxmox.nodes(self.node).vzdump.post(**params)
+        invalidate_config(vmid)
+        logger.info(f"Backing up VM {vmid} on {self.node} to {storage}")
+        return upid
+    
+    def migrate_vm(self, vmid, target, online=True, with_local_disks=False, bwlimit=None):
+        """
+        Start a (live) migration of a VM to another node and return the task UPID.
+        bwlimit is in KiB/s; local disks are copied along only if asked to.
+        """
+        params = {'target': target, 'online': int(online)}
+        if with_local_disks:
+            params['with-local-disks'] = 1
+        if bwlimit:
+            params['bwlimit'] = bwlimit
+        upid = self.proxmox.nodes(self.node).qemu(vmid).migrate.post(**params)
+        invalidate_config(vmid)
+        logger.info(f"Migrating VM {vmid} from {self.node} to {target}")
+        return upid
+    
+    def get_node_status(self, node=None):
+        """Node status (CPU, I/O wait, memory); None if it can't be read"""
+        try:
+            return self.proxmox.nodes(node or self.node).status.get()
+        except Exception as e:
+            logger.error(f"Failed to get status of node {node or self.node}: {str(e)}")
+            return None
+    
+    def power_action(self, vmid, action):
+        """
+        Request start, stop, shutdown or delete and return the task UPID
+        Raises on failure; callers decide whether to wait for the task.
+        """
+        vm = self.proxmox.nodes(self.node).qemu(vmid)
+        if action == 'delete':
+            upid = vm.delete()
+            invalidate_config(vmid)
+            return upid
+        if action not in POWER_ACTIONS:
+            raise ValueError(f"Unknown power action '{action}'")
+        return getattr(vm.status, action).post()
+    
+    def get_vm_statuses(self, vmids):
+        """
+        Get status for many VMs at once
+        Served from the shared cluster snapshot: one API call for the whole fleet
+        """
+        if not self.proxmox:
+            return {vmid: 'unknown' for vmid in vmids}
+        
+        return get_vm_statuses(vmids, proxmox=self)
+    
+    def get_fleet_snapshot(self, max_age=None):
+        """Get {vmid: resource} for every VM in the cluster"""
+        if not self.proxmox:
+            return {}
+        
+        return get_fleet_snapshot(proxmox=self, max_age=max_age)
+    
     def get_vm_info(self, vmid):
         """Get detailed VM information"""
         if not self.proxmox:
             return None
         
+        # /cluster/resources already carries config sizes and live usage
+        vm = self.get_fleet_snapshot().get(vmid)
+        if vm:
+            return {
+                'vmid': vmid,
+                'name': vm.get('name'),
+                'cores': vm.get('maxcpu'),
+                'memory': vm.get('maxmem', 0) // (1024 * 1024),
+                'status': vm.get('status'),
+                'uptime': vm.get('uptime'),
+                'cpu': vm.get('cpu'),
+                'mem': vm.get('mem'),
+                'maxmem': vm.get('maxmem'),
+                'disk': vm.get('disk'),
+                'maxdisk': vm.get('maxdisk'),
+            }
+        
         try:
-            config = self.proxmox.nodes(self.node).qemu(vmid).config.get()
+            config = self.get_vm_config(vmid) or {}
             status = self.proxmox.nodes(self.node).qemu(vmid).status.current.get()
             
             return {
@@ -541,4 +805,4 @@ class ProxmoxManager:
             }
         except Exception as e:
             logger.error(f"Failed to get VM info: {str(e)}")
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,288 @@
+"""
+Load-aware rebalancing with live migrations.
+
+A node is hot when its CPU (averaged over the collected metrics, so a
+short spike doesn't count), memory or I/O wait passes its threshold. For
+each hot node the rebalancer weighs the running VMs on it: the relief
+moving one gives the node, against the time a live migration of its
+memory takes at the assumed migration bandwidth. The best VM goes to the
+node that ends up least loaded, provided that node stays well under every
+threshold and still has allocation room for the plan. It never goes to a
+node that would turn hot itself.
+
+Only one migration runs per node at a time, with a cluster-wide cap. A
+moved VM isn't moved again until its cooldown has passed. When a
+migration's task succeeds, the service's node is updated.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Avg
+from django.utils import timezone
+from core.models import Service
+from vms.models import Backup, ProvisioningJob, ResourceMetric, VMMigration
+from vms.placement import PlacementScheduler
+from vms.proxmox import ProxmoxManager
+from vms.task_watcher import task_watcher
+from vms.inventory import get_cluster_resources, invalidate_fleet_snapshot
+from vms.timeseries import RAW
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A node is hot once any of these is passed: CPU and memory as a fraction of
+# the node, I/O wait as a fraction of CPU time
+THRESHOLDS = {
+    'cpu': 0.85,
+    'mem': 0.90,
+    'iowait': 0.10,
+}
+# A target must stay under this fraction of every threshold after the move
+TARGET_HEADROOM = 0.75
+# Minutes of CPU samples averaged when judging load
+PRESSURE_MINUTES = 15
+# Migration network throughput assumed by the cost model, in MiB/s
+MIGRATION_BANDWIDTH = 100
+# Longest migration, by that estimate, the rebalancer will start
+MAX_MIGRATION_SECONDS = 300
+# Migrations running at once in the cluster
+REBALANCE_CONCURRENCY = 2
+# Hours before the same VM may be moved again
+REBALANCE_COOLDOWN_HOURS = 24
+
+MiB = 1024 ** 2
+
+
+def get_thresholds():
+    return {**THRESHOLDS, **getattr(settings, 'PROXMOX_REBALANCE_THRESHOLDS', {})}
+
+
+def load(pressure, thresholds):
+    """Highest pressure as a fraction of its threshold; above 1 means hot"""
+    return max(pressure[key] / limit for key, limit in thresholds.items())
+
+
+def _average_cpu(resource_type, resource_ids, now):
+    """{resource_id: mean CPU over the pressure window} from the collected metrics"""
+    minutes = getattr(settings, 'PROXMOX_REBALANCE_PRESSURE_MINUTES', PRESSURE_MINUTES)
+    rows = ResourceMetric.objects.filter(
+        resource_type=resource_type,
+        resource_id__in=[str(resource_id) for resource_id in resource_ids],
+        resolution=RAW,
+        bucket__gte=now - timedelta(minutes=minutes)
+    ).values('resource_id').annotate(cpu=Avg('cpu'))
+    return {row['resource_id']: row['cpu'] for row in rows}
+
+
+def node_pressure(resources, now=None, proxmox=None):
+    """{node: {'cpu', 'mem', 'iowait', 'maxcpu', 'maxmem'}} for every online node"""
+    now = now or timezone.now()
+    proxmox = proxmox or ProxmoxManager()
+    nodes = {
+        item['node']: item for item in resources
+        if item.get('type') == 'node' and item.get('status') == 'online'
+    }
+    cpu = _average_cpu('node', nodes, now)
+
+    pressure = {}
+    for name, item in nodes.items():
+        # I/O wait isn't in /cluster/resources; one status call per node
+        status = proxmox.get_node_status(name) or {}
+        pressure[name] = {
+            'cpu': cpu.get(name, item.get('cpu', 0)),
+            'mem': item.get('mem', 0) / item['maxmem'] if item.get('maxmem') else 0,
+            'iowait': status.get('wait', 0),
+            'maxcpu': item.get('maxcpu', 0),
+            'maxmem': item.get('maxmem', 0),
+        }
+    return pressure
+
+
+def migration_cost(vm):
+    """Estimated seconds to live-migrate a VM: the bytes to copy over the migration bandwidth"""
+    size = vm.get('mem') or vm.get('maxmem', 0)
+    if getattr(settings, 'PROXMOX_MIGRATION_LOCAL_DISKS', False):
+        size += vm.get('maxdisk', 0)
+    bandwidth = getattr(settings, 'PROXMOX_MIGRATION_BANDWIDTH', MIGRATION_BANDWIDTH)
+    return size / (bandwidth * MiB)
+
+
+def _moved(pressure, delta, sign):
+    """Pressure of a node after a VM's share `delta` leaves (sign -1) or arrives (sign 1)"""
+    moved = dict(pressure)
+    moved['cpu'] = max(pressure['cpu'] + sign * delta['cpu'] * delta['maxcpu'] / pressure['maxcpu'], 0) if pressure['maxcpu'] else pressure['cpu']
+    moved['mem'] = max(pressure['mem'] + sign * delta['mem'] / pressure['maxmem'], 0) if pressure['maxmem'] else pressure['mem']
+    moved['iowait'] = max(pressure['iowait'] + sign * delta['iowait'], 0)
+    return moved
+
+
+def _reason(pressure, thresholds):
+    return ', '.join(f"{key} {pressure[key]:.2f}" for key, limit in thresholds.items() if pressure[key] > limit)
+
+
+def _candidates(resources, hot, now):
+    """{node: [vm resource with its averaged 'cpu']} of running VMs on hot nodes that may be moved"""
+    cooldown = getattr(settings, 'PROXMOX_REBALANCE_COOLDOWN_HOURS', REBALANCE_COOLDOWN_HOURS)
+    excluded = set(VMMigration.objects.filter(created_at__gte=now - timedelta(hours=cooldown)).values_list('vm_id', flat=True))
+    excluded.update(Backup.objects.filter(status='running').values_list('vm_id', flat=True))
+    excluded.update(ProvisioningJob.objects.exclude(status='completed').filter(vm_id__isnull=False).values_list('vm_id', flat=True))
+
+    vms = [
+        item for item in resources
+        if item.get('type') == 'qemu' and item.get('node') in hot and item.get('status') == 'running'
+        and not item.get('template') and not item.get('lock') and item['vmid'] not in excluded
+    ]
+    services = {
+        service.vm_id: service
+        for service in Service.objects.filter(status='active', vm_id__in=[vm['vmid'] for vm in vms]).select_related('plan')
+    }
+    cpu = _average_cpu('vm', [vm['vmid'] for vm in vms], now)
+
+    candidates = {node: [] for node in hot}
+    for vm in vms:
+        if vm['vmid'] in services:
+            candidates[vm['node']].append(dict(vm, cpu=cpu.get(str(vm['vmid']), vm.get('cpu', 0)), service=services[vm['vmid']]))
+    return candidates
+
+
+def plan_migrations(resources, pressure, now=None):
+    """
+    Pick the migrations to start now, best relief per second of migration first.
+    Returns [{'vm_id', 'service', 'source', 'target', 'seconds', 'reason'}].
+    """
+    now = now or timezone.now()
+    thresholds = get_thresholds()
+    hot = {node for node, values in pressure.items() if load(values, thresholds) > 1}
+    if not hot:
+        return []
+
+    running = list(VMMigration.objects.filter(status='running').values_list('source', 'target'))
+    slots = getattr(settings, 'PROXMOX_REBALANCE_CONCURRENCY', REBALANCE_CONCURRENCY) - len(running)
+    busy = {node for migration in running for node in migration}
+    headroom = getattr(settings, 'PROXMOX_REBALANCE_TARGET_HEADROOM', TARGET_HEADROOM)
+    max_seconds = getattr(settings, 'PROXMOX_MIGRATION_MAX_SECONDS', MAX_MIGRATION_SECONDS)
+
+    candidates = _candidates(resources, hot - busy, now)
+    scheduler = PlacementScheduler(proxmox=ProxmoxManager())
+    capacity = scheduler.get_node_capacity(resources)
+
+    plans = []
+    while slots > 0:
+        best = None
+        for source in hot - busy:
+            source_load = load(pressure[source], thresholds)
+            # The node's I/O wait is shared out in proportion to its VMs' CPU use
+            node_cpu = sum(vm['cpu'] * vm.get('maxcpu', 0) for vm in candidates[source])
+            for vm in candidates[source]:
+                delta = {
+                    'cpu': vm['cpu'],
+                    'maxcpu': vm.get('maxcpu', 0),
+                    'mem': vm.get('mem', 0),
+                    'iowait': pressure[source]['iowait'] * vm['cpu'] * vm.get('maxcpu', 0) / node_cpu if node_cpu else 0,
+                }
+                source_after = _moved(pressure[source], delta, -1)
+                relief = source_load - load(source_after, thresholds)
+                seconds = migration_cost(vm)
+                if relief <= 0 or seconds > max_seconds:
+                    continue
+
+                for target in set(pressure) - hot - busy - {source}:
+                    if target not in capacity or scheduler.score_node(capacity[target], vm['service'].plan) is None:
+                        continue
+                    target_after = _moved(pressure[target], delta, 1)
+                    target_load = load(target_after, thresholds)
+                    if target_load > headroom:
+                        continue
+                    score = (relief / max(seconds, 1), -target_load)
+                    if best is None or score > best[0]:
+                        best = (score, vm, source, target, source_after, target_after, seconds)
+
+        if best is None:
+            break
+
+        _, vm, source, target, source_after, target_after, seconds = best
+        plans.append({
+            'vm_id': vm['vmid'],
+            'service': vm['service'],
+            'source': source,
+            'target': target,
+            'seconds': seconds,
+            'reason': _reason(pressure[source], thresholds),
+        })
+        pressure[source], pressure[target] = source_after, target_after
+        capacity[target]['allocated_cpu'] += vm.get('maxcpu', 0)
+        capacity[target]['allocated_mem'] += vm.get('maxmem', 0)
+        # One migration per node at a time
+        busy.update([source, target])
+        slots -= 1
+    return plans
+
+
+def _start_migration(plan):
+    """Start one planned migration; returns True if it is running"""
+    migration = VMMigration(
+        service=plan['service'],
+        vm_id=plan['vm_id'],
+        source=plan['source'],
+        target=plan['target'],
+        reason=plan['reason'],
+        estimated_seconds=round(plan['seconds'], 1)
+    )
+    try:
+        migration.upid = ProxmoxManager(node=plan['source']).migrate_vm(
+            plan['vm_id'],
+            plan['target'],
+            with_local_disks=getattr(settings, 'PROXMOX_MIGRATION_LOCAL_DISKS', False),
+            bwlimit=getattr(settings, 'PROXMOX_MIGRATION_BWLIMIT', None)
+        )
+        migration.save()
+        logger.info(f"Rebalancing: VM {plan['vm_id']} {plan['source']} -> {plan['target']} ({plan['reason']}, ~{plan['seconds']:.0f}s)")
+        return True
+    except Exception as e:
+        # Recorded as failed so the cooldown keeps it from being retried every sweep
+        migration.status = 'failed'
+        migration.last_error = str(e)
+        migration.finished_at = timezone.now()
+        migration.save()
+        logger.error(f"Migrating VM {plan['vm_id']} to {plan['target']} failed: {str(e)}")
+        return False
+
+
+def _finish_migrations():
+    """Record finished migrations and write the new node back to the service"""
+    completed = 0
+    for migration in VMMigration.objects.filter(status='running'):
+        status = task_watcher.poll(migration.upid)
+        if status is None:
+            continue
+
+        migration.finished_at = timezone.now()
+        if status.get('exitstatus') == 'OK':
+            migration.status = 'completed'
+            if migration.service_id:
+                Service.objects.filter(id=migration.service_id, vm_id=migration.vm_id).update(node=migration.target)
+            completed += 1
+            logger.info(f"VM {migration.vm_id} migrated to {migration.target}")
+        else:
+            migration.status = 'failed'
+            migration.last_error = str(status.get('exitstatus'))
+            logger.error(f"Migration of VM {migration.vm_id} to {migration.target} failed: {migration.last_error}")
+        migration.save()
+    return completed
+
+
+def rebalance(now=None):
+    """One rebalancing sweep; returns (migrations completed, migrations started)"""
+    now = now or timezone.now()
+    completed = _finish_migrations()
+    if completed:
+        invalidate_fleet_snapshot()
+
+    resources = get_cluster_resources(max_age=0)
+    if not resources:
+        return completed, 0
+
+    plans = plan_migrations(resources, node_pressure(resources, now), now)
+    started = sum(1 for plan in plans if _start_migration(plan))
+    if started:
+        invalidate_fleet_snapshot()
+    return completed, started
@@ -0,0 +1,201 @@
+"""
+Deferred disk reclamation.
+
+Terminating a service only stops its VM and queues a DiskReclamation. The
+sweep destroys queued VMs during the reclamation window (off-peak by
+default), a few at a time per storage and within a per-sweep size budget,
+so large purges don't compete with clones for new customers.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.utils import timezone
+from vms.models import DiskReclamation
+from vms.proxmox import ProxmoxManager
+from vms.circuit import ProxmoxUnavailable
+from vms.task_watcher import task_watcher
+from vms.inventory import invalidate_fleet_snapshot
+from vms.windows import OFFPEAK_HOURS, in_hour_window
+import requests
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Purges running at once on one storage
+RECLAIM_PER_STORAGE = 1
+# GB of disks a sweep may start destroying on one storage
+RECLAIM_BUDGET_GB = 200
+# Failed purges are retried this many times before they need a look
+RECLAIM_MAX_ATTEMPTS = 3
+
+DISK_PREFIXES = ('scsi', 'virtio', 'sata', 'ide')
+
+
+def describe_disks(config):
+    """(storage of the first disk, total size in GB) from a VM config"""
+    storage = ''
+    total_gb = 0
+    for key in sorted(config):
+        if not key.startswith(DISK_PREFIXES) or not key[-1].isdigit():
+            continue
+        spec = str(config[key])
+        if 'media=cdrom' in spec or ':' not in spec:
+            continue
+        storage = storage or spec.split(':')[0]
+        for option in spec.split(',')[1:]:
+            if option.startswith('size='):
+                size = option[5:]
+                if size.endswith('T'):
+                    total_gb += float(size[:-1]) * 1024
+                elif size.endswith('G'):
+                    total_gb += float(size[:-1])
+                elif size.endswith('M'):
+                    total_gb += float(size[:-1]) / 1024
+    return storage, total_gb
+
+
+def in_reclaim_window(now=None):
+    start, end = getattr(settings, 'PROXMOX_RECLAIM_HOURS', None) or getattr(settings, 'PROXMOX_OFFPEAK_HOURS', OFFPEAK_HOURS)
+    return in_hour_window(start, end, now)
+
+
+def mark_for_reclamation(service, node=None):
+    """
+    Queue the service's (stopped) VM for purging.
+    Returns the DiskReclamation, or None if there is no VM left to reclaim.
+    """
+    if not service.vm_id:
+        return None
+    return queue_reclamation(service.vm_id, node or service.node, service=service)
+
+
+def queue_reclamation(vm_id, node, service=None):
+    """Queue a stopped VM for purging, whether or not a service owns it"""
+    existing = DiskReclamation.objects.filter(vm_id=vm_id, status__in=['pending', 'purging']).first()
+    if existing:
+        return existing
+
+    config = ProxmoxManager(node=node).get_vm_config(vm_id)
+    if config is None:
+        logger.info(f"VM {vm_id} is already gone, nothing to reclaim")
+        return None
+
+    storage, disk_gb = describe_disks(config)
+    reclamation = DiskReclamation.objects.create(
+        service=service,
+        vm_id=vm_id,
+        node=node,
+        storage=storage,
+        disk_gb=disk_gb
+    )
+    logger.info(f"VM {vm_id} queued for disk reclamation ({disk_gb:g}GB on {storage or 'unknown storage'})")
+    return reclamation
+
+
+def _finish_purges():
+    """Record the outcome of purges started by earlier sweeps"""
+    reclaimed = 0
+    for reclamation in DiskReclamation.objects.filter(status='purging'):
+        status = task_watcher.poll(reclamation.upid)
+        if status is None:
+            continue
+
+        reclamation.upid = ''
+        if status.get('exitstatus') == 'OK':
+            reclamation.status = 'reclaimed'
+            reclamation.reclaimed_at = timezone.now()
+            reclaimed += 1
+            logger.info(f"Reclaimed {reclamation.disk_gb:g}GB from VM {reclamation.vm_id} on {reclamation.storage}")
+        else:
+            _purge_failed(reclamation, status.get('exitstatus'))
+        reclamation.save()
+    return reclaimed
+
+
+def _purge_failed(reclamation, error):
+    reclamation.last_error = str(error)
+    max_attempts = getattr(settings, 'PROXMOX_RECLAIM_MAX_ATTEMPTS', RECLAIM_MAX_ATTEMPTS)
+    reclamation.status = 'failed' if reclamation.attempts >= max_attempts else 'pending'
+    logger.error(f"Purging VM {reclamation.vm_id} failed (attempt {reclamation.attempts}): {error}")
+
+
+def _start_purge(reclamation):
+    """Destroy one VM; returns True if the purge was started or wasn't needed"""
+    proxmox = ProxmoxManager(node=reclamation.node)
+    reclamation.attempts += 1
+    try:
+        config = proxmox.get_vm_config(reclamation.vm_id)
+        if config is None:
+            reclamation.status = 'reclaimed'
+            reclamation.reclaimed_at = timezone.now()
+            reclamation.save()
+            return True
+        if 'lock' in config:
+            # Backup or migration still running; try again next sweep
+            reclamation.attempts -= 1
+            return False
+        if proxmox.get_vm_statuses([reclamation.vm_id])[reclamation.vm_id] == 'running':
+            # Started again since termination (e.g. by hand); leave it for a person
+            raise Exception('VM is running again')
+
+        reclamation.upid = proxmox.destroy_vm(reclamation.vm_id)
+        reclamation.status = 'purging'
+        reclamation.started_at = timezone.now()
+        reclamation.save()
+        return True
+    except (ProxmoxUnavailable, requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        # The cluster is down, not this purge; the sweep stops and the task defers
+        reclamation.attempts -= 1
+        raise
+    except Exception as e:
+        _purge_failed(reclamation, e)
+        reclamation.save()
+        return False
+
+
+def reclaim_disks(now=None):
+    """
+    One reclamation sweep. Finishes running purges, then, inside the window,
+    starts new ones per storage up to the concurrency and size budget.
+    Returns (reclaimed, started).
+    """
+    reclaimed = _finish_purges()
+    if not in_reclaim_window(now):
+        if reclaimed:
+            invalidate_fleet_snapshot()
+        return reclaimed, 0
+
+    per_storage = getattr(settings, 'PROXMOX_RECLAIM_PER_STORAGE', RECLAIM_PER_STORAGE)
+    budget_gb = getattr(settings, 'PROXMOX_RECLAIM_BUDGET_GB', RECLAIM_BUDGET_GB)
+
+    in_flight = defaultdict(int)
+    for storage in DiskReclamation.objects.filter(status='purging').values_list('storage', flat=True):
+        in_flight[storage] += 1
+
+    spent_gb = defaultdict(float)
+    started = 0
+    for reclamation in DiskReclamation.objects.filter(status='pending'):
+        storage = reclamation.storage
+        if in_flight[storage] >= per_storage:
+            continue
+        # The first disk of a sweep always goes, so one larger than the budget isn't stuck forever
+        if spent_gb[storage] and spent_gb[storage] + reclamation.disk_gb > budget_gb:
+            continue
+        if _start_purge(reclamation):
+            if reclamation.status == 'reclaimed':
+                reclaimed += 1
+                continue
+            in_flight[storage] += 1
+            spent_gb[storage] += reclamation.disk_gb
+            started += 1
+
+    if reclaimed or started:
+        invalidate_fleet_snapshot()
+    return reclaimed, started
+
+
+def get_reclaiming_vms():
+    """{vmid: DiskReclamation} for VMs that are stopped and waiting to be purged"""
+    return {
+        reclamation.vm_id: reclamation
+        for reclamation in DiskReclamation.objects.filter(status__in=['pending', 'purging'])
+    }
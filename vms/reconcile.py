@@ -0,0 +1,205 @@
+"""
+Fleet reconciliation between the database and Proxmox.
+
+Both inventories are loaded once (one /cluster/resources call and a few
+flat queries) and compared as sets keyed by VMID, so a run stays cheap at
+tens of thousands of VMs. The report lists:
+
+    orphans           VMs this app created (a VMID from PROXMOX_VMID_RANGE and
+                      one of its names) that nothing in the database owns
+    unmanaged         other VMs nothing owns, e.g. the cluster's own
+                      infrastructure; only ever reported
+    missing           active or suspended services whose VM doesn't exist
+    power_mismatches  VMs running while suspended, or stopped while active
+    resource_drift    VMs whose cores, memory or disk differ from the plan
+    node_drift        services recording a different node than the VM is on
+
+Remediation is opt-in and limited to what is safe to do unattended: node
+drift is corrected in the database, suspended VMs found running are
+stopped, and orphans that have been seen for longer than the grace period
+are stopped and queued for disk reclamation. Missing VMs and resource
+drift are only reported.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from core.models import Service
+from vms.models import DiskReclamation, ProvisioningJob, VMTemplate, WarmVM
+from vms.inventory import get_cluster_resources
+from vms.power import bulk_power
+from vms.reclamation import queue_reclamation
+from vms.vmids import VMID_RANGE
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_KEY = 'reconcile:last-report'
+ORPHANS_CACHE_KEY = 'reconcile:orphans-seen'
+
+# An orphan must have been seen this long before remediation touches it, so
+# a VM whose database row is still being written is never mistaken for one
+ORPHAN_GRACE = 60 * 60
+
+# Name prefixes of the VMs this app creates: customer VMs, warm pool VMs and sized templates
+MANAGED_PREFIXES = ('vps-', 'warm-', 'tpl-')
+
+MiB = 1024 ** 2
+GiB = 1024 ** 3
+
+
+def _owned_vmids():
+    """Every VMID the database accounts for, whatever state it is in"""
+    owned = set(Service.objects.exclude(status='terminated').filter(vm_id__isnull=False).values_list('vm_id', flat=True))
+    owned.update(WarmVM.objects.filter(vm_id__isnull=False).values_list('vm_id', flat=True))
+    # Builds in progress, and failed ones that keep their VM for resume_job()
+    owned.update(ProvisioningJob.objects.exclude(status='completed').filter(vm_id__isnull=False).values_list('vm_id', flat=True))
+    # Terminated services whose disks haven't been purged yet
+    owned.update(DiskReclamation.objects.filter(status__in=['pending', 'purging', 'failed']).values_list('vm_id', flat=True))
+    # Sized templates, including one still being built
+    owned.update(VMTemplate.objects.filter(vm_id__isnull=False).values_list('vm_id', flat=True))
+    owned.update(getattr(settings, 'PROXMOX_RECONCILE_IGNORE', []))
+    template_id = getattr(settings, 'PROXMOX_TEMPLATE_ID', None)
+    if template_id:
+        owned.add(template_id)
+    return owned
+
+
+def _is_managed(vm):
+    """Whether an unowned VM is one this app created, as opposed to someone else's"""
+    start, end = getattr(settings, 'PROXMOX_VMID_RANGE', VMID_RANGE)
+    return start <= vm['vmid'] <= end and (vm.get('name') or '').startswith(MANAGED_PREFIXES)
+
+
+def _plan_drift(vm, service):
+    """List of 'field: actual != expected' for resources that differ from the plan"""
+    plan = service['plan']
+    drift = []
+    if vm.get('maxcpu') and vm['maxcpu'] != plan['cpu_cores']:
+        drift.append(f"cores: {vm['maxcpu']} != {plan['cpu_cores']}")
+    if vm.get('maxmem') and vm['maxmem'] != plan['ram_mb'] * MiB:
+        drift.append(f"memory: {vm['maxmem'] // MiB}MB != {plan['ram_mb']}MB")
+    # The template's disk may already be bigger than the plan; only a smaller disk is short-changing
+    if vm.get('maxdisk') and vm['maxdisk'] < plan['disk_gb'] * GiB:
+        drift.append(f"disk: {vm['maxdisk'] / GiB:.0f}GB < {plan['disk_gb']}GB")
+    return drift
+
+
+def build_report():
+    """Compare the database with the live cluster and return the findings as a dict"""
+    started = time.monotonic()
+    resources = get_cluster_resources(max_age=0)
+    if not resources:
+        raise RuntimeError('Could not read /cluster/resources from Proxmox')
+
+    cluster = {
+        item['vmid']: item
+        for item in resources
+        if item.get('type') == 'qemu' and 'vmid' in item
+    }
+    services = {
+        row['vm_id']: row
+        for row in Service.objects.filter(status__in=['active', 'suspended'], vm_id__isnull=False).values(
+            'id', 'vm_id', 'node', 'status',
+            'plan__cpu_cores', 'plan__ram_mb', 'plan__disk_gb'
+        )
+    }
+    for row in services.values():
+        row['plan'] = {'cpu_cores': row.pop('plan__cpu_cores'), 'ram_mb': row.pop('plan__ram_mb'), 'disk_gb': row.pop('plan__disk_gb')}
+
+    owned = _owned_vmids()
+    unowned = sorted(vmid for vmid in cluster.keys() - owned if not cluster[vmid].get('template'))
+    orphans = [vmid for vmid in unowned if _is_managed(cluster[vmid])]
+    unmanaged = [vmid for vmid in unowned if not _is_managed(cluster[vmid])]
+    missing = sorted(services.keys() - cluster.keys())
+
+    power_mismatches = []
+    resource_drift = []
+    node_drift = []
+    for vmid in services.keys() & cluster.keys():
+        service, vm = services[vmid], cluster[vmid]
+        expected = 'running' if service['status'] == 'active' else 'stopped'
+        if vm.get('status') != expected:
+            power_mismatches.append({'service_id': service['id'], 'vm_id': vmid, 'node': vm.get('node'), 'service_status': service['status'], 'vm_status': vm.get('status')})
+        drift = _plan_drift(vm, service)
+        if drift:
+            resource_drift.append({'service_id': service['id'], 'vm_id': vmid, 'drift': drift})
+        if vm.get('node') and service['node'] != vm['node']:
+            node_drift.append({'service_id': service['id'], 'vm_id': vmid, 'recorded': service['node'], 'actual': vm['node']})
+
+    return {
+        'checked_at': timezone.now().isoformat(),
+        'cluster_vms': len(cluster),
+        'services': len(services),
+        'orphans': [
+            {'vm_id': vmid, 'node': cluster[vmid].get('node'), 'name': cluster[vmid].get('name'),
+             'status': cluster[vmid].get('status'), 'maxdisk': cluster[vmid].get('maxdisk', 0)}
+            for vmid in orphans
+        ],
+        'unmanaged': [
+            {'vm_id': vmid, 'node': cluster[vmid].get('node'), 'name': cluster[vmid].get('name'), 'status': cluster[vmid].get('status')}
+            for vmid in unmanaged
+        ],
+        'missing': [{'service_id': services[vmid]['id'], 'vm_id': vmid, 'node': services[vmid]['node']} for vmid in missing],
+        'power_mismatches': sorted(power_mismatches, key=lambda item: item['vm_id']),
+        'resource_drift': sorted(resource_drift, key=lambda item: item['vm_id']),
+        'node_drift': sorted(node_drift, key=lambda item: item['vm_id']),
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+
+def _aged_orphans(orphans):
+    """Orphans first seen more than ORPHAN_GRACE ago; remembers when each was first seen"""
+    now = time.time()
+    seen = cache.get(ORPHANS_CACHE_KEY) or {}
+    seen = {orphan['vm_id']: seen.get(orphan['vm_id'], now) for orphan in orphans}
+    cache.set(ORPHANS_CACHE_KEY, seen, timeout=None)
+    grace = getattr(settings, 'PROXMOX_RECONCILE_ORPHAN_GRACE', ORPHAN_GRACE)
+    return [orphan for orphan in orphans if now - seen[orphan['vm_id']] >= grace]
+
+
+def remediate(report):
+    """Apply the safe fixes for a report; returns counts of what was done"""
+    fixed = {'node_drift': 0, 'stopped_suspended': 0, 'orphans_queued': 0}
+
+    for item in report['node_drift']:
+        fixed['node_drift'] += Service.objects.filter(id=item['service_id'], vm_id=item['vm_id']).update(node=item['actual'])
+
+    running_suspended = {
+        item['vm_id']: item['node'] for item in report['power_mismatches']
+        if item['service_status'] == 'suspended' and item['vm_status'] == 'running'
+    }
+    if running_suspended:
+        outcomes = bulk_power('stop', running_suspended)
+        fixed['stopped_suspended'] = sum(1 for outcome in outcomes.values() if outcome['status'] == 'success')
+
+    orphans = _aged_orphans(report['orphans'])
+    if orphans:
+        outcomes = bulk_power('stop', {orphan['vm_id']: orphan['node'] for orphan in orphans})
+        for orphan in orphans:
+            outcome = outcomes[orphan['vm_id']]
+            if outcome['status'] != 'error' and queue_reclamation(orphan['vm_id'], outcome['node']):
+                logger.warning(f"Orphan VM {orphan['vm_id']} ({orphan['name']}) stopped and queued for reclamation")
+                fixed['orphans_queued'] += 1
+
+    return fixed
+
+
+def reconcile_fleet(fix=False):
+    """Build a report, optionally remediate, and keep it for the admin"""
+    report = build_report()
+    if fix:
+        report['remediated'] = remediate(report)
+
+    cache.set(REPORT_CACHE_KEY, report, timeout=None)
+    logger.info(
+        f"Reconciled {report['cluster_vms']} VMs against {report['services']} services: "
+        f"{len(report['orphans'])} orphans, {len(report['unmanaged'])} unmanaged, {len(report['missing'])} missing, "
+        f"{len(report['power_mismatches'])} power mismatches, {len(report['resource_drift'])} drifted, "
+        f"{len(report['node_drift'])} on another node"
+    )
+    return report
+
+
+def get_last_report():
+    return cache.get(REPORT_CACHE_KEY)
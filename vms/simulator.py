@@ -0,0 +1,628 @@
+"""
+Proxmox simulator.
+
+Models the parts of the API that provisioning touches - template clones,
+VM configs with locks and digests, disk resizes, power tasks, backups, live
+migrations, the cluster task list and resources, node I/O wait, and the
+guest agent - with configurable timings,
+node capacity and injected failures.
+
+It can be used in-process (SimulatedManager) or served over HTTPS
+(serve(), or the run_proxmox_simulator command) so the real ProxmoxManager
+can be pointed at it with PROXMOX_HOST.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from proxmoxer.core import ResourceException
+from urllib.parse import parse_qsl, urlsplit
+from vms.metrics import api_metrics
+from vms.proxmox import ProxmoxManager
+from vms.task_watcher import TaskWatcher
+from collections import Counter
+import hashlib
+import json
+import os
+import random
+import secrets
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds each simulated operation takes
+DEFAULT_TIMINGS = {
+    'latency': 0.01,       # Every API round-trip
+    'full_clone': 20.0,
+    'linked_clone': 2.0,
+    'lock_linger': 1.0,    # A clone's lock outlives its task by this much
+    'resize': 2.0,
+    'start': 3.0,
+    'stop': 2.0,
+    'backup': 10.0,        # vzdump; the VM is locked for the whole run
+    'migrate': 5.0,        # Live migration; the VM moves node when it ends
+    'agent_ready': 15.0,   # After boot until the guest agent reports an IP
+}
+
+# Per-node capacity
+DEFAULT_CAPACITY = {
+    'cpu': 64,
+    'memory_gb': 256,
+    'storage_gb': 4096,
+}
+
+# Probability of each operation failing. 'request' fails any API call with a
+# 500; 'agent' makes a VM's guest agent never report an address.
+DEFAULT_FAILURES = {
+    'request': 0.0,
+    'clone': 0.0,
+    'resize': 0.0,
+    'start': 0.0,
+    'backup': 0.0,
+    'migrate': 0.0,
+    'agent': 0.0,
+}
+
+TEMPLATE_ID = 9000
+STORAGE = 'local-lvm'
+
+
+def _error(status_code, content):
+    messages = {400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+    return ResourceException(status_code, messages.get(status_code, 'Error'), content)
+
+
+class SimulatedCluster:
+    """
+    State of a fake cluster. Thread-safe; every call goes through request().
+    Time is real: a 20s clone takes 20s of wall clock.
+    """
+
+    def __init__(self, nodes=('pve',), timings=None, capacity=None, failures=None, seed=None,
+                 template_id=TEMPLATE_ID, template_disk_gb=10):
+        self.nodes = list(nodes)
+        self.template_node = self.nodes[0]
+        self.template_id = template_id
+        self.timings = dict(DEFAULT_TIMINGS, **(timings or {}))
+        self.capacity = dict(DEFAULT_CAPACITY, **(capacity or {}))
+        self.failures = dict(DEFAULT_FAILURES, **(failures or {}))
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._vms = {}
+        self._tasks = {}
+        self._task_seq = 0
+        self._ip_seq = 10
+        self.watcher = TaskWatcher(api_factory=lambda: SimulatedAPI(self))
+        # Fraction of CPU time each node spends waiting on I/O, set by tests
+        self.iowait = {}
+
+        self._add_vm(template_id, self.template_node, {
+            'name': 'template',
+            'cores': 1,
+            'memory': 1024,
+            'scsi0': f'{STORAGE}:base-{template_id}-disk-0,size={template_disk_gb}G',
+            'template': 1,
+        })
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a cluster from a dict, e.g. loaded from a JSON file"""
+        keys = ['nodes', 'timings', 'capacity', 'failures', 'seed', 'template_id', 'template_disk_gb']
+        return cls(**{key: config[key] for key in keys if key in config})
+
+    # State helpers, called with self._lock held
+
+    def _add_vm(self, vmid, node, config):
+        self._vms[vmid] = {
+            'node': node,
+            'config': config,
+            'lock': None,
+            'lock_until': 0,
+            'running_at': None,
+            'stopped_at': None,
+            'ip': None,
+            'agent_broken': False,
+            # A VM whose clone failed disappears when its task ends
+            'doomed_at': None,
+            # CPU use of a running VM as a fraction of its cores
+            'load': 0.0,
+            # (target node, monotonic time) while a live migration runs
+            'migrating': None,
+        }
+        self._update_digest(vmid)
+
+    def _fails(self, operation):
+        return self._random.random() < self.failures.get(operation, 0)
+
+    def _purge(self):
+        now = time.monotonic()
+        for vmid in [vmid for vmid, vm in self._vms.items() if vm['doomed_at'] and now >= vm['doomed_at']]:
+            del self._vms[vmid]
+        for vm in self._vms.values():
+            if vm['migrating'] and now >= vm['migrating'][1]:
+                vm['node'] = vm['migrating'][0]
+                vm['migrating'] = None
+
+    def _disk_gb(self, config):
+        size = config.get('scsi0', '').split('size=')[-1]
+        return int(size.rstrip('G')) if size.rstrip('G').isdigit() else 0
+
+    def _storage_used(self, node):
+        return sum(self._disk_gb(vm['config']) for vm in self._vms.values() if vm['node'] == node)
+
+    def _memory_used(self, node):
+        """MB of memory held by VMs that are running or starting"""
+        now = time.monotonic()
+        return sum(
+            int(vm['config'].get('memory', 0)) for vm in self._vms.values()
+            if vm['node'] == node and vm['running_at'] and not (vm['stopped_at'] and now >= vm['stopped_at'])
+        )
+
+    def _update_digest(self, vmid):
+        config = self._vms[vmid]['config']
+        config.pop('digest', None)
+        config['digest'] = hashlib.sha1(repr(sorted(config.items())).encode()).hexdigest()
+
+    def _current_lock(self, vm):
+        if vm['lock'] and time.monotonic() < vm['lock_until']:
+            return vm['lock']
+        return None
+
+    def _status(self, vm):
+        now = time.monotonic()
+        if vm['running_at'] and now >= vm['running_at']:
+            if not (vm['stopped_at'] and now >= vm['stopped_at']):
+                return 'running'
+        return 'stopped'
+
+    def _get_vm(self, node, vmid):
+        vm = self._vms.get(int(vmid))
+        if vm is None or vm['node'] != node:
+            raise _error(500, f"Configuration file 'nodes/{node}/qemu-server/{vmid}.conf' does not exist")
+        return vm
+
+    def _check_unlocked(self, vmid, vm):
+        lock = self._current_lock(vm)
+        if lock:
+            raise _error(500, f"VM {vmid} is locked ({lock})")
+
+    def _check_digest(self, vm, params):
+        digest = params.get('digest')
+        if digest and digest != vm['config']['digest']:
+            raise _error(500, 'detected modified configuration - file changed by other user? Try again.')
+
+    def _start_task(self, node, task_type, vmid, duration, exitstatus='OK'):
+        self._task_seq += 1
+        now = time.time()
+        upid = f"UPID:{node}:{os.getpid():08X}:{self._task_seq:08X}:{int(now):08X}:{task_type}:{vmid}:root@pam:"
+        self._tasks[upid] = {
+            'upid': upid,
+            'node': node,
+            'type': task_type,
+            'id': str(vmid),
+            'user': 'root@pam',
+            'starttime': int(now),
+            'end_at': time.monotonic() + duration,
+            'exitstatus': exitstatus,
+        }
+        return upid
+
+    def _task_entry(self, task):
+        entry = {key: task[key] for key in ('upid', 'node', 'type', 'id', 'user', 'starttime')}
+        if time.monotonic() >= task['end_at']:
+            entry['endtime'] = entry['starttime'] + 1
+            entry['status'] = task['exitstatus']
+        return entry
+
+    # API
+
+    def request(self, method, path, params=None):
+        """Handle one API call; path is a tuple of segments, e.g. ('nodes', 'pve', 'qemu', '100', 'config')"""
+        params = params or {}
+        path = tuple(str(segment) for segment in path)
+        self.calls[f"{method} {self._endpoint(path)}"] += 1
+        time.sleep(self.timings['latency'])
+        with self._lock:
+            if self._fails('request'):
+                raise _error(500, 'simulated API failure')
+            self._purge()
+            return self._dispatch(method, path, params)
+
+    def _endpoint(self, path):
+        """Path with node names, VMIDs and UPIDs replaced, for call counting"""
+        labels = []
+        for index, segment in enumerate(path):
+            previous = path[index - 1] if index else None
+            if previous == 'nodes':
+                labels.append('{node}')
+            elif previous == 'qemu':
+                labels.append('{vmid}')
+            elif previous == 'tasks' and segment.startswith('UPID:'):
+                labels.append('{upid}')
+            else:
+                labels.append(segment)
+        return '/' + '/'.join(labels)
+
+    def _dispatch(self, method, path, params):
+        if path == ('version',):
+            return {'version': '8.2.4', 'release': '8.2'}
+        if path == ('nodes',):
+            return [{'node': node, 'status': 'online'} for node in self.nodes]
+        if path == ('cluster', 'resources'):
+            return self._resources()
+        if path == ('cluster', 'tasks'):
+            return [self._task_entry(task) for task in self._tasks.values()]
+        if path == ('cluster', 'nextid'):
+            return str(max(max(self._vms) + 1, 100))
+
+        if len(path) >= 2 and path[0] == 'nodes' and path[1] in self.nodes:
+            return self._dispatch_node(method, path[1], path[2:], params)
+        raise _error(404, f"Method '{method} /{'/'.join(path)}' not implemented")
+
+    def _dispatch_node(self, method, node, path, params):
+        if path == ('status',):
+            return {'cpu': self._node_cpu(node), 'wait': self.iowait.get(node, 0.0), 'cpuinfo': {'cpus': self.capacity['cpu']}}
+        if path == ('storage',):
+            return [{'storage': STORAGE, 'type': 'lvmthin', 'content': 'images,rootdir', 'active': 1}]
+        if len(path) == 4 and path[0] == 'tasks' and path[2:] == ('status',):
+            task = self._tasks.get(path[1])
+            if task is None:
+                raise _error(500, f"no such task '{path[1]}'")
+            entry = self._task_entry(task)
+            if 'endtime' in entry:
+                return {'status': 'stopped', 'exitstatus': entry['status']}
+            return {'status': 'running'}
+        if path == ('vzdump',) and method == 'POST':
+            return self._backup(node, params)
+        if path == ('qemu',):
+            return [self._vm_entry(vmid, vm) for vmid, vm in self._vms.items() if vm['node'] == node]
+        if len(path) >= 2 and path[0] == 'qemu':
+            return self._dispatch_vm(method, node, int(path[1]), path[2:], params)
+        raise _error(404, f"Method '{method} /nodes/{node}/{'/'.join(path)}' not implemented")
+
+    def _dispatch_vm(self, method, node, vmid, path, params):
+        vm = self._get_vm(node, vmid)
+
+        if path == () and method == 'DELETE':
+            self._check_unlocked(vmid, vm)
+            if self._status(vm) == 'running':
+                raise _error(500, f"VM {vmid} is running - destroy failed")
+            del self._vms[vmid]
+            return self._start_task(node, 'qmdestroy', vmid, 0)
+
+        if path == ('config',):
+            if method == 'GET':
+                config = dict(vm['config'])
+                lock = self._current_lock(vm)
+                if lock:
+                    config['lock'] = lock
+                return config
+            self._check_unlocked(vmid, vm)
+            self._check_digest(vm, params)
+            vm['config'].update({key: value for key, value in params.items() if key != 'digest'})
+            self._update_digest(vmid)
+            # POST is the asynchronous variant and returns a task
+            return self._start_task(node, 'qmconfig', vmid, 0) if method == 'POST' else None
+
+        if path == ('clone',) and method == 'POST':
+            return self._clone(node, vmid, vm, params)
+
+        if path == ('resize',) and method == 'PUT':
+            self._check_unlocked(vmid, vm)
+            self._check_digest(vm, params)
+            disk = params.get('disk', 'scsi0')
+            new_size = int(str(params['size']).rstrip('G'))
+            grow = new_size - self._disk_gb(vm['config'])
+            if self._storage_used(node) + grow > self.capacity['storage_gb']:
+                raise _error(500, f"not enough space on storage '{STORAGE}'")
+            if self._fails('resize'):
+                return self._start_task(node, 'resize', vmid, self.timings['resize'],
+                                        exitstatus='resize failed: simulated failure')
+            volume = vm['config'].get(disk, '').split(',')[0]
+            vm['config'][disk] = f"{volume},size={new_size}G"
+            self._update_digest(vmid)
+            return self._start_task(node, 'resize', vmid, self.timings['resize'])
+
+        if path == ('template',) and method == 'POST':
+            self._check_unlocked(vmid, vm)
+            if self._status(vm) == 'running':
+                raise _error(500, f"VM {vmid} is running - convert to template failed")
+            vm['config']['template'] = 1
+            # Proxmox renames the disks to base images
+            vm['config']['scsi0'] = vm['config'].get('scsi0', '').replace(f'vm-{vmid}-', f'base-{vmid}-')
+            self._update_digest(vmid)
+            return self._start_task(node, 'qmtemplate', vmid, 0)
+
+        if path == ('migrate',) and method == 'POST':
+            return self._migrate(node, vmid, vm, params)
+
+        if path == ('status', 'current'):
+            return {'vmid': vmid, 'status': self._status(vm), 'name': vm['config'].get('name')}
+
+        if path == ('status', 'start') and method == 'POST':
+            self._check_unlocked(vmid, vm)
+            if self._status(vm) == 'running':
+                return self._start_task(node, 'qmstart', vmid, 0)
+            memory_mb = self.capacity['memory_gb'] * 1024
+            if self._memory_used(node) + int(vm['config'].get('memory', 0)) > memory_mb:
+                return self._start_task(node, 'qmstart', vmid, self.timings['start'],
+                                        exitstatus='start failed: Cannot allocate memory')
+            if self._fails('start'):
+                return self._start_task(node, 'qmstart', vmid, self.timings['start'],
+                                        exitstatus='start failed: simulated failure')
+            vm['running_at'] = time.monotonic() + self.timings['start']
+            vm['stopped_at'] = None
+            vm['agent_broken'] = self._fails('agent')
+            return self._start_task(node, 'qmstart', vmid, self.timings['start'])
+
+        if path == ('status', 'stop') and method == 'POST':
+            vm['stopped_at'] = time.monotonic() + self.timings['stop']
+            return self._start_task(node, 'qmstop', vmid, self.timings['stop'])
+
+        if path[:1] == ('agent',):
+            return self._agent(vmid, vm, path[1:])
+
+        raise _error(404, f"Method '{method} /nodes/{node}/qemu/{vmid}/{'/'.join(path)}' not implemented")
+
+    def _migrate(self, node, vmid, vm, params):
+        target = params['target']
+        if target not in self.nodes or target == node:
+            raise _error(400, f"invalid target node '{target}'")
+        self._check_unlocked(vmid, vm)
+        if self._status(vm) == 'running' and not int(params.get('online', 0)):
+            raise _error(500, "can't migrate running VM without --online")
+        duration = self.timings['migrate']
+        vm['lock'] = 'migrate'
+        vm['lock_until'] = time.monotonic() + duration
+        if self._fails('migrate'):
+            return self._start_task(node, 'qmigrate', vmid, duration, exitstatus='migration aborted')
+        vm['migrating'] = (target, time.monotonic() + duration)
+        return self._start_task(node, 'qmigrate', vmid, duration)
+
+    def _backup(self, node, params):
+        vmid = int(params['vmid'])
+        vm = self._get_vm(node, vmid)
+        self._check_unlocked(vmid, vm)
+        duration = self.timings['backup']
+        vm['lock'] = 'backup'
+        vm['lock_until'] = time.monotonic() + duration
+        if self._fails('backup'):
+            return self._start_task(node, 'vzdump', vmid, duration, exitstatus='job errors')
+        return self._start_task(node, 'vzdump', vmid, duration)
+
+    def _clone(self, node, template_id, template, params):
+        newid = int(params['newid'])
+        if newid in self._vms:
+            raise _error(500, f"unable to create VM {newid}: config file already exists")
+        target = params.get('target', node)
+        if target not in self.nodes:
+            raise _error(400, f"no such node '{target}'")
+
+        linked = not int(params.get('full', 1))
+        duration = self.timings['linked_clone' if linked else 'full_clone']
+        config = {key: value for key, value in template['config'].items() if key not in ('template', 'digest')}
+        config['name'] = params.get('name', f'vm-{newid}')
+        config['scsi0'] = config['scsi0'].replace(f'base-{template_id}', f'vm-{newid}')
+        if self._storage_used(target) + self._disk_gb(config) > self.capacity['storage_gb']:
+            raise _error(500, f"not enough space on storage '{STORAGE}'")
+        self._add_vm(newid, target, config)
+
+        vm = self._vms[newid]
+        vm['lock'] = 'clone'
+        vm['lock_until'] = time.monotonic() + duration + self.timings['lock_linger']
+        if self._fails('clone'):
+            vm['doomed_at'] = time.monotonic() + duration
+            return self._start_task(node, 'qmclone', template_id, duration, exitstatus='clone failed: simulated failure')
+        return self._start_task(node, 'qmclone', template_id, duration)
+
+    def _agent(self, vmid, vm, path):
+        ready_at = (vm['running_at'] or 0) + self.timings['agent_ready']
+        if self._status(vm) != 'running' or time.monotonic() < ready_at or vm['agent_broken']:
+            raise _error(500, 'QEMU guest agent is not running')
+        if path != ('network-get-interfaces',):
+            return {'result': {}}
+        if vm['ip'] is None:
+            self._ip_seq += 1
+            vm['ip'] = f"10.0.{self._ip_seq // 250}.{self._ip_seq % 250 + 2}"
+        return {'result': [
+            {'name': 'lo', 'ip-addresses': [{'ip-address-type': 'ipv4', 'ip-address': '127.0.0.1'}]},
+            {'name': 'eth0', 'ip-addresses': [{'ip-address-type': 'ipv4', 'ip-address': vm['ip']}]},
+        ]}
+
+    def _node_cpu(self, node):
+        busy = sum(
+            vm['load'] * int(vm['config'].get('cores', 1)) for vm in self._vms.values()
+            if vm['node'] == node and self._status(vm) == 'running'
+        )
+        return min(busy / self.capacity['cpu'], 1.0)
+
+    def _vm_entry(self, vmid, vm):
+        config = vm['config']
+        running = self._status(vm) == 'running'
+        entry = {
+            'type': 'qemu',
+            'id': f'qemu/{vmid}',
+            'vmid': vmid,
+            'node': vm['node'],
+            'name': config.get('name'),
+            'status': self._status(vm),
+            'template': config.get('template', 0),
+            'maxcpu': int(config.get('cores', 1)),
+            'maxmem': int(config.get('memory', 1024)) * 1024 * 1024,
+            'maxdisk': self._disk_gb(config) * 1024 ** 3,
+            'cpu': vm['load'] if running else 0,
+            'mem': int(config.get('memory', 1024)) * 1024 * 1024 // 2 if running else 0,
+        }
+        lock = self._current_lock(vm)
+        if lock:
+            entry['lock'] = lock
+        return entry
+
+    def _resources(self):
+        resources = []
+        for node in self.nodes:
+            resources.append({
+                'type': 'node', 'id': f'node/{node}', 'node': node, 'status': 'online',
+                'maxcpu': self.capacity['cpu'], 'cpu': self._node_cpu(node),
+                'maxmem': self.capacity['memory_gb'] * 1024 ** 3,
+                'mem': self._memory_used(node) * 1024 ** 2,
+            })
+            resources.append({
+                'type': 'storage', 'id': f'storage/{node}/{STORAGE}', 'node': node, 'storage': STORAGE,
+                'plugintype': 'lvmthin', 'content': 'images,rootdir', 'shared': 0,
+                'maxdisk': self.capacity['storage_gb'] * 1024 ** 3,
+                'disk': self._storage_used(node) * 1024 ** 3, 'status': 'available',
+            })
+        resources.extend(self._vm_entry(vmid, vm) for vmid, vm in self._vms.items())
+        return resources
+
+
+class SimulatedAPI:
+    """
+    proxmoxer-style client for a SimulatedCluster, so code written against
+    ProxmoxAPI runs unchanged: api.nodes('pve').qemu(100).config.get()
+    """
+
+    def __init__(self, cluster, path=()):
+        self._cluster = cluster
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return SimulatedAPI(self._cluster, self._path + (name,))
+
+    def __call__(self, *segments):
+        return SimulatedAPI(self._cluster, self._path + tuple(str(s) for s in segments))
+
+    def _request(self, method, args, params):
+        path = self._path + tuple(str(a) for a in args)
+        started = time.perf_counter()
+        error = None
+        try:
+            return self._cluster.request(method, path, params)
+        except ResourceException as e:
+            error = f'http_{e.status_code}'
+            raise
+        finally:
+            # Recorded like a pooled connection's requests so in-process runs
+            # show the same metrics
+            api_metrics.observe_request(method, '/' + '/'.join(path), time.perf_counter() - started, error)
+
+    def get(self, *args, **params):
+        return self._request('GET', args, params)
+
+    def post(self, *args, **params):
+        return self._request('POST', args, params)
+
+    def put(self, *args, **params):
+        return self._request('PUT', args, params)
+
+    def delete(self, *args, **params):
+        return self._request('DELETE', args, params)
+
+
+class SimulatedManager(ProxmoxManager):
+    """ProxmoxManager talking to a SimulatedCluster instead of the shared connection"""
+
+    def __init__(self, cluster, node=None):
+        super().__init__(node=node or cluster.nodes[0])
+        self.template_node = cluster.template_node
+        self.watcher = cluster.watcher
+        self._api = SimulatedAPI(cluster)
+
+    @property
+    def proxmox(self):
+        return self._api
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Speaks the Proxmox REST conventions: /api2/json/..., form bodies, {"data": ...} replies"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body))
+
+        path = url.path
+        if not path.startswith('/api2/json'):
+            return self._reply(404, None, 'Not Found')
+        path = tuple(segment for segment in path[len('/api2/json'):].split('/') if segment)
+
+        if path == ('access', 'ticket') and method == 'POST':
+            return self._reply(200, {
+                'username': params.get('username'),
+                'ticket': f"PVE:{params.get('username')}:{secrets.token_hex(16)}",
+                'CSRFPreventionToken': secrets.token_hex(16),
+            })
+        if 'PVEAuthCookie' not in self.headers.get('Cookie', '') and \
+                not self.headers.get('Authorization', '').startswith('PVEAPIToken'):
+            return self._reply(401, None, 'No ticket')
+
+        try:
+            data = self.server.cluster.request(method, path, params)
+        except ResourceException as e:
+            return self._reply(e.status_code, None, e.content)
+        return self._reply(200, data)
+
+    def _reply(self, status, data, message=None):
+        body = json.dumps({'data': data}).encode()
+        # Proxmox puts the error text in the reason phrase; proxmoxer reads it from there
+        self.send_response(status, message)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def serve(cluster, host='127.0.0.1', port=8006, certfile=None, keyfile=None):
+    """
+    Build an HTTPS server for the cluster; call serve_forever() on it.
+    proxmoxer only speaks HTTPS, so a certificate is required.
+    """
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.daemon_threads = True
+    server.cluster = cluster
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    return server
+
+
+def generate_self_signed_cert():
+    """Create a throwaway certificate for serve(); returns (certfile, keyfile)"""
+    directory = tempfile.mkdtemp(prefix='proxmox-simulator-')
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '7',
+         '-subj', '/CN=localhost', '-keyout', keyfile, '-out', certfile],
+        check=True, capture_output=True
+    )
+    return certfile, keyfile
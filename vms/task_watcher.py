@@ -0,0 +1,241 @@
+from concurrent.futures import Future
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Poll interval bounds in seconds. The watcher starts fast and backs off while
+# nothing changes, then drops back to the minimum when a task finishes or a new
+# one is registered.
+MIN_INTERVAL = 0.5
+MAX_INTERVAL = 5
+BACKOFF_FACTOR = 1.5
+
+# /cluster/tasks only returns recent entries. A UPID that hasn't shown up after
+# this many sweeps is looked up directly on its node instead.
+DIRECT_LOOKUP_AFTER = 3
+
+# Give up on a task nobody has resolved after this long
+WATCH_EXPIRY = 60 * 60
+
+
+def parse_upid(upid):
+    """
+    Split a UPID into its parts.
+    Format: UPID:node:pid:pstart:starttime:type:id:user:
+    """
+    parts = upid.split(':')
+    if len(parts) < 8 or parts[0] != 'UPID':
+        return None
+    return {
+        'node': parts[1],
+        'type': parts[5],
+        'id': parts[6],
+        'user': parts[7],
+    }
+
+
+class _Watch:
+    def __init__(self, upid):
+        self.upid = upid
+        self.future = Future()
+        self.misses = 0
+        self.created_at = time.monotonic()
+
+
+class TaskWatcher:
+    """
+    Tracks every in-flight Proxmox task (UPID) in this process.
+
+    A single background thread resolves all of them from one /cluster/tasks
+    request per sweep, instead of each caller polling its own
+    /nodes/{node}/tasks/{upid}/status. Callers get a Future, or can register
+    a callback.
+    """
+
+    def __init__(self, api_factory=None):
+        self._api_factory = api_factory
+        self._reset_state()
+
+    def _reset_state(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._watches = {}
+        self._thread = None
+        self._last_tasks = {}
+        self._last_sweep = 0
+
+    def watch(self, upid, callback=None):
+        """
+        Start tracking a task and return a Future.
+
+        The Future resolves to the task status dict ({'status': 'stopped',
+        'exitstatus': ...}) once the task has finished.
+        """
+        with self._lock:
+            watch = self._watches.get(upid)
+            if watch is None:
+                watch = _Watch(upid)
+                self._watches[upid] = watch
+            self._ensure_thread()
+
+        if callback:
+            watch.future.add_done_callback(lambda future: callback(upid, future.result()))
+
+        self._wakeup.set()
+        return watch.future
+
+    def wait(self, upid, timeout=300):
+        """Block until the task finishes; return its status dict or None on timeout"""
+        future = self.watch(upid)
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def poll(self, upid, max_age=MIN_INTERVAL):
+        """
+        Non-blocking status check for a single task.
+
+        Returns the status dict if the task has finished, otherwise None.
+        Uses the last cluster sweep when it is fresh enough, so many pollers in
+        the same process share one request.
+        """
+        with self._lock:
+            watch = self._watches.get(upid)
+            if watch and watch.future.done():
+                return watch.future.result()
+            stale = (time.monotonic() - self._last_sweep) > max_age
+
+        if stale:
+            self._sweep({upid})
+
+        with self._lock:
+            task = self._last_tasks.get(upid)
+        if task is not None:
+            if task.get('endtime'):
+                return {'status': 'stopped', 'exitstatus': task.get('status')}
+            return None
+
+        # Not in the cluster list yet; ask the node directly
+        api = self._get_api()
+        info = parse_upid(upid)
+        if api is None or info is None:
+            return None
+        try:
+            status = api.nodes(info['node']).tasks(upid).status.get()
+        except Exception as e:
+            logger.debug(f"Error checking task status: {str(e)}")
+            return None
+        if status.get('status') == 'stopped':
+            return status
+        return None
+
+    def pending(self):
+        """UPIDs that are still being watched"""
+        with self._lock:
+            return [upid for upid, watch in self._watches.items() if not watch.future.done()]
+
+    def _get_api(self):
+        if self._api_factory:
+            return self._api_factory()
+        from vms.proxmox import ProxmoxManager
+        return ProxmoxManager().proxmox
+
+    def _ensure_thread(self):
+        # Called with self._lock held
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='proxmox-task-watcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = MIN_INTERVAL
+        while True:
+            with self._lock:
+                upids = {upid for upid, watch in self._watches.items() if not watch.future.done()}
+                if not upids:
+                    self._thread = None
+                    return
+
+            resolved = self._sweep(upids)
+            if resolved:
+                interval = MIN_INTERVAL
+            else:
+                interval = min(interval * BACKOFF_FACTOR, MAX_INTERVAL)
+
+            # A new watch wakes us early so its first check isn't delayed
+            if self._wakeup.wait(interval):
+                self._wakeup.clear()
+                interval = MIN_INTERVAL
+
+    def _sweep(self, upids):
+        """Fetch the cluster task list once and resolve every finished watch"""
+        api = self._get_api()
+        if api is None:
+            return 0
+
+        try:
+            tasks = api.cluster.tasks.get()
+        except Exception as e:
+            logger.debug(f"Error fetching cluster tasks: {str(e)}")
+            return 0
+
+        by_upid = {task['upid']: task for task in tasks if 'upid' in task}
+        finished = []
+        missing = []
+
+        with self._lock:
+            self._last_tasks = by_upid
+            self._last_sweep = time.monotonic()
+            for upid in upids:
+                watch = self._watches.get(upid)
+                if watch is None or watch.future.done():
+                    continue
+                task = by_upid.get(upid)
+                if task is None:
+                    watch.misses += 1
+                    if watch.misses >= DIRECT_LOOKUP_AFTER:
+                        missing.append(watch)
+                elif task.get('endtime'):
+                    finished.append((watch, {'status': 'stopped', 'exitstatus': task.get('status')}))
+
+        for watch in missing:
+            info = parse_upid(watch.upid)
+            if info is None:
+                finished.append((watch, {'status': 'stopped', 'exitstatus': 'invalid UPID'}))
+                continue
+            try:
+                status = api.nodes(info['node']).tasks(watch.upid).status.get()
+            except Exception as e:
+                logger.debug(f"Error checking task status: {str(e)}")
+                continue
+            watch.misses = 0
+            if status.get('status') == 'stopped':
+                finished.append((watch, status))
+
+        for watch, status in finished:
+            with self._lock:
+                self._watches.pop(watch.upid, None)
+            if not watch.future.done():
+                watch.future.set_result(status)
+
+        now = time.monotonic()
+        with self._lock:
+            expired = [watch for watch in self._watches.values() if now - watch.created_at > WATCH_EXPIRY]
+            for watch in expired:
+                del self._watches[watch.upid]
+        for watch in expired:
+            logger.warning(f"Stopped watching task {watch.upid} after {WATCH_EXPIRY} seconds")
+            if not watch.future.done():
+                watch.future.set_exception(TimeoutError(watch.upid))
+
+        return len(finished)
+
+
+task_watcher = TaskWatcher()
+
+if hasattr(os, 'register_at_fork'):
+    # The watcher thread doesn't survive a fork; start clean in the child
+    os.register_at_fork(after_in_child=task_watcher._reset_state)
@@ -0,0 +1,311 @@
+from celery import shared_task
+from django.conf import settings
+from core.models import Plan, Service
+from vms.models import VMTemplate, WarmVM
+from vms.proxmox import ProxmoxManager
+from vms.task_watcher import task_watcher
+from vms.windows import in_offpeak_window
+from vms.ip_resolver import resolve_pending_ips
+from vms.vmids import vmid_allocator
+from vms.reclamation import reclaim_disks
+from vms.timeseries import collect_metrics, rollup_metrics
+from vms.bandwidth import account_bandwidth
+from vms.reconcile import reconcile_fleet
+from vms.backups import run_backups, schedule_backups
+from vms.rebalance import rebalance
+from vms.catalog import build_template
+from vms.circuit import ProxmoxUnavailable, proxmox_guard
+from vms import health as cluster_health, pipeline, warm_pool
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refill_warm_pools():
+    """Top up every plan's warm pool on each node it fits"""
+    try:
+        with proxmox_guard('maintenance'):
+            return _refill_warm_pools()
+    except ProxmoxUnavailable as e:
+        # Runs again on the next beat
+        return {'status': 'deferred', 'message': str(e)}
+
+
+def _clear_failed_warm_vm(warm_vm):
+    """Delete a failed pool VM; returns True once it is confirmed gone from the cluster"""
+    proxmox = ProxmoxManager(node=warm_vm.node)
+    status = proxmox.get_vm_statuses([warm_vm.vm_id])[warm_vm.vm_id]
+    if status == 'missing':
+        return True
+    if status != 'unknown':
+        proxmox.delete_vm(warm_vm.vm_id)
+    return False
+
+
+def _refill_warm_pools():
+    # Failed builds hold a VMID and possibly a half-made VM; clear them first.
+    # The row is the only record of the VMID, so it stays (failed) until a
+    # later sweep finds the VM gone
+    for warm_vm in WarmVM.objects.filter(status='failed'):
+        if warm_vm.vm_id and not _clear_failed_warm_vm(warm_vm):
+            continue
+        warm_vm.delete()
+
+    # Pools that were shrunk from the admin give back their oldest VMs
+    for plan in Plan.objects.all():
+        for node, surplus in warm_pool.get_pool_surplus(plan).items():
+            oldest = WarmVM.objects.filter(plan=plan, node=node, status='ready').order_by('ready_at')[:surplus]
+            # Conditional update so a VM claimed in the meantime is left alone;
+            # the failed-VM sweep above deletes these on the next run
+            WarmVM.objects.filter(id__in=list(oldest.values_list('id', flat=True)), status='ready').update(
+                status='failed',
+                error_message='Removed from shrunk pool'
+            )
+
+    queued = 0
+    for plan in Plan.objects.filter(is_active=True, warm_pool_size__gt=0):
+        for node, missing in warm_pool.get_pool_deficits(plan).items():
+            for _ in range(missing):
+                warm_vm = WarmVM.objects.create(plan=plan, node=node)
+                provision_warm_vm_task.delay(warm_vm.id)
+                queued += 1
+
+    if queued:
+        logger.info(f"Queued {queued} warm VMs")
+    return {'status': 'success', 'queued': queued}
+
+
+@shared_task
+def provision_warm_vm_task(warm_vm_id):
+    """Build one pool VM in the background"""
+    try:
+        warm_vm = WarmVM.objects.select_related('plan').get(id=warm_vm_id)
+        proxmox = ProxmoxManager(node=warm_vm.node)
+        with proxmox_guard('maintenance'):
+            result = warm_pool.provision_warm_vm(warm_vm, proxmox)
+        return {'status': result['status'], 'vmid': warm_vm.vm_id}
+    except ProxmoxUnavailable as e:
+        provision_warm_vm_task.apply_async((warm_vm_id,), countdown=e.countdown)
+        return {'status': 'deferred', 'message': str(e)}
+    except WarmVM.DoesNotExist:
+        return {'status': 'error', 'message': 'Warm VM not found'}
+    except Exception as e:
+        logger.error(f"Exception provisioning warm VM {warm_vm_id}: {str(e)}")
+        WarmVM.objects.filter(id=warm_vm_id).update(status='failed', error_message=str(e))
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task
+def build_vm_template_task(template_id):
+    """Build one sized template for the catalog in the background"""
+    try:
+        template = VMTemplate.objects.get(id=template_id, status='building')
+        with proxmox_guard('maintenance'):
+            built = build_template(template)
+        return {'status': 'success' if built else 'error', 'vmid': template.vm_id}
+    except ProxmoxUnavailable as e:
+        build_vm_template_task.apply_async((template_id,), countdown=e.countdown)
+        return {'status': 'deferred', 'message': str(e)}
+    except VMTemplate.DoesNotExist:
+        return {'status': 'skipped', 'message': 'Template is not waiting to be built'}
+
+
+@shared_task
+def promote_linked_clones():
+    """
+    Convert linked clones to independent full clones during off-peak hours.
+    Finishes promotions already running, then starts a small batch of new ones.
+    """
+    try:
+        with proxmox_guard('maintenance'):
+            return _promote_linked_clones()
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'message': str(e)}
+
+
+def _promote_linked_clones():
+    # Check running promotions first, whatever the hour
+    promoted = 0
+    for service in Service.objects.filter(promotion_status='promoting'):
+        status = task_watcher.poll(service.promotion_task)
+        if status is None:
+            continue
+        if status.get('exitstatus') == 'OK':
+            service.promotion_status = 'promoted'
+            service.clone_mode = 'full'
+            promoted += 1
+            logger.info(f"VM {service.vm_id} promoted to a full clone")
+        else:
+            service.promotion_status = 'failed'
+            logger.error(f"Promotion of VM {service.vm_id} failed: {status.get('exitstatus')}")
+        service.promotion_task = ''
+        service.save(update_fields=['promotion_status', 'clone_mode', 'promotion_task'])
+
+    storage = getattr(settings, 'PROXMOX_PROMOTION_STORAGE', None)
+    if not storage or not in_offpeak_window():
+        return {'status': 'success', 'promoted': promoted, 'started': 0}
+
+    batch = getattr(settings, 'PROXMOX_PROMOTION_BATCH', 2)
+    running = Service.objects.filter(promotion_status='promoting').count()
+    started = 0
+    candidates = Service.objects.filter(
+        promotion_status='pending',
+        vm_id__isnull=False
+    ).exclude(status='terminated').order_by('activated_at')[:max(batch - running, 0)]
+
+    for service in candidates:
+        upid = ProxmoxManager(node=service.node).promote_linked_clone(service.vm_id, storage)
+        if upid:
+            service.promotion_status = 'promoting'
+            service.promotion_task = upid
+            service.save(update_fields=['promotion_status', 'promotion_task'])
+            started += 1
+
+    return {'status': 'success', 'promoted': promoted, 'started': started}
+
+
+@shared_task
+def run_provisioning_step(job_id):
+    """
+    Advance a provisioning job.
+    Runs steps back to back while they finish immediately, then re-queues
+    itself with a countdown instead of sleeping.
+    """
+    try:
+        with proxmox_guard('provision'):
+            countdown = pipeline.advance(job_id)
+            while countdown == 0:
+                countdown = pipeline.advance(job_id)
+    except ProxmoxUnavailable as e:
+        countdown = e.countdown
+
+    if countdown is not None:
+        run_provisioning_step.apply_async((job_id,), countdown=countdown)
+    return {'status': 'success', 'job_id': job_id, 'next_run_in': countdown}
+
+
+@shared_task
+def resolve_pending_ips_task():
+    """Fill in IPs for active services whose guest agent hadn't reported one yet"""
+    try:
+        with proxmox_guard('maintenance'):
+            resolved, timed_out = resolve_pending_ips()
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'message': str(e)}
+    return {'status': 'success', 'resolved': resolved, 'timed_out': timed_out}
+
+
+@shared_task
+def reconcile_vmid_allocator():
+    """Keep the VMID counter ahead of VMs that were created outside the allocator"""
+    try:
+        with proxmox_guard('maintenance'):
+            next_vmid = vmid_allocator.reconcile()
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'message': str(e)}
+    return {'status': 'success', 'next_vmid': next_vmid}
+
+
+@shared_task
+def refresh_cluster_health():
+    """Keep the shared Proxmox health check fresh so provisioning doesn't have to probe"""
+    try:
+        health = cluster_health.probe()
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'message': str(e)}
+    return {'status': 'success' if health['healthy'] else 'error', 'message': health['error']}
+
+
+@shared_task
+def reclaim_disks_task():
+    """Purge the disks of terminated services, throttled per storage, in the reclamation window"""
+    try:
+        with proxmox_guard('maintenance'):
+            reclaimed, started = reclaim_disks()
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'message': str(e)}
+    return {'status': 'success', 'reclaimed': reclaimed, 'started': started}
+
+
+@shared_task
+def run_backups_task():
+    """Queue due backups and start them within the backup window, per-storage and per-node limits"""
+    queued = schedule_backups()
+    try:
+        with proxmox_guard('maintenance'):
+            completed, started = run_backups()
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'queued': queued, 'message': str(e)}
+    return {'status': 'success', 'queued': queued, 'completed': completed, 'started': started}
+
+
+@shared_task
+def rebalance_nodes_task():
+    """Live-migrate VMs off nodes whose CPU, memory or I/O wait is past its threshold"""
+    if not getattr(settings, 'PROXMOX_REBALANCE_ENABLED', False):
+        return {'status': 'skipped', 'message': 'Rebalancing is disabled'}
+    try:
+        with proxmox_guard('maintenance'):
+            completed, started = rebalance()
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'message': str(e)}
+    return {'status': 'success', 'completed': completed, 'started': started}
+
+
+@shared_task
+def collect_metrics_task():
+    """Sample CPU, memory, disk and network of every VM and node from one cluster snapshot"""
+    try:
+        with proxmox_guard('maintenance'):
+            stored = collect_metrics()
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'message': str(e)}
+    return {'status': 'success', 'stored': stored}
+
+
+@shared_task
+def rollup_metrics_task():
+    """Roll raw metrics up to 5-minute, hourly and daily buckets and apply retention"""
+    written, deleted = rollup_metrics()
+    return {'status': 'success', 'written': {str(resolution): rows for resolution, rows in written.items()}, 'deleted': deleted}
+
+
+@shared_task
+def account_bandwidth_task():
+    """Add each VM's network traffic to its service's billing-cycle totals"""
+    from core.tasks import send_bandwidth_alert_email
+
+    try:
+        with proxmox_guard('maintenance'):
+            updated, alerts = account_bandwidth()
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'message': str(e)}
+
+    for service_id, level in alerts:
+        send_bandwidth_alert_email.delay(service_id, level)
+    return {'status': 'success', 'updated': updated, 'alerts': len(alerts)}
+
+
+@shared_task
+def reconcile_fleet_task():
+    """Compare services with the VMs that actually exist; fixes the safe cases if PROXMOX_RECONCILE_AUTOFIX is on"""
+    try:
+        with proxmox_guard('maintenance'):
+            report = reconcile_fleet(fix=getattr(settings, 'PROXMOX_RECONCILE_AUTOFIX', False))
+    except ProxmoxUnavailable as e:
+        return {'status': 'deferred', 'message': str(e)}
+    except Exception as e:
+        logger.error(f"Fleet reconciliation failed: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
+
+    return {
+        'status': 'success',
+        'orphans': len(report['orphans']),
+        'unmanaged': len(report['unmanaged']),
+        'missing': len(report['missing']),
+        'power_mismatches': len(report['power_mismatches']),
+        'resource_drift': len(report['resource_drift']),
+        'node_drift': len(report['node_drift']),
+        'remediated': report.get('remediated'),
+    }
@@ -1,3 +1,343 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from core.models import Plan, Service
+from vms import pipeline
+from vms.backups import _prune_records
+from vms.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from vms.models import Backup, DiskReclamation, ProvisioningJob
+from vms.reclamation import _start_purge
+from vms.simulator import SimulatedCluster, SimulatedManager
+from vms.vmids import VMIDAllocator
+import time
 
-# Create your tests here.
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'vms-tests'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SimulatedClusterTestCase(TransactionTestCase):
+    """Runs against an in-process SimulatedCluster with a fresh cache per test"""
+
+    nodes = ('pve1',)
+    timings = {'latency': 0, 'full_clone': 0.2, 'lock_linger': 0.1, 'resize': 0.1, 'start': 0.1, 'stop': 0.1, 'agent_ready': 0.1}
+
+    def setUp(self):
+        cache.clear()
+        self.cluster = SimulatedCluster(nodes=self.nodes, timings=self.timings)
+        self.proxmox = SimulatedManager(self.cluster)
+
+    def manager(self, node=None):
+        return SimulatedManager(self.cluster, node)
+
+    def make_service(self, **fields):
+        count = Service.objects.count()
+        user = get_user_model().objects.create(username=f'customer{count}', email=f'customer{count}@example.com')
+        plan = Plan.objects.create(name='VPS 2', plan_type='vps', cpu_cores=2, ram_mb=2048, disk_gb=20,
+                                   bandwidth_gb=1000, price_monthly=10)
+        return Service.objects.create(user=user, plan=plan, price=10, next_due_date=timezone.now() + timedelta(days=30), **fields)
+
+    def add_vm(self, vmid, name, node=None, disk_gb=10):
+        self.cluster._add_vm(vmid, node or self.cluster.nodes[0], {
+            'name': name,
+            'cores': 1,
+            'memory': 1024,
+            'scsi0': f'local-lvm:vm-{vmid}-disk-0,size={disk_gb}G',
+        })
+
+
+@override_settings(PROXMOX_VMID_RANGE=(100, 119), PROXMOX_VMID_BLOCK_SIZE=5)
+class VMIDAllocatorTests(SimulatedClusterTestCase):
+
+    def test_allocates_unique_ids_across_allocators(self):
+        first, second = VMIDAllocator(), VMIDAllocator()
+        ids = [first.allocate(self.proxmox), second.allocate(self.proxmox), first.allocate(self.proxmox)]
+        self.assertEqual(ids, [100, 105, 101])
+
+    def test_reservation_survives_rolled_back_transaction(self):
+        allocator = VMIDAllocator()
+        allocator.reserve()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                taken = [allocator.allocate(self.proxmox)]
+                raise RuntimeError('step failed')
+
+        taken += [allocator.allocate(self.proxmox) for _ in range(4)]
+        self.assertEqual(taken, [100, 101, 102, 103, 104])
+        self.assertEqual(VMIDAllocator().allocate(self.proxmox), 105)
+
+    def test_reserving_inside_transaction_is_refused(self):
+        with transaction.atomic():
+            with self.assertRaises(RuntimeError):
+                VMIDAllocator().allocate(self.proxmox)
+
+    def test_skips_ids_used_in_cluster(self):
+        self.add_vm(100, 'manual')
+        self.add_vm(101, 'manual')
+        self.assertEqual(VMIDAllocator().allocate(self.proxmox), 102)
+
+    @override_settings(PROXMOX_VMID_RANGE=(100, 107))
+    def test_wraps_around_at_end_of_range(self):
+        allocator = VMIDAllocator()
+        ids = [allocator.allocate(self.proxmox) for _ in range(8)]
+        self.assertEqual(ids, list(range(100, 108)))
+        self.assertEqual(allocator.allocate(self.proxmox), 100)
+
+    @override_settings(PROXMOX_VMID_RANGE=(100, 101))
+    def test_full_range_raises(self):
+        self.add_vm(100, 'manual')
+        self.add_vm(101, 'manual')
+        with self.assertRaises(RuntimeError):
+            VMIDAllocator().allocate(self.proxmox)
+
+
+@override_settings(PROXMOX_TEMPLATE_NODE='pve1', PROXMOX_LINKED_CLONES=False)
+class PipelineTests(SimulatedClusterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.settings_override = override_settings(PROXMOX_TEMPLATE_ID=self.cluster.template_id)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        for target in ('vms.pipeline.ProxmoxManager', 'vms.proxmox.ProxmoxManager'):
+            patcher = mock.patch(target, self.manager)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.credentials_email = self._patch_task('send_service_credentials_email')
+        self.failed_email = self._patch_task('send_vm_deployment_failed_email')
+        self.service = self.make_service(node='pve1')
+
+    def _patch_task(self, name):
+        patcher = mock.patch(f'core.tasks.{name}.delay')
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def run_job(self, job, limit=50):
+        for _ in range(limit):
+            countdown = pipeline.advance(job.id)
+            if countdown is None:
+                break
+            if countdown:
+                time.sleep(0.1)
+        job.refresh_from_db()
+        return job
+
+    def job_at(self, step, vm_id, **fields):
+        return ProvisioningJob.objects.create(
+            service=self.service, step=step, vm_id=vm_id, node='pve1', password='secret', step_started_at=timezone.now(), **fields
+        )
+
+    def test_provisions_vm_end_to_end(self):
+        job = self.run_job(pipeline.start_job(self.service))
+
+        self.assertEqual(job.status, 'completed')
+        self.service.refresh_from_db()
+        self.assertEqual(self.service.status, 'active')
+        self.assertEqual(self.service.vm_id, job.vm_id)
+        config = self.manager().get_vm_config(job.vm_id, cached=False)
+        self.assertEqual(config['name'], f'vps-{self.service.user.username}-{job.vm_id}')
+        self.assertIn('size=20G', config['scsi0'])
+        self.assertEqual(config['cores'], 2)
+        self.credentials_email.assert_called_once_with(self.service.id)
+
+    def test_resumed_job_keeps_its_clone(self):
+        self.add_vm(1500, f'vps-{self.service.user.username}-1500')
+        job = self.job_at('clone', 1500, status='failed', attempts=3)
+
+        pipeline.start_job(self.service)
+        self.assertEqual(pipeline.advance(job.id), 0)
+
+        job.refresh_from_db()
+        self.assertEqual((job.step, job.status, job.attempts), ('resize', 'running', 0))
+        self.assertFalse([call for call in self.cluster.calls if 'clone' in call])
+
+    def test_clone_step_refuses_another_vm_with_the_same_id(self):
+        self.add_vm(1500, 'vps-someone-else-1500')
+        job = self.job_at('clone', 1500)
+
+        pipeline.advance(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.step, job.status, job.attempts), ('clone', 'waiting', 1))
+        self.assertIn('already taken', job.last_error)
+
+    def test_locked_vm_waits_without_using_an_attempt(self):
+        self.add_vm(1500, 'vps-locked-1500')
+        vm = self.cluster._vms[1500]
+        vm['lock'], vm['lock_until'] = 'backup', time.monotonic() + 60
+        job = self.job_at('resize', 1500)
+
+        self.assertGreaterEqual(pipeline.advance(job.id), pipeline.MIN_POLL)
+
+        job.refresh_from_db()
+        self.assertEqual((job.step, job.status, job.attempts), ('resize', 'waiting', 0))
+
+    def test_digest_conflict_rereads_config(self):
+        self.add_vm(1500, 'vps-stale-1500')
+        proxmox = self.manager()
+        proxmox.get_vm_config(1500)
+        # Changed behind the config cache's back
+        proxmox.proxmox.nodes('pve1').qemu(1500).config.put(description='changed')
+        job = self.job_at('configure', 1500)
+
+        self.assertGreaterEqual(pipeline.advance(job.id), pipeline.MIN_POLL)
+        job.refresh_from_db()
+        self.assertEqual((job.step, job.attempts), ('configure', 0))
+
+        self.assertEqual(pipeline.advance(job.id), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.step, 'start')
+        self.assertEqual(proxmox.get_vm_config(1500, cached=False)['cores'], 2)
+
+    def test_job_fails_after_max_attempts(self):
+        job = self.job_at('configure', 1599)
+
+        countdowns = [pipeline.advance(job.id) for _ in range(pipeline.MAX_ATTEMPTS)]
+
+        self.assertEqual(countdowns, [pipeline.RETRY_BACKOFF, pipeline.RETRY_BACKOFF * 2, None])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', pipeline.MAX_ATTEMPTS))
+        self.failed_email.assert_called_once_with(self.service.id, job.last_error)
+        self.assertIsNone(pipeline.advance(job.id))
+
+
+@override_settings(CACHES=LOCMEM_CACHE, PROXMOX_BREAKER_THRESHOLD=3, PROXMOX_BREAKER_RESET_TIMEOUT=30)
+class CircuitBreakerTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('tests')
+        self.now = 1000.0
+        patcher = mock.patch('vms.circuit.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail(self, times):
+        for _ in range(times):
+            self.breaker.after_request(self.breaker.before_request(), ok=False)
+
+    def test_opens_after_threshold_consecutive_failures(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state(), CLOSED)
+        self.fail(1)
+        self.assertEqual(self.breaker.state(), OPEN)
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.before_request()
+        self.assertEqual(raised.exception.countdown, 30)
+
+    def test_success_resets_failure_count(self):
+        self.fail(2)
+        self.breaker.after_request(self.breaker.before_request(), ok=True)
+        self.fail(2)
+        self.assertEqual(self.breaker.state(), CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.fail(3)
+        self.now += 31
+        self.assertEqual(self.breaker.state(), HALF_OPEN)
+
+        ticket = self.breaker.before_request()
+        self.assertEqual(ticket[1], True)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request()
+
+        self.breaker.after_request(ticket, ok=True)
+        self.assertEqual(self.breaker.state(), CLOSED)
+        self.assertEqual(self.breaker.before_request(), (0, False))
+
+    def test_failed_probe_opens_again(self):
+        self.fail(3)
+        self.now += 31
+        self.breaker.after_request(self.breaker.before_request(), ok=False)
+
+        self.assertEqual(self.breaker.state(), OPEN)
+        self.now += 31
+        self.assertEqual(self.breaker.state(), HALF_OPEN)
+        self.assertEqual(self.breaker.before_request()[1], True)
+
+
+@override_settings(PROXMOX_RECLAIM_MAX_ATTEMPTS=2)
+class ReclamationTests(SimulatedClusterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('vms.reclamation.ProxmoxManager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reclamation(self, vm_id):
+        return DiskReclamation.objects.create(vm_id=vm_id, node='pve1', storage='local-lvm', disk_gb=10)
+
+    def test_destroys_stopped_vm(self):
+        self.add_vm(1600, 'vps-gone-1600')
+        reclamation = self.reclamation(1600)
+
+        self.assertTrue(_start_purge(reclamation))
+
+        reclamation.refresh_from_db()
+        self.assertEqual((reclamation.status, reclamation.attempts), ('purging', 1))
+        self.assertTrue(self.cluster.watcher.wait(reclamation.upid, timeout=5))
+
+    def test_vm_already_gone_is_reclaimed(self):
+        reclamation = self.reclamation(1601)
+
+        self.assertTrue(_start_purge(reclamation))
+        self.assertEqual(DiskReclamation.objects.get(id=reclamation.id).status, 'reclaimed')
+
+    def test_locked_vm_doesnt_use_an_attempt(self):
+        self.add_vm(1600, 'vps-busy-1600')
+        vm = self.cluster._vms[1600]
+        vm['lock'], vm['lock_until'] = 'backup', time.monotonic() + 60
+        reclamation = self.reclamation(1600)
+
+        self.assertFalse(_start_purge(reclamation))
+        self.assertEqual((reclamation.status, reclamation.attempts), ('pending', 0))
+
+    def test_running_vm_fails_after_max_attempts(self):
+        self.add_vm(1600, 'vps-back-1600')
+        self.cluster._vms[1600]['running_at'] = time.monotonic() - 1
+        reclamation = self.reclamation(1600)
+
+        self.assertFalse(_start_purge(reclamation))
+        self.assertEqual((reclamation.status, reclamation.attempts), ('pending', 1))
+        self.assertFalse(_start_purge(reclamation))
+        reclamation.refresh_from_db()
+        self.assertEqual((reclamation.status, reclamation.attempts), ('failed', 2))
+        self.assertIn(1600, self.cluster._vms)
+
+    def test_outage_propagates_without_using_an_attempt(self):
+        reclamation = self.reclamation(1600)
+
+        with mock.patch.object(SimulatedManager, 'get_vm_config', side_effect=CircuitOpenError('open', 30)):
+            with self.assertRaises(CircuitOpenError):
+                _start_purge(reclamation)
+
+        reclamation.refresh_from_db()
+        self.assertEqual((reclamation.status, reclamation.attempts), ('pending', 0))
+
+
+class BackupPruneTests(SimulatedClusterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.service = self.make_service(node='pve1', vm_id=1700, status='active')
+        now = timezone.now()
+        for days in range(4):
+            Backup.objects.create(service=self.service, vm_id=1700, node='pve1', storage='local',
+                                  status='completed', finished_at=now - timedelta(days=days))
+        Backup.objects.create(service=self.service, vm_id=1700, node='pve1', storage='local', status='failed')
+
+    def test_keeps_newest_completed_records(self):
+        newest = list(Backup.objects.filter(status='completed').order_by('-finished_at').values_list('id', flat=True)[:2])
+
+        _prune_records(self.service.id, 2)
+
+        self.assertEqual(sorted(Backup.objects.filter(status='completed').values_list('id', flat=True)), sorted(newest))
+        self.assertEqual(Backup.objects.filter(status='failed').count(), 1)
+
+    def test_zero_retention_keeps_everything(self):
+        _prune_records(self.service.id, 0)
+        self.assertEqual(Backup.objects.filter(status='completed').count(), 4)
@@ -0,0 +1,225 @@
+"""
+VM and node resource metrics.
+
+collect_metrics() stores one raw sample per VM and node from the shared
+/cluster/resources snapshot, so the whole fleet costs a single API call.
+rollup_metrics() folds raw samples into 5-minute, hourly and daily buckets
+and drops each resolution once it is past its retention. Charts read
+through get_series(), which picks the finest resolution that still covers
+the requested range in a chart's worth of points.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min
+from django.utils import timezone
+from vms.models import ResourceMetric
+from vms.inventory import get_cluster_resources
+import logging
+
+logger = logging.getLogger(__name__)
+
+RAW = 60
+FIVE_MINUTES = 5 * 60
+HOUR = 60 * 60
+DAY = 24 * 60 * 60
+
+# (source resolution, target resolution), finest first
+ROLLUPS = [(RAW, FIVE_MINUTES), (FIVE_MINUTES, HOUR), (HOUR, DAY)]
+
+# Days each resolution is kept
+RETENTION_DAYS = {
+    RAW: 2,
+    FIVE_MINUTES: 14,
+    HOUR: 90,
+    DAY: 730,
+}
+
+# Most points get_series() returns before moving to a coarser resolution
+MAX_POINTS = 500
+
+# Chart ranges accepted by the metrics endpoints
+PERIODS = {
+    '1h': timedelta(hours=1),
+    '24h': timedelta(days=1),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    '1y': timedelta(days=365),
+}
+
+COUNTERS_CACHE_KEY = 'metrics:net-counters'
+
+SERIES_FIELDS = ['bucket', 'cpu', 'cpu_max', 'mem', 'mem_max', 'maxmem', 'disk', 'maxdisk', 'netin', 'netout']
+
+
+def floor_time(moment, resolution):
+    """Start of the bucket `moment` falls in (buckets are aligned to UTC)"""
+    seconds = int(moment.timestamp())
+    return datetime.fromtimestamp(seconds - seconds % resolution, tz=dt_timezone.utc)
+
+
+def counter_delta(previous, current):
+    """
+    Increase of a cumulative counter between two readings.
+    Counters restart from zero when a VM reboots, so a drop means the whole
+    current value is new traffic. Without a previous reading there is no delta.
+    """
+    if previous is None or current is None:
+        return 0
+    if current < previous:
+        return current
+    return current - previous
+
+
+def get_retention():
+    retention = {**RETENTION_DAYS, **getattr(settings, 'PROXMOX_METRICS_RETENTION', {})}
+    return {resolution: timedelta(days=days) for resolution, days in retention.items()}
+
+
+def collect_metrics(now=None):
+    """Store one raw sample for every VM and online node; returns the number stored"""
+    now = now or timezone.now()
+    bucket = floor_time(now, RAW)
+    resources = get_cluster_resources()
+    if not resources:
+        return 0
+
+    previous = cache.get(COUNTERS_CACHE_KEY) or {}
+    counters = {}
+    samples = []
+    for item in resources:
+        if item.get('type') == 'qemu' and not item.get('template'):
+            vmid = item['vmid']
+            counters[vmid] = [item.get('netin', 0), item.get('netout', 0)]
+            last = previous.get(vmid, [None, None])
+            samples.append(ResourceMetric(
+                resource_type='vm',
+                resource_id=str(vmid),
+                netin=counter_delta(last[0], counters[vmid][0]),
+                netout=counter_delta(last[1], counters[vmid][1]),
+                **_usage(item, bucket)
+            ))
+        elif item.get('type') == 'node' and item.get('status') == 'online':
+            samples.append(ResourceMetric(resource_type='node', resource_id=item['node'], **_usage(item, bucket)))
+
+    ResourceMetric.objects.bulk_create(samples, ignore_conflicts=True)
+    cache.set(COUNTERS_CACHE_KEY, counters, timeout=None)
+    return len(samples)
+
+
+def _usage(item, bucket):
+    return {
+        'resolution': RAW,
+        'bucket': bucket,
+        'cpu': item.get('cpu', 0),
+        'cpu_max': item.get('cpu', 0),
+        'mem': item.get('mem', 0),
+        'mem_max': item.get('mem', 0),
+        'maxmem': item.get('maxmem', 0),
+        'disk': item.get('disk', 0),
+        'maxdisk': item.get('maxdisk', 0),
+    }
+
+
+def _rollup(source, target, now):
+    """Fold complete `target` buckets from `source` rows; returns the number of rows written"""
+    end = floor_time(now, target)
+    last = ResourceMetric.objects.filter(resolution=target).aggregate(last=Max('bucket'))['last']
+    if last:
+        start = last + timedelta(seconds=target)
+    else:
+        first = ResourceMetric.objects.filter(resolution=source).aggregate(first=Min('bucket'))['first']
+        if first is None:
+            return 0
+        start = floor_time(first, target)
+    if start >= end:
+        return 0
+
+    groups = defaultdict(list)
+    rows = ResourceMetric.objects.filter(resolution=source, bucket__gte=start, bucket__lt=end).order_by('bucket')
+    for row in rows.iterator():
+        groups[(row.resource_type, row.resource_id, floor_time(row.bucket, target))].append(row)
+
+    rollups = []
+    for (resource_type, resource_id, bucket), points in groups.items():
+        samples = sum(point.samples for point in points)
+        latest = points[-1]
+        rollups.append(ResourceMetric(
+            resource_type=resource_type,
+            resource_id=resource_id,
+            resolution=target,
+            bucket=bucket,
+            samples=samples,
+            cpu=sum(point.cpu * point.samples for point in points) / samples,
+            cpu_max=max(point.cpu_max for point in points),
+            mem=sum(point.mem * point.samples for point in points) // samples,
+            mem_max=max(point.mem_max for point in points),
+            maxmem=latest.maxmem,
+            disk=latest.disk,
+            maxdisk=latest.maxdisk,
+            netin=sum(point.netin for point in points),
+            netout=sum(point.netout for point in points),
+        ))
+
+    ResourceMetric.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=['resource_type', 'resource_id', 'resolution', 'bucket'],
+        update_fields=[field for field in SERIES_FIELDS if field != 'bucket'] + ['samples']
+    )
+    return len(rollups)
+
+
+def rollup_metrics(now=None):
+    """
+    Roll every resolution up into the next coarser one and apply retention.
+    Returns ({resolution: rows written}, rows deleted).
+    """
+    now = now or timezone.now()
+    written = {target: _rollup(source, target, now) for source, target in ROLLUPS}
+
+    deleted = 0
+    for resolution, keep in get_retention().items():
+        deleted += ResourceMetric.objects.filter(resolution=resolution, bucket__lt=now - keep).delete()[0]
+    return written, deleted
+
+
+def pick_resolution(start, end, max_points=MAX_POINTS, now=None):
+    """Finest resolution that still covers `start` and fits the range in max_points"""
+    now = now or timezone.now()
+    retention = get_retention()
+    for resolution in sorted(retention):
+        if now - retention[resolution] > start:
+            continue
+        if (end - start).total_seconds() / resolution <= max_points:
+            return resolution
+    return max(retention)
+
+
+def get_series(resource_type, resource_id, start, end=None, resolution=None):
+    """
+    Points for one VM or node between start and end, oldest first.
+    Returns (resolution, [dict of SERIES_FIELDS]); one indexed query.
+    """
+    end = end or timezone.now()
+    resolution = resolution or pick_resolution(start, end)
+    points = ResourceMetric.objects.filter(
+        resource_type=resource_type,
+        resource_id=str(resource_id),
+        resolution=resolution,
+        bucket__gte=floor_time(start, resolution),
+        bucket__lt=end
+    ).order_by('bucket').values(*SERIES_FIELDS)
+    return resolution, list(points)
+
+
+def get_service_series(service, start, end=None):
+    """Series for a service's VM, never reaching back before the service existed"""
+    if not service.vm_id:
+        return None, []
+    return get_series('vm', service.vm_id, max(start, service.created_at), end)
+
+
+def get_node_series(node, start, end=None):
+    return get_series('node', node, start, end)
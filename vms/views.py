@@ -1,3 +1,45 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from vms.metrics import collect_snapshots, merge_snapshots, render_prometheus
+from vms.timeseries import PERIODS, get_node_series
 
-# Create your views here.
+
+def _can_scrape(request):
+    token = getattr(settings, 'PROXMOX_METRICS_TOKEN', '')
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+@require_GET
+def proxmox_metrics(request):
+    """
+    Proxmox API metrics of every web and worker process.
+    Prometheus text format by default, ?format=json for the raw merge.
+    """
+    if not _can_scrape(request):
+        return HttpResponseForbidden('Forbidden')
+
+    merged = merge_snapshots(collect_snapshots())
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            section: [list(key) + [value] if isinstance(key, tuple) else [key, value] for key, value in items.items()]
+            for section, items in merged.items()
+        })
+    return HttpResponse(render_prometheus(merged), content_type='text/plain; version=0.0.4')
+
+
+@require_GET
+def node_metrics(request, node):
+    """Usage history of one node for capacity planning, ?period=24h"""
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden('Forbidden')
+
+    period = request.GET.get('period', '24h')
+    if period not in PERIODS:
+        return JsonResponse({'error': f"Invalid period. Choose: {', '.join(PERIODS)}"}, status=400)
+
+    resolution, points = get_node_series(node, timezone.now() - PERIODS[period])
+    return JsonResponse({'node': node, 'period': period, 'resolution': resolution, 'points': points})
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.db import transaction
+from vms.models import VMIDRange
+from vms.inventory import get_fleet_snapshot
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default VMID range handed out to customer VMs, inclusive
+VMID_RANGE = (1000, 999999)
+BLOCK_SIZE = 10
+
+
+class VMIDAllocator:
+    """
+    Hands out VMIDs from a block reserved atomically in the database.
+
+    Each process takes BLOCK_SIZE IDs at a time with one short row-locked
+    update, then serves them from memory. IDs that already exist in the
+    cluster (e.g. created by hand) are skipped. Unused IDs of a block are
+    simply lost when the process exits.
+
+    A reservation commits on its own and can't be made inside another
+    transaction, whose rollback would undo it while the block stays in
+    memory. Code that allocates inside a transaction calls reserve() first.
+    """
+
+    def __init__(self, name='default'):
+        self.name = name
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._block = []
+        self._pid = os.getpid()
+
+    def reserve(self):
+        """Make sure a block is held in memory, reserving one if needed"""
+        if self._pid != os.getpid():
+            self._reset()
+
+        with self._lock:
+            if not self._block:
+                self._block = self._reserve_block()
+
+    def allocate(self, proxmox=None):
+        """Return a VMID that is unique across processes and unused in the cluster"""
+        if self._pid != os.getpid():
+            self._reset()
+
+        with self._lock:
+            existing = get_fleet_snapshot(proxmox)
+            # Bounded so a full range fails loudly instead of spinning
+            for _ in range(self._range_size()):
+                if not self._block:
+                    self._block = self._reserve_block()
+                vmid = self._block.pop(0)
+                if vmid not in existing:
+                    return vmid
+                logger.warning(f"VMID {vmid} already exists in the cluster, skipping")
+
+        raise RuntimeError(f"No free VMIDs left in range '{self.name}'")
+
+    def _range_size(self):
+        start, end = getattr(settings, 'PROXMOX_VMID_RANGE', VMID_RANGE)
+        return end - start + 1
+
+    def _get_range(self):
+        start, end = getattr(settings, 'PROXMOX_VMID_RANGE', VMID_RANGE)
+        vmid_range, _ = VMIDRange.objects.get_or_create(
+            name=self.name,
+            defaults={'start': start, 'end': end, 'next_vmid': start}
+        )
+        return vmid_range
+
+    def _reserve_block(self):
+        self._get_range()
+        block_size = getattr(settings, 'PROXMOX_VMID_BLOCK_SIZE', BLOCK_SIZE)
+
+        with transaction.atomic(durable=True):
+            vmid_range = VMIDRange.objects.select_for_update().get(name=self.name)
+            first = vmid_range.next_vmid
+            if first > vmid_range.end:
+                # Wrap around; IDs freed by terminated services get reused
+                first = vmid_range.start
+            last = min(first + block_size - 1, vmid_range.end)
+            vmid_range.next_vmid = last + 1
+            vmid_range.save(update_fields=['next_vmid', 'updated_at'])
+
+        logger.debug(f"Reserved VMIDs {first}-{last}")
+        return list(range(first, last + 1))
+
+    def reconcile(self, proxmox=None):
+        """
+        Move the counter past the highest VMID in use in the cluster.
+        Keeps the allocator ahead of VMs created outside it.
+        """
+        vmid_range = self._get_range()
+        in_range = [
+            vmid for vmid in get_fleet_snapshot(proxmox, max_age=0)
+            if vmid_range.start <= vmid <= vmid_range.end
+        ]
+        if not in_range:
+            return vmid_range.next_vmid
+
+        with transaction.atomic():
+            vmid_range = VMIDRange.objects.select_for_update().get(name=self.name)
+            highest = max(in_range)
+            if highest >= vmid_range.next_vmid and highest < vmid_range.end:
+                logger.info(f"Advancing VMID counter from {vmid_range.next_vmid} to {highest + 1}")
+                vmid_range.next_vmid = highest + 1
+                vmid_range.save(update_fields=['next_vmid', 'updated_at'])
+        return vmid_range.next_vmid
+
+
+vmid_allocator = VMIDAllocator()
+
+if hasattr(os, 'register_at_fork'):
+    # Never let a parent and child serve the same block
+    os.register_at_fork(after_in_child=vmid_allocator._reset)
@@ -0,0 +1,125 @@
+from django.db import models, transaction
+from django.utils import timezone
+from vms.models import WarmVM
+from vms.placement import PlacementScheduler
+from vms.catalog import choose_template
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def claim_warm_vm(plan, node=None):
+    """
+    Take a ready VM for the plan out of the pool.
+    Prefers the given node, otherwise any node. Returns the WarmVM or None.
+    """
+    with transaction.atomic():
+        candidates = WarmVM.objects.select_for_update(skip_locked=True).filter(
+            plan=plan,
+            status='ready'
+        ).order_by('ready_at')
+        warm_vm = None
+        if node:
+            warm_vm = candidates.filter(node=node).first()
+        if warm_vm is None:
+            warm_vm = candidates.first()
+        if warm_vm is None:
+            return None
+
+        warm_vm.status = 'claimed'
+        warm_vm.claimed_at = timezone.now()
+        warm_vm.save(update_fields=['status', 'claimed_at'])
+
+    logger.info(f"Claimed warm VM {warm_vm.vm_id} on {warm_vm.node} for plan {plan.name}")
+    return warm_vm
+
+
+def hand_over_warm_vm(warm_vm, service, proxmox):
+    """
+    Give a claimed warm VM to a service: rename it, rotate its credentials and
+    record it on the service. Returns the new root password, or None on failure
+    (the VM is then marked failed so it isn't handed out again).
+    """
+    password = proxmox.generate_password()
+    vm_name = f"vps-{service.user.username}-{warm_vm.vm_id}"
+
+    if not proxmox.rotate_credentials(warm_vm.vm_id, password, name=vm_name):
+        warm_vm.status = 'failed'
+        warm_vm.error_message = 'Credential rotation failed'
+        warm_vm.save(update_fields=['status', 'error_message'])
+        return None
+
+    if not warm_vm.ip_address:
+        warm_vm.ip_address = proxmox.get_vm_ip(warm_vm.vm_id)
+    warm_vm.service = service
+    warm_vm.save(update_fields=['service', 'ip_address'])
+    return password
+
+
+def get_pool_targets(plan):
+    """Nodes the plan's pool should be kept on: every node it can be cloned onto and currently fits"""
+    scheduler = PlacementScheduler()
+    nodes = scheduler.get_candidate_nodes(plan)
+    return [name for name, node in nodes.items() if scheduler.score_node(node, plan) is not None]
+
+
+def get_pool_deficits(plan):
+    """Return {node: missing VM count} for the plan's pool"""
+    if plan.warm_pool_size <= 0 or not plan.is_active:
+        return {}
+
+    deficits = {}
+    for node in get_pool_targets(plan):
+        stocked = WarmVM.objects.filter(
+            plan=plan,
+            node=node,
+            status__in=['provisioning', 'ready']
+        ).count()
+        if stocked < plan.warm_pool_size:
+            deficits[node] = plan.warm_pool_size - stocked
+    return deficits
+
+
+def get_pool_surplus(plan):
+    """Return {node: extra ready VM count} when the pool is over its size"""
+    size = plan.warm_pool_size if plan.is_active else 0
+    rows = WarmVM.objects.filter(plan=plan, status='ready').values('node').annotate(
+        count=models.Count('id')
+    )
+    return {row['node']: row['count'] - size for row in rows if row['count'] > size}
+
+
+def provision_warm_vm(warm_vm, proxmox):
+    """Clone, size and boot a pool VM; updates the WarmVM with the outcome"""
+    plan = warm_vm.plan
+    vmid = proxmox.get_next_vmid()
+    warm_vm.vm_id = vmid
+    warm_vm.save(update_fields=['vm_id'])
+
+    template_id, proxmox.template_node = choose_template(plan, node=warm_vm.node)
+    result = proxmox.create_vm(
+        vmid=vmid,
+        name=f"warm-{plan.id}-{vmid}",
+        cores=plan.cpu_cores,
+        memory=plan.ram_mb,
+        disk=plan.disk_gb,
+        template_id=template_id,
+        # Throwaway password; rotated when the VM is claimed
+        password=proxmox.generate_password(),
+        # Don't hold a worker for the IP; it is looked up again at hand-over
+        wait_ip=False
+    )
+
+    if result['status'] == 'success':
+        warm_vm.status = 'ready'
+        warm_vm.ip_address = result.get('ip_address')
+        warm_vm.ready_at = timezone.now()
+        warm_vm.save(update_fields=['status', 'ip_address', 'ready_at'])
+        logger.info(f"Warm VM {vmid} ready on {warm_vm.node} for plan {plan.name}")
+    else:
+        warm_vm.status = 'failed'
+        warm_vm.error_message = result.get('message', '')
+        warm_vm.save(update_fields=['status', 'error_message'])
+        logger.error(f"Warm VM {vmid} failed for plan {plan.name}: {warm_vm.error_message}")
+
+    return result
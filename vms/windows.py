@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.utils import timezone
+
+# Default off-peak window, in local hours [start, end)
+OFFPEAK_HOURS = (1, 6)
+
+
+def in_hour_window(start, end, now=None):
+    """True if the current hour is in [start, end); windows may wrap midnight"""
+    hour = timezone.localtime(now or timezone.now()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def in_offpeak_window(now=None):
+    """True during the configured off-peak hours (PROXMOX_OFFPEAK_HOURS)"""
+    start, end = getattr(settings, 'PROXMOX_OFFPEAK_HOURS', OFFPEAK_HOURS)
+    return in_hour_window(start, end, now)